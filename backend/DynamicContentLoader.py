@@ -1,20 +1,13 @@
-from backend.steps import TextStep, ImageStep
+from backend.steps import step_for
 
 class DynamicContentLoader:
+    __slots__ = ("recipe", "step_objects")
+
     def __init__(self, recipe):
         self.recipe = recipe
         # Stores the recipe object locally so that the step attributes can be accessed.
-        self.step_objects = []
-        # Initialises an empty list to hold the step objects.
-
-        for s in recipe.steps:
-            # Loops over steps stored in recipe to determine if they're text only or include images.
-            if s.img_path:
-                self.step_objects.append(ImageStep(s.step_number, s.instruction, s.img_path))
-                # Renders step with image if the step includes an img_path.
-            else:
-                self.step_objects.append(TextStep(s.step_number, s.instruction))
-                # Renders only the step number and instruction if no img_path is included.
+        self.step_objects = [step_for(s.step_number, s.instruction, s.img_path) for s in recipe.steps]
+        # Builds a TextStep or ImageStep for each step, depending on whether it has an img_path.
 
     def get_rendered_steps(self) -> list[str]:
         return [step.render() for step in self.step_objects]
@@ -22,4 +15,6 @@ class DynamicContentLoader:
         # Each step object will implement it's own render method (an example of polymorphism)
 #
 # Aggregates different types of steps into one list: self.step_objects
-# This way the steps can be looped over and rendered as a group.
\ No newline at end of file
+# This way the steps can be looped over and rendered as a group.
+# The API renders through backend/rendering.py, which builds and renders each
+# step in a single pass and stores the result per recipe version.
@@ -1,3 +1,16 @@
+import hashlib
+import os
+import struct
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SAVED_RECIPES_PATH = "backend/static/saved_recipes/saved_recipes.txt"
+
 class RecipeBook:
     def __init__(self, source=None):
         if source is None:
@@ -10,93 +23,308 @@ class RecipeBook:
     def add_recipe(self, recipe):
         self.recipes.append(recipe)
 
-    def log_full_recipes(self, user, file_path="backend/static/saved_recipes/saved_recipes.txt"):
+    def log_full_recipes(self, user, file_path=SAVED_RECIPES_PATH):
         with open(file_path, "a") as f:
             for recipe in self.recipes:
-                f.write("\n")
-                f.write(f"Recipe ID: {recipe.recipe_id}\n")
-                f.write(f"Name: {recipe.name}\n")
-                f.write(f"Description: {recipe.description}\n")
-                f.write(f"Servings: {recipe.servings}\n")
-                f.write(f"Cook Time: {recipe.cook_time_min} min\n")
-                f.write(f"Created by: {user.username}\n")
-
-                f.write("Ingredients:\n")
-                for ing in recipe.ingredients:
-                    f.write(f"  • {ing.quantity} {ing.unit} {ing.name}\n")
-
-                f.write("Steps:\n")
-                for s in recipe.steps:
-                    f.write(f"  {s.step_number}. {s.instruction}\n")
-                    if s.img_path:
-                        f.write(f"Image: {s.img_path}\n")
-
-                f.write("-" * 40 + "\n")
+                f.write(RecipeBook.format_recipe(RecipeBook.recipe_to_dict(recipe), user.username))
     # Logs all recipes in RecipeBook to a text file.
-    
-    def load_recipes_from_file(file_path="backend/static/saved_recipes/saved_recipes.txt") -> list:
-        recipes = []
+    # The API doesn't call this on the request path any more, it queues
+    # format_recipe() output on the background writer in audit_log.py.
+
+    @staticmethod
+    def format_recipe(recipe: dict, username: str) -> str:
+        lines = [
+            "",
+            f"Recipe ID: {recipe['recipe_id']}",
+            f"Name: {recipe['name']}",
+            f"Description: {recipe['description']}",
+            f"Servings: {recipe['servings']}",
+            f"Cook Time: {recipe['cook_time_min']} min",
+            f"Created by: {username}",
+            "Ingredients:",
+        ]
+        for ing in recipe["ingredients"]:
+            lines.append(f"  • {ing['quantity']} {ing['unit']} {ing['name']}")
+        lines.append("Steps:")
+        for s in recipe["steps"]:
+            lines.append(f"  {s['step_number']}. {s['instruction']}")
+            if s.get("img_path"):
+                lines.append(f"Image: {s['img_path']}")
+        lines.append("-" * 40)
+        return "\n".join(lines) + "\n"
+    # Formats one recipe (in the dict shape returned by load_recipes_from_file)
+    # as a block of the saved recipes text file.
+
+    @staticmethod
+    def recipe_to_dict(recipe) -> dict:
+        return {
+            "recipe_id": recipe.recipe_id,
+            "name": recipe.name,
+            "description": recipe.description,
+            "servings": recipe.servings,
+            "cook_time_min": recipe.cook_time_min,
+            "ingredients": [
+                {"name": i.name, "quantity": i.quantity, "unit": i.unit} for i in recipe.ingredients
+            ],
+            "steps": [
+                {"step_number": s.step_number, "instruction": s.instruction, "img_path": s.img_path}
+                for s in recipe.steps
+            ],
+        }
+    # Converts an ORM Recipe into the dict shape used by format_recipe().
+
+    @staticmethod
+    def load_recipes_from_file(file_path=SAVED_RECIPES_PATH) -> list:
         try:
-            with open(file_path, "r") as f:
-                lines = [line.strip() for line in f.readlines()]
+            return list(RecipeBook.iter_recipes_from_file(file_path))
         except FileNotFoundError:
             return []
+    # Reads every recipe in the file into a list.
+    # Prefer iter_recipes_from_file() for large files, or load_recipe() for a single recipe.
 
-        current_recipe = {}
-        current_ingredients = []
-        current_steps = []
+    @staticmethod
+    def iter_recipes_from_file(file_path=SAVED_RECIPES_PATH):
+        with open(file_path, "rb") as f:
+            for _, recipe in RecipeBook._parse_blocks(f):
+                yield recipe
+    # Yields recipes one at a time, holding only the current recipe in memory.
 
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            if line.startswith("Recipe ID:"):
-                current_recipe = {
-                    "recipe_id": int(line.split(":")[1].strip())
+    @staticmethod
+    def _parse_blocks(f, offset=0):
+        recipe = None
+        section = None
+        start = offset
+        for raw in f:
+            line_offset = offset
+            offset += len(raw)
+            line = raw.decode("utf-8").strip()
+            first = line[:1]
+
+            if section == "steps" and first.isdigit() and ". " in line:
+                step_number, instruction = line.split(". ", 1)
+                recipe["steps"].append({
+                    "step_number": int(step_number),
+                    "instruction": instruction,
+                    "img_path": None,
+                })
+            elif section == "ingredients" and first == "•":
+                quantity, unit, name = (line[1:].strip().split(" ", 2) + ["", ""])[:3]
+                recipe["ingredients"].append({
+                    "name": name.strip(),
+                    "quantity": float(quantity),
+                    "unit": unit,
+                })
+                # An empty unit leaves two spaces: "• 2.0  eggs"
+            # Step and ingredient lines are by far the most common, so they're checked first
+
+            elif line.startswith("Recipe ID:"):
+                recipe = {
+                    "recipe_id": int(line.split(":", 1)[1].strip()),
+                    "ingredients": [],
+                    "steps": [],
                 }
-                current_ingredients = []
-                current_steps = []
+                section = None
+                start = line_offset
+            elif recipe is None:
+                continue
+                # Skips anything before the first recipe block
+            elif first == "-" and line.startswith("-" * 10):
+                yield start, recipe
+                recipe = None
+                section = None
+                # End of a recipe block
+            elif section == "steps" and line.startswith(("Image:", "📷")) and recipe["steps"]:
+                recipe["steps"][-1]["img_path"] = line.split(": ", 1)[1].strip()
             elif line.startswith("Name:"):
-                current_recipe["name"] = line.split(":", 1)[1].strip()
+                recipe["name"] = line.split(":", 1)[1].strip()
             elif line.startswith("Description:"):
-                current_recipe["description"] = line.split(":", 1)[1].strip()
+                recipe["description"] = line.split(":", 1)[1].strip()
             elif line.startswith("Servings:"):
-                current_recipe["servings"] = int(line.split(":", 1)[1].strip())
+                recipe["servings"] = int(line.split(":", 1)[1].strip())
             elif line.startswith("Cook Time:"):
-                current_recipe["cook_time_min"] = int(line.split()[2])
+                recipe["cook_time_min"] = int(line.split()[2])
             elif line.startswith("Ingredients:"):
-                i += 1
-                while i < len(lines) and lines[i].startswith("•"):
-                    parts = lines[i][2:].split(" ")
-                    quantity = float(parts[0])
-                    unit = parts[1]
-                    name = " ".join(parts[2:])
-                    current_ingredients.append({
-                        "name": name,
-                        "quantity": quantity,
-                        "unit": unit
-                    })
-                    i += 1
-                i -= 1  # rewind so main loop doesn't skip a line
+                section = "ingredients"
             elif line.startswith("Steps:"):
-                i += 1
-                while i < len(lines) and lines[i] and not lines[i].startswith("-"):
-                    if ". " in lines[i]:
-                        step_number, instruction = lines[i].split(". ", 1)
-                        img_path = None
-                        if i+1 < len(lines) and lines[i+1].startswith("📷"):
-                            img_path = lines[i+1].split(": ", 1)[1].strip()
-                            i += 1
-                        current_steps.append({
-                            "step_number": int(step_number),
-                            "instruction": instruction,
-                            "img_path": img_path
-                        })
-                    i += 1
-            elif line.startswith("-" * 10):
-                # end of a recipe block
-                current_recipe["ingredients"] = current_ingredients
-                current_recipe["steps"] = current_steps
-                recipes.append(current_recipe)
-            i += 1
-
-        return recipes
\ No newline at end of file
+                section = "steps"
+    # Line by line parser shared by the readers above.
+    # Yields (byte offset of the "Recipe ID:" line, recipe dict) for each complete block.
+
+    # -- Offset index --
+    # A sidecar file (<archive>.idx) maps recipe_id -> byte offset of its block,
+    # so load_recipe() can seek straight to one recipe instead of scanning.
+    # Layout (little-endian):
+    #   header  magic, count of archive bytes indexed so far, inode of the
+    #           archive, length and hash of its first bytes, number of sorted entries
+    #   sorted  the recipe_ids in ascending order, then their offsets (one per
+    #           recipe, its latest block), looked up with a binary search
+    #   tail    (recipe_id, offset) pairs of blocks indexed since the last merge
+    # The archive is append-only (it is never rotated), so refreshing the index
+    # only parses the bytes added since it was last updated, and the tail is
+    # merged into the sorted part once it gets long. If the archive was replaced
+    # (another inode, or different first bytes) the index is rebuilt.
+    # Updates take an exclusive lock on <archive>.idx.lock, lookups a shared one,
+    # so several worker processes can use the same index (not on Windows).
+
+    INDEX_MAGIC = b"IRMSIDX2"
+    INDEX_HEADER = struct.Struct("<8sQQQ16sQ")
+    INDEX_ENTRY = struct.Struct("<qq")
+    INDEX_HEAD_BYTES = 4096
+    INDEX_MIN_TAIL = 1024
+
+    @staticmethod
+    @contextmanager
+    def _index_lock(index_path, shared=False):
+        with open(index_path + ".lock", "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _head_hash(f, length) -> bytes:
+        f.seek(0)
+        return hashlib.blake2b(f.read(length), digest_size=16).digest()
+
+    @staticmethod
+    def _read_index_header(index_path):
+        try:
+            with open(index_path, "rb") as idx:
+                header = idx.read(RecipeBook.INDEX_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < RecipeBook.INDEX_HEADER.size:
+            return None
+        header = RecipeBook.INDEX_HEADER.unpack(header)
+        return header if header[0] == RecipeBook.INDEX_MAGIC else None
+    # (magic, indexed, inode, head length, head hash, sorted count), or None
+    # when there is no index in the current format.
+
+    @staticmethod
+    def update_offset_index(file_path=SAVED_RECIPES_PATH, index_path=None) -> str:
+        index_path = index_path or file_path + ".idx"
+        with RecipeBook._index_lock(index_path), open(file_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            header = RecipeBook._read_index_header(index_path)
+            if header is not None:
+                _, indexed, inode, head_length, head_hash, sorted_count = header
+                if (inode != stat.st_ino or indexed > stat.st_size
+                        or RecipeBook._head_hash(f, head_length) != head_hash):
+                    header = None
+                    # The archive was replaced: rebuild
+            if header is None:
+                indexed, sorted_count = 0, 0
+            elif indexed == stat.st_size:
+                return index_path
+
+            mode = "r+b" if header is not None else "wb"
+            with open(index_path, mode) as idx:
+                idx.seek(0, os.SEEK_END)
+                if header is None:
+                    idx.write(bytes(RecipeBook.INDEX_HEADER.size))
+                f.seek(indexed)
+                complete = indexed
+                for recipe_id, offset, end in RecipeBook._scan_blocks(f, indexed):
+                    idx.write(RecipeBook.INDEX_ENTRY.pack(recipe_id, offset))
+                    complete = end
+                # Only bytes up to the last complete block count as indexed, so a
+                # block that is still being appended is picked up next time
+                head_length = min(complete, RecipeBook.INDEX_HEAD_BYTES)
+                idx.seek(0)
+                idx.write(RecipeBook.INDEX_HEADER.pack(
+                    RecipeBook.INDEX_MAGIC, complete, stat.st_ino,
+                    head_length, RecipeBook._head_hash(f, head_length), sorted_count,
+                ))
+                tail = (idx.seek(0, os.SEEK_END) - RecipeBook.INDEX_HEADER.size) // RecipeBook.INDEX_ENTRY.size - sorted_count
+            if tail > max(RecipeBook.INDEX_MIN_TAIL, sorted_count // 8):
+                RecipeBook._merge_index(index_path)
+        return index_path
+    # Builds the sidecar index, or extends it with blocks appended since the last call.
+
+    @staticmethod
+    def _merge_index(index_path):
+        header = RecipeBook._read_index_header(index_path)
+        sorted_count = header[5]
+        entries = np.fromfile(index_path, dtype="<i8", offset=RecipeBook.INDEX_HEADER.size)
+        tail = entries[2 * sorted_count:].reshape(-1, 2)
+        ids = np.concatenate([entries[:sorted_count], tail[:, 0]])
+        offsets = np.concatenate([entries[sorted_count:2 * sorted_count], tail[:, 1]])
+        order = np.argsort(ids, kind="stable")
+        ids, offsets = ids[order], offsets[order]
+        latest = np.append(ids[1:] != ids[:-1], True)
+        ids, offsets = ids[latest], offsets[latest]
+        # Stable, so of a recipe's blocks the one indexed last stays last
+
+        merged = index_path + ".tmp"
+        with open(merged, "wb") as idx:
+            idx.write(RecipeBook.INDEX_HEADER.pack(*header[:5], len(ids)))
+            ids.tofile(idx)
+            offsets.tofile(idx)
+        os.replace(merged, index_path)
+    # Folds the tail into the sorted part. Runs under the exclusive lock.
+
+    @staticmethod
+    def _scan_blocks(f, offset=0):
+        pending = None
+        for raw in f:
+            line_offset = offset
+            offset += len(raw)
+            line = raw.lstrip()
+            if line.startswith(b"Recipe ID:"):
+                pending = (int(line[10:]), line_offset)
+            elif pending is not None and line.startswith(b"----------"):
+                yield pending[0], pending[1], offset
+                pending = None
+    # Cheap pass for the indexer: only looks at block boundaries, nothing is decoded.
+    # Yields (recipe_id, offset of the block, offset just past the block).
+
+    @staticmethod
+    def _find_offset(index_path, recipe_id: int):
+        with RecipeBook._index_lock(index_path, shared=True):
+            header = RecipeBook._read_index_header(index_path)
+            if header is None:
+                return None
+            sorted_count = header[5]
+            size = os.path.getsize(index_path)
+            if size <= RecipeBook.INDEX_HEADER.size:
+                return None
+            entries = np.memmap(index_path, dtype="<i8", mode="r", offset=RecipeBook.INDEX_HEADER.size)
+            tail = entries[2 * sorted_count:].reshape(-1, 2)
+            matches = np.flatnonzero(tail[:, 0] == recipe_id)
+            if len(matches):
+                return int(tail[matches[-1], 1])
+            # Blocks indexed since the last merge are the newest, and few
+            ids = entries[:sorted_count]
+            i = int(np.searchsorted(ids, recipe_id))
+            if i < sorted_count and ids[i] == recipe_id:
+                return int(entries[sorted_count + i])
+        return None
+    # Byte offset of the latest block of recipe_id. The index is memory mapped
+    # and the binary search only reads the pages it compares.
+
+    @staticmethod
+    def archive_files(file_path=SAVED_RECIPES_PATH) -> list:
+        files = [file_path]
+        n = 1
+        while os.path.exists(f"{file_path}.{n}"):
+            files.append(f"{file_path}.{n}")
+            n += 1
+        return files
+    # The archive, then any numbered backups (newest first) left by versions
+    # that rotated it.
+
+    @staticmethod
+    def load_recipe(recipe_id: int, file_path=SAVED_RECIPES_PATH):
+        for path in RecipeBook.archive_files(file_path):
+            try:
+                offset = RecipeBook._find_offset(RecipeBook.update_offset_index(path), recipe_id)
+            except FileNotFoundError:
+                continue
+            if offset is None:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for _, recipe in RecipeBook._parse_blocks(f, offset):
+                    return recipe
+        return None
+    # Loads a single recipe from the saved recipes file by seeking to its block.
+    # If a recipe was logged more than once the latest block wins.
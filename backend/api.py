@@ -1,18 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from typing import List
-from backend.database import get_db, User, Recipe, Step, Ingredient
-from backend.security import hash_password, verify_password, create_access_token, decode_access_token
-from backend.response_model import UserOut, UserIn, Token, TokenData, RecipeIn, RecipeOut
-from backend.DynamicContentLoader import DynamicContentLoader
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Optional
+from backend.database import get_db, init_db, async_engine, async_pool_metrics, User, Recipe, Step, Ingredient, RecipeComment, RecipeReport, RecipeStats
+from backend.security import create_user_token, decode_access_token
+from backend.auth_cache import Principal, token_cache
+from backend.password_pool import password_hasher
+from backend.worker_pool import PoolBusy
+from backend.response_model import UserOut, UserIn, Token, TokenData, RecipeIn, RecipePatch, RecipeOut, RecipePage, RecipeSummaryOut, RecipeSearchResultOut, SimilarRecipeOut, PantryIn, PantryMatchOut, MealPlanIn, ShoppingListOut, BulkImportOut, ImageOut, RatedRecipeOut, RatingIn, RatingSummaryOut, CommentIn, CommentOut, ReportIn, ReportOut
+from backend.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, encode_cursor, decode_cursor
+from backend.queries import recipe_details, recipe_summaries
+from backend import search, pantry, cache, conditional, audit_log, bulk, settings, recipe_updates, rendering, images, serialization, metrics, feedback, meal_plan, similarity, change_feed
+from backend.profiling import ProfilingMiddleware
+from backend.compression import add_compression
+from backend.replicas import add_replica_routing, get_read_db, replica_set
 from backend.RecipeBook import RecipeBook
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from fastapi.staticfiles import StaticFiles
-from datetime import datetime, timezone
-
-app = FastAPI()
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_db)
+    change_feed.change_bus.start()
+    yield
+    change_feed.change_bus.close()
+    similarity.similarity_index.flush()
+    audit_log.close_all()
+    password_hasher.close()
+    images.image_pool.close()
+    await async_engine.dispose()
+    await replica_set.dispose()
+# On startup, optionally applies pending migrations (normally done once with python -m backend.init_db),
+# and starts listening for changes published by other workers.
+# On shutdown, saves pending changes to the similarity index, waits for queued
+# log records to be written and closes pooled connections.
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
   CORSMiddleware,
@@ -23,60 +54,108 @@ app.add_middleware(
 )
 # Allows connections originating from any ports on localhost.
 
+add_compression(app)
+# gzip (or Brotli) for responses over IRMS_COMPRESSION_MIN_BYTES, see compression.py
+
+add_replica_routing(app)
+# With read replicas, marks clients that wrote so their reads stay on the primary (see replicas.py)
+
+if settings.PROFILING:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+# Outermost, so the recorded latency covers everything else (see metrics.py)
+
 app.mount("/static", StaticFiles(directory="backend/static"), name="static")
+app.mount("/media", images.ImmutableStaticFiles(directory=settings.IMAGE_DIR, check_dir=False), name="media")
+# Uploaded images (see images.py), served with long-lived immutable cache headers.
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.password_hash):
+@app.exception_handler(PoolBusy)
+async def worker_pool_busy(request: Request, exc: PoolBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+# Raised when a worker pool (password hashing, image variants) is saturated, see worker_pool.py.
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = (await db.scalars(select(User).where(User.username == username))).first()
+    if not user:
+        return None
+    valid, new_hash = await password_hasher.verify_and_update(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+    # The stored hash used an outdated cost, replaced now that the password is known
     return user
 # Queries the database for a user matching the provided username.
 # If the credentials are valid, it will return the user object.
+# bcrypt runs in the password worker pool rather than on the event loop.
 
 async def get_current_user(token: str = Depends(oauth2_scheme),
-                           db: Session = Depends(get_db)) -> User:
+                           db: AsyncSession = Depends(get_db)) -> Principal:
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+    # Token already verified by an earlier request and not yet expired
+
     credentials_exc = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     payload = decode_access_token(token)
-    username: str = payload.get("sub") if payload else None
-    if username is None:
+    subject: str = payload.get("sub") if payload else None
+    if subject is None:
         raise credentials_exc
 
-    user = db.query(User).filter(User.username == username).first()
+    if "name" in payload:
+        user = await db.get(User, int(subject)) if subject.isdigit() else None
+    else:
+        user = (await db.scalars(select(User).where(User.username == subject))).first()
+        # Token issued before "sub" held the user id
     if user is None:
         raise credentials_exc
-    return user
+
+    principal = Principal.from_user(user)
+    token_cache.set(token, principal, payload["exp"])
+    return principal
 # Parameters: Extracts token from authorisation header, gets DB session from FastAPI dependency.
+# * Returns the cached principal straight away for a token that was seen before.
 # * Defines standard HTTP 401 Unauthorised error for any credential failures.
-# * Decodes the access token and retrieves the 'sub' claim (username).
-# * Queries the database to retrieve the user associated with the token
+# * Decodes the access token and retrieves the 'sub' claim (user id).
+# * Loads the user by primary key (older tokens: by username).
 # * Triggers HTTP exception error if token is missing or valid but user no longer exists.
-# * Returns user object if the user has been successfully validated.
+# * Caches and returns the principal (user_id, username) until the token expires.
 
 @app.post("/users/create_user", response_model=UserOut)
-def create_user(user: UserIn, db: Session = Depends(get_db)):
-    pwd_hash = hash_password(user.password)
+async def create_user(user: UserIn, db: AsyncSession = Depends(get_db)):
+    pwd_hash = await password_hasher.hash(user.password)
     new_user = User(username=user.username, password_hash=pwd_hash)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already taken")
+    # Enforced by the unique index on username, which also covers concurrent sign-ups
+    await db.refresh(new_user)
     return (new_user)
 # Creates a new user
 
 @app.get("/users/", response_model=List[UserOut])
-def get_users(db: Session = Depends(get_db)):
-    return (db.query(User).all())
+async def get_users(db: AsyncSession = Depends(get_read_db)):
+    return (await db.scalars(select(User))).all()
 # Returns all users in database
 
 @app.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
-                           db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,17 +163,17 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 # Login (issue JWT)
 
 @app.get("/users/me", response_model=UserOut)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
     return current_user
 # “Who am I?” endpoint
 
 @app.post("/logout")
-def logout():
+async def logout():
     """
     With stateless JWTs, logout is handled client-side.
     Remove the stored token to “log out.”
@@ -108,10 +187,10 @@ def logout():
     summary="Create a new recipe"
 )
 
-def create_recipe(
+async def create_recipe(
     payload: RecipeIn,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     recipe = Recipe(
         user_id=current_user.user_id,
@@ -120,6 +199,7 @@ def create_recipe(
         servings=payload.servings,
         img_path=payload.img_path or "",
         cook_time_min=payload.cook_time_min,
+        search_document=_search_document(payload),
     )
     # Creates a Recipe tied to the logged-in user
 
@@ -143,58 +223,373 @@ def create_recipe(
         )
     # Appends Ingredients
 
-    db.add(recipe)
-    db.commit()
-    db.refresh(recipe)
-
-    with open("backend/static/recipe_logs/recipe_log.txt", "a") as log_file:
-        log_file.write(
-            f"{datetime.now(timezone.utc).isoformat()}  "
-            f"user={current_user.username}  "
-            f"recipe_id={recipe.recipe_id}  "
-            f"name={recipe.name}\n"
-        )
-    # Write File: Appends a log entry to a txt file
+    rendering.store(recipe, 1)
+    # Renders the steps once, for the recipe's first version
 
-    book = RecipeBook([recipe])
-    book.log_full_recipes(current_user)
-    # Write File: Logs full recipe details
+    db.add(recipe)
+    await db.commit()
+    _recipe_saved(recipe.recipe_id, recipe.search_document, [i.name for i in payload.ingredients], payload.cook_time_min)
+    change_feed.recipe_saved("created", recipe, current_user.username)
+
+    audit_log.log_event(
+        "recipe_created",
+        user=current_user.username,
+        recipe_id=recipe.recipe_id,
+        name=payload.name,
+    )
+    # Queues a JSON Lines audit record, written by a background thread
+
+    audit_log.recipe_archive.write(RecipeBook.format_recipe(
+        {
+            "recipe_id": recipe.recipe_id,
+            **payload.model_dump(include={"name", "description", "servings", "cook_time_min", "ingredients"}),
+            "steps": [
+                {"step_number": idx, "instruction": s.instruction, "img_path": s.img_path}
+                for idx, s in enumerate(payload.steps, start=1)
+            ],
+        },
+        current_user.username,
+    ))
+    # Queues the full recipe details for the saved recipes file. Built from the
+    # request body, so no relationships are loaded to write it.
 
     return {"recipe_id": recipe.recipe_id}
 
+@app.post("/recipes/bulk", response_model=BulkImportOut, status_code=status.HTTP_201_CREATED)
+async def bulk_import_recipes(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    user_id, username = current_user.user_id, current_user.username
+    inserted, failed, errors = 0, 0, []
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        ids = await db.run_sync(bulk.insert_batch, user_id, [p for _, p in batch])
+        for recipe_id, (_, payload) in zip(ids, batch):
+            _recipe_saved(recipe_id, _search_document(payload), [i.name for i in payload.ingredients], payload.cook_time_min)
+        inserted += len(ids)
+        batch.clear()
+    # run_sync hands insert_batch a regular Session, its statements still go through the async driver
+
+    line_number = 0
+    async for line in bulk.iter_ndjson_lines(request.stream()):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            payload = bulk.parse_line(line)
+        except ValidationError as exc:
+            failed += 1
+            if len(errors) < 100:
+                errors.append({"line": line_number, "error": exc.errors(include_url=False, include_input=False)})
+            continue
+        batch.append((line_number, payload))
+        if len(batch) >= settings.BULK_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    if inserted:
+        change_feed.recipes_imported(user_id, inserted)
+    audit_log.log_event("recipes_bulk_imported", user=username, inserted=inserted, failed=failed)
+    return {"inserted": inserted, "failed": failed, "errors": errors}
+# Imports recipes from an NDJSON body (Content-Type: application/x-ndjson),
+# one RecipeIn object per line, owned by the current user.
+# Rows are inserted in batches of BULK_BATCH_SIZE, one transaction per batch.
+# Bulk imports are recorded in the audit log but not in the saved recipes file.
+
+@app.get("/recipes/export")
+async def export_recipes():
+    return StreamingResponse(
+        bulk.export_lines(settings.BULK_BATCH_SIZE),
+        media_type="application/x-ndjson",
+    )
+# Streams every recipe as NDJSON; each line can be posted back to /recipes/bulk.
+
+@app.post("/images", response_model=ImageOut, status_code=status.HTTP_201_CREATED)
+async def upload_image(
+    file: UploadFile,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+):
+    data = await file.read(settings.IMAGE_MAX_BYTES + 1)
+    if len(data) > settings.IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Images are limited to {settings.IMAGE_MAX_BYTES} bytes")
+    try:
+        image = await images.store(data)
+    except images.InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    url = str(request.url_for("media", path=image.path(image.original)))
+    return {
+        "hash": image.digest,
+        "url": url,
+        "variants": {w: str(request.url_for("media", path=image.path(name))) for w, name in image.variants.items()},
+        "thumbnail_url": images.thumbnail_url(url),
+    }
+# Multipart upload (field "file"), for recipe and step images. The returned url
+# goes in img_path; the same image uploaded again gives the same URLs.
+
+@app.get("/recipes/search", response_model=List[RecipeSearchResultOut])
+async def search_recipes(
+    q: str = "",
+    ingredients: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+):
+    ingredient_names = [n for n in (ingredients or "").split(",") if n.strip()]
+    if not search.tokenize(q) and not ingredient_names:
+        raise HTTPException(status_code=400, detail="Provide a search query (q) and/or ingredients")
+
+    hits = await search.search_recipes(db, q, ingredient_names, limit)
+    recipes = {
+        r.recipe_id: r
+        for r in await db.scalars(recipe_summaries().where(Recipe.recipe_id.in_([rid for rid, _ in hits])))
+    }
+    # Loads the summaries of every hit in one query
+
+    return [
+        {**RecipeSummaryOut.model_validate(recipes[rid]).model_dump(), "score": score}
+        for rid, score in hits
+        if rid in recipes
+    ]
+# Full-text search over recipe names, descriptions, steps and ingredients.
+# q: every word must match, as a prefix ("tom" matches "tomato").
+# ingredients: comma separated list, only recipes that use all of them are returned.
+# Declared before /recipes/{recipe_id} so "search" isn't taken for an ID.
+
+@app.post("/recipes/what_can_i_cook", response_model=List[PantryMatchOut])
+async def what_can_i_cook(payload: PantryIn, db: AsyncSession = Depends(get_read_db)):
+    matches = await pantry.what_can_i_cook(db, payload.ingredients, payload.limit, payload.min_coverage)
+    names = dict((await db.execute(
+        select(Recipe.recipe_id, Recipe.name)
+        .where(Recipe.recipe_id.in_([m["recipe_id"] for m in matches]))
+    )).all())
+    # Only the names of the returned recipes are read, in one query
+    return [{**m, "name": names[m["recipe_id"]]} for m in matches if m["recipe_id"] in names]
+# Ranks recipes by how many of their ingredients are already in the pantry.
+# Body: { "ingredients": ["eggs", "Flour", ...], "limit": 20, "min_coverage": 0.0 }
+
+@app.post("/recipes/shopping_list", response_model=ShoppingListOut)
+async def shopping_list(payload: MealPlanIn, db: AsyncSession = Depends(get_read_db)):
+    recipe_ids = list(dict.fromkeys(meal.recipe_id for meal in payload.meals))
+    rows = (await db.execute(
+        select(Recipe.recipe_id, Recipe.servings, Ingredient.name, Ingredient.quantity, Ingredient.unit)
+        .outerjoin(Ingredient, Ingredient.recipe_id == Recipe.recipe_id)
+        .where(Recipe.recipe_id.in_(recipe_ids))
+    )).all()
+    # Every ingredient of every planned recipe in one query; the outer join
+    # keeps recipes without ingredients, so they aren't reported missing
+
+    servings = {row.recipe_id: row.servings for row in rows}
+    scales = meal_plan.recipe_scales(((m.recipe_id, m.servings) for m in payload.meals), servings)
+    items = meal_plan.shopping_list(
+        [(row.recipe_id, row.name, row.quantity, row.unit) for row in rows if row.name is not None],
+        scales,
+    )
+    return {"items": items, "missing_recipe_ids": [rid for rid in recipe_ids if rid not in servings]}
+# Merged shopping list for a meal plan, each recipe scaled to its planned servings.
+# Body: { "meals": [ { "recipe_id": 1, "servings": 4 }, { "recipe_id": 7 } ] }
+# Units are converted and quantities summed by meal_plan.py.
+
+@app.get("/recipes/render_steps")
+async def render_steps_batch(
+    ids: List[int] = Query(..., min_length=1, max_length=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rendered = await rendering.load_rendered(db, list(dict.fromkeys(ids)))
+    return Response(content=rendering.batch_body(rendered), media_type="application/json")
+# Rendered steps of several recipes at once: /recipes/render_steps?ids=1&ids=2
+# Answers {"recipes": {"1": [...], "2": [...]}} from one query, ids that
+# don't exist are left out. Declared before /recipes/{recipe_id}.
+
+@app.get("/recipes/top_rated", response_model=List[RatedRecipeOut])
+async def top_rated_recipes(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    min_ratings: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = (await db.execute(
+        recipe_summaries()
+        .add_columns(RecipeStats.rating_avg, RecipeStats.rating_count, RecipeStats.comment_count)
+        .join(RecipeStats, RecipeStats.recipe_id == Recipe.recipe_id)
+        .where(RecipeStats.rating_count >= min_ratings)
+        .order_by(RecipeStats.rating_avg.desc(), RecipeStats.rating_count.desc(), RecipeStats.recipe_id.desc())
+        .limit(limit)
+    )).all()
+    return [
+        {**RecipeSummaryOut.model_validate(recipe).model_dump(),
+         "rating_avg": rating_avg, "rating_count": rating_count, "comment_count": comment_count}
+        for recipe, rating_avg, rating_count, comment_count in rows
+    ]
+# Best rated recipes first, ties broken by number of ratings. Read in index
+# order from ix_recipe_stats_rating, one query. min_ratings leaves out recipes
+# with too few ratings for their average to mean much.
+# Declared before /recipes/{recipe_id}.
+
+@app.get("/recipes/changes")
+async def recipe_changes(
+    since: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[int] = Header(None, ge=0),
+):
+    return StreamingResponse(
+        change_feed.stream(last_event_id if last_event_id is not None else since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+# Server-sent events of recipe changes (see change_feed.py), for lists that stay
+# current without being downloaded again. since (or the Last-Event-ID header
+# an EventSource sends when it reconnects) is the sequence number to resume
+# after. Holds no database connection while open.
+
 @app.get("/recipes/{recipe_id}", response_model=RecipeOut)
-def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = db.query(Recipe).filter(Recipe.recipe_id == recipe_id).first()
-    if not recipe:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    return recipe
+async def get_recipe(recipe_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    current = await _recipe_version(db, recipe_id)
+    etag = conditional.recipe_etag(recipe_id, current.version)
+    if conditional.is_not_modified(request, etag, current.updated_at):
+        return conditional.not_modified_response(etag, current.updated_at)
+    # The client already has this version: 304 after a single indexed lookup
+
+    key = cache.recipe_key(recipe_id, current.version)
+    body = cache.recipe_cache.get(key)
+    if body is None:
+        recipe = (await db.scalars(recipe_details().where(Recipe.recipe_id == recipe_id))).first()
+        if not recipe:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        body = serialization.model_json(RecipeOut, recipe)
+        cache.recipe_cache.set(key, body)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=conditional.cache_headers(etag, current.updated_at),
+    )
 # Returns a recipe that matches a specific recipe_id
+# The serialised JSON is cached, so repeat views skip the full load and Pydantic.
 
 @app.get("/my_recipes", response_model=List[RecipeOut])
-def get_my_recipes(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_my_recipes(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    return db.query(Recipe).filter(Recipe.user_id == current_user.user_id).all()
+    versions = (await db.execute(
+        select(Recipe.recipe_id, Recipe.version, Recipe.updated_at)
+        .where(Recipe.user_id == current_user.user_id)
+        .order_by(Recipe.recipe_id)
+    )).all()
+    etag = conditional.list_etag(f"user:{current_user.user_id}", [(r.recipe_id, r.version) for r in versions])
+    last_modified = conditional.latest(r.updated_at for r in versions)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified_response(etag, last_modified)
+    # Unchanged since the client's last fetch: answered from the versions alone
+
+    recipes = (await db.scalars(
+        recipe_details().where(Recipe.user_id == current_user.user_id).order_by(Recipe.recipe_id)
+    )).all()
+    return serialization.model_response(List[RecipeOut], recipes, conditional.cache_headers(etag, last_modified))
 # Returns all recipes by the user currently signed in
-
-@app.get("/recipes", response_model=List[RecipeOut])
-def get_all_recipes(db: Session = Depends(get_db)):
-    return db.query(Recipe).all()
-# Returns all recipes from all users
+# Serialised to JSON by pydantic-core in one step, see serialization.py.
+
+@app.get("/recipes", response_model=RecipePage)
+async def get_all_recipes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    author: Optional[str] = None,
+    max_cook_time: Optional[int] = Query(None, ge=0),
+    min_servings: Optional[int] = Query(None, ge=0),
+    max_servings: Optional[int] = Query(None, ge=0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    query = recipe_summaries()
+    # The author is needed for every card, so it is loaded in the same query
+
+    if author is not None:
+        query = query.join(Recipe.user).where(User.username == author)
+    if max_cook_time is not None:
+        query = query.where(Recipe.cook_time_min <= max_cook_time)
+    if min_servings is not None:
+        query = query.where(Recipe.servings >= min_servings)
+    if max_servings is not None:
+        query = query.where(Recipe.servings <= max_servings)
+    # Optional server-side filters
+
+    if cursor:
+        try:
+            created_at, recipe_id = decode_cursor(cursor)
+        except InvalidCursor as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        query = query.where(tuple_(Recipe.created_at, Recipe.recipe_id) < tuple_(
+            created_at, recipe_id, types=[Recipe.created_at.type, Recipe.recipe_id.type]))
+    # Continue from where the previous page stopped. The cursor is bound with the
+    # columns' types, so it's compared in the format created_at is stored in
+
+    rows = (await db.scalars(
+        query.order_by(Recipe.created_at.desc(), Recipe.recipe_id.desc())
+        .limit(limit + 1)
+    )).all()
+    # One extra row is fetched to find out whether another page exists
+
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.recipe_id)
+
+    etag = conditional.list_etag(f"page:{request.url.query}", [(r.recipe_id, r.version) for r in items])
+    last_modified = conditional.latest(r.updated_at for r in items)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified_response(etag, last_modified)
+    # Same page as the client already has: skip serialisation
+
+    return serialization.model_response(
+        RecipePage,
+        {"items": items, "next_cursor": next_cursor},
+        conditional.cache_headers(etag, last_modified),
+    )
+# Returns one page of recipes from all users, newest first.
+# Pages are keyset paginated on (created_at, recipe_id), so the cost of a page
+# does not grow with the size of the table or how far the client has scrolled.
 
 @app.put(
     "/recipes/{recipe_id}",
     response_model=RecipeOut,
     summary="Update an existing recipe",
 )
-def update_recipe(
+async def update_recipe(
     recipe_id: int,
     payload: RecipeIn,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    recipe = db.query(Recipe).filter(Recipe.recipe_id == recipe_id).first()
+    changes = payload.model_dump(include={"name", "description", "servings", "cook_time_min", "img_path"})
+    return await _update_recipe(db, current_user, recipe_id, changes, payload.steps, payload.ingredients)
+# Replaces the whole recipe. Only rows that actually differ are written.
+
+@app.patch(
+    "/recipes/{recipe_id}",
+    response_model=RecipeOut,
+    summary="Change some fields of an existing recipe",
+)
+async def patch_recipe(
+    recipe_id: int,
+    payload: RecipePatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    changes = payload.model_dump(exclude_unset=True, exclude={"steps", "ingredients"})
+    changes = {k: v for k, v in changes.items() if v is not None or k == "description"}
+    # null is only meaningful for the description, the other columns are required
+    return await _update_recipe(db, current_user, recipe_id, changes, payload.steps, payload.ingredients)
+# Only the fields present in the body are changed; steps / ingredients, when
+# sent, are the complete new lists.
+
+async def _update_recipe(db: AsyncSession, current_user: Principal, recipe_id: int,
+                         changes: dict, steps_in, ingredients_in):
+    recipe = (await db.scalars(recipe_details().where(Recipe.recipe_id == recipe_id))).first()
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
     if recipe.user_id != current_user.user_id:
@@ -202,53 +597,220 @@ def update_recipe(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not allowed to edit this recipe",
         )
-    # fetch and authorisation
-
-    recipe.name          = payload.name
-    recipe.description   = payload.description
-    recipe.servings      = payload.servings
-    recipe.cook_time_min = payload.cook_time_min
-    recipe.img_path      = payload.img_path or recipe.img_path
-    # Update the basic fields
-
-    db.query(Step).filter(Step.recipe_id == recipe_id).delete()
-    for idx, step_in in enumerate(payload.steps, start=1):
-        recipe.steps.append(
-            Step(
-                step_number=idx,
-                instruction=step_in.instruction,
-                img_path=step_in.img_path or "",
-            )
-        )
-    # Replace steps
-
-    db.query(Ingredient).filter(Ingredient.recipe_id == recipe_id).delete()
-    for ing_in in payload.ingredients:
-        recipe.ingredients.append(
-            Ingredient(
-                name=ing_in.name,
-                quantity=ing_in.quantity,
-                unit=ing_in.unit or "",
-            )
-        )
-    # Replace ingredients
-
-    db.commit()
-    db.refresh(recipe)
-    return recipe
-    # Commit and return updated recipe
+    # fetch (with steps and ingredients, which are compared below) and authorisation
+
+    renumbered = recipe_updates.apply_changes(recipe, changes, steps_in, ingredients_in)
+    # Only differing fields and rows are changed, see recipe_updates.py
+
+    if db.new or db.deleted or any(db.is_modified(obj) for obj in db.dirty):
+        if renumbered:
+            await db.flush()
+            recipe_updates.finish_renumbering(renumbered)
+        # Moved steps went through a temporary number, their final one is written on commit
+        previous_version = recipe.version
+        recipe.version = Recipe.version + 1
+        # Bump the version (an atomic "version + 1" in SQL), which changes the recipe's ETag
+        rendering.store(recipe, Recipe.version + 1)
+        # Steps rendered for the new version, both set by the same UPDATE
+        await db.commit()
+        await db.refresh(recipe, ["version", "updated_at"])
+        # Both are computed by the database
+        cache.invalidate_recipe(recipe_id, previous_version)
+        _recipe_saved(recipe_id, recipe.search_document, [i.name for i in recipe.ingredients], recipe.cook_time_min)
+        change_feed.recipe_saved("updated", recipe, current_user.username)
+        audit_log.log_event("recipe_updated", user=current_user.username, recipe_id=recipe_id, name=recipe.name)
+    # Saving an unchanged recipe writes nothing and keeps its version
+
+    result = RecipeOut.model_validate(recipe)
+    result.steps.sort(key=lambda s: s.step_number)
+    return result
+    # Built from the objects already in the session: new rows got their ids
+    # on flush, so nothing needs to be reloaded.
 
 @app.delete("/recipes/{recipe_id}", status_code=204)
-def delete_recipe(
+async def delete_recipe(
     recipe_id: int, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    recipe = db.query(Recipe).get(recipe_id)
+    recipe = await db.get(Recipe, recipe_id)
     if not recipe or recipe.user_id != current_user.user_id:
         raise HTTPException(404, "Not found or not yours")
-    db.delete(recipe)
-    db.commit()
+    version = recipe.version
+    await feedback.recipe_deleted(db, recipe_id)
+    await db.delete(recipe)
+    await db.commit()
+    cache.invalidate_recipe(recipe_id, version)
+    _recipe_deleted(recipe_id)
+    change_feed.recipe_deleted(recipe_id, current_user.user_id)
+    audit_log.log_event("recipe_deleted", user=current_user.username, recipe_id=recipe_id)
+
+async def _recipe_owner(db: AsyncSession, recipe_id: int) -> int:
+    owner = await db.scalar(select(Recipe.user_id).where(Recipe.recipe_id == recipe_id))
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return owner
+# 404s for recipes that don't exist; returns the author's user_id.
+
+async def _rating_summary(db: AsyncSession, recipe_id: int) -> dict:
+    stats = await feedback.stats(db, recipe_id)
+    return {
+        "recipe_id": recipe_id,
+        "rating_avg": stats.rating_avg if stats else 0.0,
+        "rating_count": stats.rating_count if stats else 0,
+        "comment_count": stats.comment_count if stats else 0,
+    }
+
+@app.get("/recipes/{recipe_id}/rating", response_model=RatingSummaryOut)
+async def get_rating(recipe_id: int, db: AsyncSession = Depends(get_read_db)):
+    await _recipe_owner(db, recipe_id)
+    return await _rating_summary(db, recipe_id)
+
+@app.put("/recipes/{recipe_id}/rating", response_model=RatingSummaryOut)
+async def rate_recipe(
+    recipe_id: int,
+    payload: RatingIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await _recipe_owner(db, recipe_id)
+    await feedback.rate(db, recipe_id, current_user.user_id, payload.value)
+    summary = await _rating_summary(db, recipe_id)
+    await db.commit()
+    audit_log.log_event("recipe_rated", user=current_user.username, recipe_id=recipe_id, value=payload.value)
+    return summary
+# Rates the recipe 1 to 5; rating it again replaces the user's earlier rating.
+# Answers with the updated average.
+
+@app.delete("/recipes/{recipe_id}/rating", response_model=RatingSummaryOut)
+async def unrate_recipe(
+    recipe_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if not await feedback.unrate(db, recipe_id, current_user.user_id):
+        raise HTTPException(status_code=404, detail="You haven't rated this recipe")
+    summary = await _rating_summary(db, recipe_id)
+    await db.commit()
+    return summary
+
+@app.get("/recipes/{recipe_id}/comments", response_model=List[CommentOut])
+async def get_comments(
+    recipe_id: int,
+    before: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+):
+    query = (
+        select(RecipeComment)
+        .options(joinedload(RecipeComment.user))
+        .where(RecipeComment.recipe_id == recipe_id)
+    )
+    if before is not None:
+        query = query.where(RecipeComment.comment_id < before)
+    return (await db.scalars(query.order_by(RecipeComment.comment_id.desc()).limit(limit))).all()
+# Newest first. For the next page pass the last comment_id as ?before=.
+
+@app.post("/recipes/{recipe_id}/comments", response_model=CommentOut, status_code=status.HTTP_201_CREATED)
+async def add_comment(
+    recipe_id: int,
+    payload: CommentIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await _recipe_owner(db, recipe_id)
+    comment = await feedback.add_comment(db, recipe_id, current_user.user_id, payload.body)
+    await db.commit()
+    audit_log.log_event("recipe_commented", user=current_user.username, recipe_id=recipe_id, comment_id=comment.comment_id)
+    return {
+        "comment_id": comment.comment_id,
+        "recipe_id": recipe_id,
+        "user": {"user_id": current_user.user_id, "username": current_user.username},
+        "body": comment.body,
+        "created_at": comment.created_at,
+    }
+
+@app.delete("/comments/{comment_id}", status_code=204)
+async def delete_comment(
+    comment_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    row = (await db.execute(
+        select(RecipeComment, Recipe.user_id)
+        .join(Recipe, Recipe.recipe_id == RecipeComment.recipe_id)
+        .where(RecipeComment.comment_id == comment_id)
+    )).first()
+    if row is None or current_user.user_id not in (row[0].user_id, row[1]):
+        raise HTTPException(404, "Not found or not yours")
+    await feedback.delete_comment(db, row[0])
+    await db.commit()
+# Comments can be deleted by whoever wrote them and by the recipe's author.
+
+@app.post("/recipes/{recipe_id}/reports", response_model=ReportOut, status_code=status.HTTP_201_CREATED)
+async def report_recipe(
+    recipe_id: int,
+    payload: ReportIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    await _recipe_owner(db, recipe_id)
+    try:
+        abuse_report = await feedback.report(db, recipe_id, current_user.user_id, payload.reason)
+    except feedback.AlreadyReported as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await db.commit()
+    audit_log.log_event("recipe_reported", user=current_user.username, recipe_id=recipe_id, reason=payload.reason)
+    return {
+        "report_id": abuse_report.report_id,
+        "recipe_id": recipe_id,
+        "reason": abuse_report.reason,
+        "created_at": abuse_report.created_at,
+    }
+
+@app.get("/recipes/{recipe_id}/reports", response_model=List[ReportOut])
+async def get_reports(
+    recipe_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if await _recipe_owner(db, recipe_id) != current_user.user_id:
+        raise HTTPException(404, "Not found or not yours")
+    return (await db.scalars(
+        select(RecipeReport).where(RecipeReport.recipe_id == recipe_id).order_by(RecipeReport.report_id.desc())
+    )).all()
+# Reports of a recipe, shown to its author only.
+
+def _search_document(payload: RecipeIn) -> str:
+    return search.build_search_document(
+        payload.name,
+        payload.description,
+        [s.instruction for s in payload.steps],
+        [i.name for i in payload.ingredients],
+    )
+# Builds the search text straight from the request body,
+# so the relationships don't have to be loaded to index a recipe.
+
+def _recipe_saved(recipe_id: int, document: str, ingredient_names: list[str], cook_time_min: Optional[int]):
+    search.recipe_saved(recipe_id, document, ingredient_names)
+    pantry.recipe_saved(recipe_id, ingredient_names)
+    similarity.recipe_saved(recipe_id, document, ingredient_names, cook_time_min)
+
+def _recipe_deleted(recipe_id: int):
+    search.recipe_deleted(recipe_id)
+    pantry.recipe_deleted(recipe_id)
+    similarity.recipe_deleted(recipe_id)
+# Keeps the in-process indexes up to date after a committed write.
+
+async def _recipe_version(db: AsyncSession, recipe_id: int):
+    current = (await db.execute(
+        select(Recipe.version, Recipe.updated_at)
+        .where(Recipe.recipe_id == recipe_id)
+    )).first()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return current
+# Primary key lookup of just the columns needed for ETag / Last-Modified.
 
 @app.get("/help", response_class=PlainTextResponse)
 def get_help_text():
@@ -257,10 +819,128 @@ def get_help_text():
     return content
 
 @app.get("/recipes/{recipe_id}/render_steps")
-def render_steps(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = db.query(Recipe).get(recipe_id)
-    if not recipe:
-        raise HTTPException(404, "Recipe not found")
+async def render_steps(recipe_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    current = await _recipe_version(db, recipe_id)
+    etag = conditional.recipe_etag(recipe_id, current.version, "-steps")
+    if conditional.is_not_modified(request, etag, current.updated_at):
+        return conditional.not_modified_response(etag, current.updated_at)
+
+    key = cache.steps_key(recipe_id, current.version)
+    body = cache.recipe_cache.get(key)
+    if body is None:
+        rendered = await rendering.load_rendered(db, [recipe_id])
+        if recipe_id not in rendered:
+            raise HTTPException(404, "Recipe not found")
+        body = rendering.steps_body(rendered[recipe_id])
+        cache.recipe_cache.set(key, body)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=conditional.cache_headers(etag, current.updated_at),
+    )
+# The steps are rendered when the recipe is saved (see rendering.py), this only
+# reads them. Also cached alongside the recipe and invalidated with it.
 
-    display = DynamicContentLoader(recipe)
-    return { "steps": display.get_rendered_steps() }
+@app.get("/recipes/{recipe_id}/similar", response_model=List[SimilarRecipeOut])
+async def similar_recipes(
+    recipe_id: int,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+):
+    hits = await similarity.similar_recipes(db, recipe_id, limit)
+    if hits is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    recipes = {
+        r.recipe_id: r
+        for r in await db.scalars(recipe_summaries().where(Recipe.recipe_id.in_([rid for rid, _ in hits])))
+    }
+    return [
+        {**RecipeSummaryOut.model_validate(recipes[rid]).model_dump(), "similarity": score}
+        for rid, score in hits
+        if rid in recipes
+    ]
+# "More like this": recipes with similar words, ingredients and cook time,
+# most similar first, scored against the precomputed index in similarity.py.
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "backend": type(cache.recipe_cache).__name__,
+        **cache.recipe_cache.stats.as_dict(),
+        "tokens": {"entries": len(token_cache), **token_cache.stats.as_dict()},
+    }
+# Hit/miss counters of the recipe cache (and of the verified token cache), for monitoring.
+
+@app.get("/changes/stats")
+async def get_change_stats():
+    return {"backend": type(change_feed.change_bus).__name__, **change_feed.change_bus.feed.stats()}
+# Change feed of this worker: last sequence number, buffered events and open streams.
+
+@app.get("/images/stats")
+async def get_image_stats():
+    return images.image_pool.stats()
+# Image resizing pool of this worker.
+
+@app.get("/auth/stats")
+async def get_auth_stats():
+    return password_hasher.stats()
+# Password hashing pool of this worker: jobs in flight, completed and rejected (503).
+
+@app.get("/db/stats")
+async def get_db_stats():
+    return {
+        "pool": type(async_engine.pool).__name__,
+        **async_pool_metrics.as_dict(async_engine.pool),
+        **replica_set.stats(),
+    }
+# Connection pool usage of this worker: checkout waits, timeouts and current size.
+# Used to size IRMS_DB_POOL_SIZE / IRMS_DB_MAX_OVERFLOW for the number of workers.
+# With read replicas, also how many reads went to each of them and to the primary.
+
+@metrics.registry.collector
+def _stats_metrics():
+    db = async_pool_metrics.as_dict(async_engine.pool)
+    samples = [
+        ("irms_db_pool_checkouts_total", "counter", "Connections checked out of the pool.", db["checkouts"]),
+        ("irms_db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.", db["timeouts"]),
+        ("irms_db_pool_checked_out", "gauge", "Connections in use right now.", db.get("checked_out", 0)),
+    ]
+    reads = replica_set.stats()
+    samples += [
+        ("irms_db_primary_reads_total", "counter", "Read-only sessions opened on the primary.", reads["primary_reads"]),
+        ("irms_db_sticky_reads_total", "counter", "Reads sent to the primary because the client just wrote.", reads["sticky_reads"]),
+        ("irms_db_replica_reads_total", "counter", "Read-only sessions opened on a replica.",
+         sum(r["sessions"] for r in reads["replicas"])),
+        ("irms_db_replica_failures_total", "counter", "Failed connections to a replica.",
+         sum(r["failures"] for r in reads["replicas"])),
+    ]
+    for name, stats in (("recipe", cache.recipe_cache.stats), ("token", token_cache.stats)):
+        samples += [
+            (f"irms_{name}_cache_hits_total", "counter", f"Hits of the {name} cache.", stats.hits),
+            (f"irms_{name}_cache_misses_total", "counter", f"Misses of the {name} cache.", stats.misses),
+        ]
+    for name, pool in (("password", password_hasher), ("image", images.image_pool)):
+        pool_stats = pool.stats()
+        samples += [
+            (f"irms_{name}_pool_pending", "gauge", f"Jobs running or queued in the {name} pool.", pool_stats["pending"]),
+            (f"irms_{name}_pool_rejected_total", "counter", f"Jobs turned away with 503 by the {name} pool.", pool_stats["rejected"]),
+        ]
+    feed = change_feed.change_bus.feed.stats()
+    samples += [
+        ("irms_changes_published_total", "counter", "Recipe changes received by the change feed.", feed["published"]),
+        ("irms_changes_subscribers", "gauge", "Clients streaming GET /recipes/changes.", feed["subscribers"]),
+        ("irms_changes_cut_off_total", "counter", "Streams ended because the client fell behind.", feed["cut_off"]),
+    ]
+    log = audit_log.recipe_log.stats()
+    samples += [
+        ("irms_log_queued", "gauge", "Audit records waiting to be written.", log["queued"]),
+        ("irms_log_dropped_total", "counter", "Audit records dropped because the queue was full.", log["dropped"]),
+    ]
+    return samples
+# Counters this worker already keeps for the /…/stats endpoints, as metrics.
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+# Prometheus text format: per-route latency, SQL queries and time, serialisation
+# and log time histograms (see metrics.py), plus the counters above.
@@ -0,0 +1,209 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from backend import settings, metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Background log pipeline for recipe audit records.
+#
+# Endpoints hand a finished line to BatchedFileWriter.write(), which only puts
+# it on a bounded in-memory queue and returns straight away, so file I/O is no
+# longer part of the request. A single writer thread per file drains the
+# queue in batches:
+#
+# * each batch is written with one os.write() on a file opened with O_APPEND,
+#   so lines from concurrent requests (or other worker processes appending to
+#   the same file) never interleave;
+# * the file is fsynced at most every fsync_interval seconds rather than per line;
+# * once the file grows past max_bytes it is rotated to <name>.1, <name>.2, ...
+#   (never, with max_bytes 0)
+#
+# Every worker process has its own writer on the same files. Writing and
+# rotating happen under a lock on <name>.lock shared by all of them, and a
+# writer whose file was rotated by another process (its inode is no longer
+# the one at <name>) reopens it before writing, so no batch lands in a backup.
+#
+# If the queue is full (the disk can't keep up) the record is dropped and
+# counted rather than blocking the request.
+
+class BatchedFileWriter:
+    def __init__(self, path, max_bytes, backup_count, queue_size, batch_size,
+                 flush_interval, fsync_interval):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._fd = None
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+
+    def write(self, line: str) -> bool:
+        with metrics.timed("log_seconds"):
+            self._ensure_started()
+            try:
+                self._queue.put_nowait(line)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+    # Queues a line (including its trailing newline). Never blocks.
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._stopping.clear()
+                    self._thread = threading.Thread(
+                        target=self._run, name=f"log-writer:{os.path.basename(self.path)}", daemon=True
+                    )
+                    self._thread.start()
+    # The writer thread is started by the first write.
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+    # Stops the writer once everything queued so far has been written.
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._maybe_fsync(force=True)
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+        if self._fd is not None:
+            self._close()
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        data = "".join(batch).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._file_lock():
+                self._open()
+                os.write(self._fd, data)
+                self._unsynced = True
+                self.written += len(batch)
+                self.batches += 1
+                self._maybe_fsync()
+                if self.max_bytes and os.fstat(self._fd).st_size >= self.max_bytes:
+                    self._rotate()
+        except OSError:
+            self.dropped += len(batch)
+            # The writer thread must survive a full disk or a missing directory
+        metrics.log_batch_seconds.observe(time.perf_counter() - started, os.path.basename(self.path))
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.path + ".lock", "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+    # Held by one process at a time while it writes or rotates (not on Windows).
+
+    def _open(self):
+        if self._fd is not None:
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(self._fd).st_ino:
+                self._close()
+        # Another process rotated the file since this one last wrote
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _close(self):
+        self._maybe_fsync(force=True)
+        os.close(self._fd)
+        self._fd = None
+
+    def _maybe_fsync(self, force=False):
+        if self._fd is None or not self._unsynced:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._fd)
+            self._unsynced = False
+            self._last_fsync = now
+    # Only files written to since their last fsync are synced, forced or not.
+
+    def _rotate(self):
+        self._close()
+        for n in range(self.backup_count - 1, 0, -1):
+            older = f"{self.path}.{n}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+    # Same naming as logging.handlers.RotatingFileHandler; the next batch reopens
+    # the file. Runs under the lock, right after a write that found the file current.
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+        }
+
+
+def _writer(path: str, max_bytes: int = settings.LOG_MAX_BYTES) -> BatchedFileWriter:
+    return BatchedFileWriter(
+        path,
+        max_bytes=max_bytes,
+        backup_count=settings.LOG_BACKUP_COUNT,
+        queue_size=settings.LOG_QUEUE_SIZE,
+        batch_size=settings.LOG_BATCH_SIZE,
+        flush_interval=settings.LOG_FLUSH_INTERVAL_SECONDS,
+        fsync_interval=settings.LOG_FSYNC_INTERVAL_SECONDS,
+    )
+
+recipe_log = _writer("backend/static/recipe_logs/recipe_log.jsonl")
+# One JSON object per line for every recipe event
+
+recipe_archive = _writer("backend/static/saved_recipes/saved_recipes.txt", max_bytes=0)
+# Full recipe details in the RecipeBook text format. Never rotated: it is the
+# complete archive, read back through RecipeBook's offset index.
+
+def log_event(event: str, **fields):
+    record = {"ts": datetime.now(timezone.utc).isoformat(), "event": event, **fields}
+    recipe_log.write(json.dumps(record, default=str) + "\n")
+
+def close_all():
+    recipe_log.close()
+    recipe_archive.close()
+
+atexit.register(close_all)
+# Also closed by the API's shutdown hook; atexit covers scripts that import the API.
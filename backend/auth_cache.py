@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event
+from backend import settings
+from backend.cache import CacheStats
+from backend.database import User
+
+# Cache of verified access tokens.
+#
+# The first request with a token verifies its signature and loads the user;
+# the result is stored as a Principal keyed on the SHA-256 of the token, so
+# later requests with the same token skip both the JWT decode and the database
+# and cost one dictionary lookup. The cache is bounded, least recently used
+# entries are dropped first.
+#
+# The database stays the source of truth for the user:
+# * An entry expires IRMS_TOKEN_CACHE_TTL_SECONDS after the user was loaded,
+#   or with the token (its "exp" claim) if that is sooner. The next request
+#   loads the user again, so a user deleted or renamed outside this worker
+#   (another worker, SQL) is noticed within that time.
+# * A user updated or deleted through the ORM in this worker has their entries
+#   dropped straight away (forget_user(), from the mapper events below).
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    username: str
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user_id=user.user_id, username=user.username, created_at=user.created_at)
+# The authenticated user as seen by the endpoints.
+# A plain immutable object rather than the ORM User, so it can be shared
+# between requests (and threads) without being tied to a database session.
+
+def token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+# Tokens are looked up by hash, the raw tokens are never kept in memory.
+
+class TokenCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # token hash -> (expires_at, principal), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.stats.incr("hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                # The token has expired
+        self.stats.incr("misses")
+        return None
+
+    def set(self, token: str, principal: Principal, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        key = token_key(token)
+        expires_at = min(expires_at, time.time() + settings.TOKEN_CACHE_TTL_SECONDS)
+        with self._lock:
+            self._entries[key] = (expires_at, principal)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self.stats.incr("sets")
+        if evicted:
+            self.stats.incr("evictions", evicted)
+    # expires_at is the token's "exp" claim (seconds since the epoch).
+
+    def forget_user(self, user_id: int):
+        with self._lock:
+            stale = [key for key, (_, principal) in self._entries.items() if principal.user_id == user_id]
+            for key in stale:
+                del self._entries[key]
+    # Drops every token of the user. Users rarely change, so a scan is enough.
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+token_cache = TokenCache(settings.TOKEN_CACHE_MAX_ENTRIES)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, user):
+    token_cache.forget_user(user.user_id)
+# Runs during the flush; if the transaction is rolled back the tokens are
+# simply verified again.
@@ -0,0 +1 @@
+# src/backend/benchmarks/__init__.py
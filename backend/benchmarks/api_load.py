@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from backend.benchmarks.concurrency import free_port, seed_database, start_server
+
+# Load test of the main API operations, with latency percentiles.
+#
+# Seeds a synthetic dataset (--users users with --recipes-per-user recipes of
+# --steps steps and --ingredients ingredients), starts the API with uvicorn on
+# it and, for each scenario and concurrency level, keeps that many requests in
+# flight for --duration seconds. Reported per scenario and level: requests/sec,
+# errors and p50/p95/p99/max latency in milliseconds.
+#
+#   python -m backend.benchmarks.api_load --concurrency 1,16 --output before.json
+#   ... change something ...
+#   python -m backend.benchmarks.api_load --concurrency 1,16 --compare before.json --max-regression 20
+#
+# --compare prints each number next to the earlier run's; with --max-regression
+# the script exits with status 1 when a p95 got worse by more than that many
+# percent, or throughput dropped by as much. Only compare runs made with the
+# same dataset, database and machine: the JSON records them under "config".
+#
+# Scenarios (--scenarios picks some):
+#   login        POST /token (bcrypt, mostly measures the password pool)
+#   list         GET /recipes, first page
+#   get          GET /recipes/{id}, random recipe
+#   render_steps GET /recipes/{id}/render_steps, random recipe
+#   create       POST /create_recipe
+#   update       PATCH /recipes/{id} on one of the signed in user's recipes
+#   delete       DELETE /recipes/{id} of recipes made by the create scenario
+#
+# The recipe cache is disabled on the spawned server so reads reach the
+# database. As with concurrency.py, SQLite serialises writers, so write
+# scenarios are most meaningful against PostgreSQL (set IRMS_DATABASE_URL).
+
+SCENARIOS = ["login", "list", "get", "render_steps", "create", "update", "delete"]
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+class Session:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(0)
+        self.recipe_count = args.users * args.recipes_per_user
+        self.auth = {}
+        self.own_ids = []
+        self.created = []
+    # Shared by the scenarios: the signed in user, the recipes it may edit and
+    # the recipes created during the run (deleted by the delete scenario).
+
+    async def login(self, username: str = "bench_user_0") -> httpx.Response:
+        from backend.benchmarks.seed import SEED_PASSWORD
+        return await self.client.post("/token", data={"username": username, "password": SEED_PASSWORD})
+
+    async def setup(self):
+        response = await self.login()
+        response.raise_for_status()
+        self.auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await self.client.get("/my_recipes", headers=self.auth)
+        response.raise_for_status()
+        self.own_ids = [recipe["recipe_id"] for recipe in response.json()]
+
+    def recipe_body(self) -> dict:
+        from backend.benchmarks.seed import INGREDIENT_NAMES, UNITS, WORDS
+        rng = self.rng
+        return {
+            "name": f"load test recipe {rng.randrange(10**9)}",
+            "img_path": None,
+            "description": " ".join(rng.choices(WORDS, k=12)),
+            "servings": rng.randint(1, 8),
+            "cook_time_min": rng.randint(5, 120),
+            "steps": [
+                {"img_path": None, "instruction": " ".join(rng.choices(WORDS, k=10))}
+                for _ in range(self.args.steps)
+            ],
+            "ingredients": [
+                {"name": name, "quantity": round(rng.uniform(0.25, 500), 2), "unit": rng.choice(UNITS)}
+                for name in rng.sample(INGREDIENT_NAMES, k=min(self.args.ingredients, len(INGREDIENT_NAMES)))
+            ],
+        }
+
+    async def create(self) -> httpx.Response:
+        response = await self.client.post("/create_recipe", json=self.recipe_body(), headers=self.auth)
+        if response.status_code == 201:
+            self.created.append(response.json()["recipe_id"])
+        return response
+
+    async def request(self, scenario: str):
+        if scenario == "delete":
+            if self.created:
+                recipe_id = self.created.pop()
+            else:
+                response = await self.client.post("/create_recipe", json=self.recipe_body(), headers=self.auth)
+                response.raise_for_status()
+                recipe_id = response.json()["recipe_id"]
+            # Untimed: creates something to delete when the create scenario left nothing
+        if scenario == "update" and not self.own_ids:
+            raise RuntimeError("bench_user_0 has no recipes to update")
+
+        started = time.perf_counter()
+        if scenario == "login":
+            response = await self.login(f"bench_user_{self.rng.randrange(self.args.users)}")
+        elif scenario == "list":
+            response = await self.client.get("/recipes")
+        elif scenario == "get":
+            response = await self.client.get(f"/recipes/{self.rng.randint(1, self.recipe_count)}")
+        elif scenario == "render_steps":
+            response = await self.client.get(f"/recipes/{self.rng.randint(1, self.recipe_count)}/render_steps")
+        elif scenario == "create":
+            response = await self.create()
+        elif scenario == "update":
+            response = await self.client.patch(
+                f"/recipes/{self.rng.choice(self.own_ids)}",
+                json={"description": f"updated {self.rng.randrange(10**9)}"},
+                headers=self.auth,
+            )
+        else:
+            response = await self.client.delete(f"/recipes/{recipe_id}", headers=self.auth)
+        return response, time.perf_counter() - started
+    # Returns (response, seconds) for one request of the scenario.
+
+async def _run_level(session: Session, scenario: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            try:
+                response, seconds = await session.request(scenario)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if response.status_code < 400:
+                latencies.append(seconds)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": len(latencies) / elapsed,
+        **{f"{name}_ms": percentile(latencies, q) * 1000
+           for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+        "max_ms": max(latencies, default=0.0) * 1000,
+    }
+# Latency percentiles are of successful requests only; errors are counted apart.
+
+async def run(base_url: str, args, scenarios: list[str], levels: list[int]) -> dict:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        session = Session(client, args)
+        await session.setup()
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = {}
+            for concurrency in levels:
+                results[scenario][str(concurrency)] = await _run_level(session, scenario, concurrency, args.duration)
+        return results
+# Returns {scenario: {concurrency: {"requests", "errors", "requests_per_sec", "p50_ms", ...}}}.
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def _config(args, database_url: str) -> dict:
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "database": database_url.split(":", 1)[0] if database_url else "unknown",
+        "users": args.users,
+        "recipes_per_user": args.recipes_per_user,
+        "steps": args.steps,
+        "ingredients": args.ingredients,
+        "duration": args.duration,
+    }
+# Recorded with the results so runs that aren't comparable are easy to spot.
+
+def report(results: dict, baseline: dict = None, max_regression: float = None) -> list[str]:
+    regressions = []
+    for scenario, levels in results.items():
+        for concurrency, result in levels.items():
+            line = (f"{scenario:<13} c={concurrency:<4} {result['requests_per_sec']:>8.1f} req/s  "
+                    f"p50 {result['p50_ms']:>7.1f}  p95 {result['p95_ms']:>7.1f}  "
+                    f"p99 {result['p99_ms']:>7.1f}  max {result['max_ms']:>7.1f} ms")
+            if result["errors"]:
+                line += f"  ({result['errors']} errors)"
+            before = (baseline or {}).get(scenario, {}).get(concurrency)
+            if before and before["p95_ms"] and before["requests_per_sec"]:
+                p95_change = (result["p95_ms"] / before["p95_ms"] - 1) * 100
+                rate_change = (result["requests_per_sec"] / before["requests_per_sec"] - 1) * 100
+                line += f"  | p95 {p95_change:+.0f}%  req/s {rate_change:+.0f}%"
+                if max_regression is not None and (p95_change > max_regression or -rate_change > max_regression):
+                    regressions.append(f"{scenario} c={concurrency}")
+                    line += "  REGRESSION"
+            print(line)
+    return regressions
+# Prints one line per scenario and level; returns those that regressed past max_regression.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=None, help="measure an already running server instead of starting one")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,16", help="comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario and level")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--recipes-per-user", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--ingredients", type=int, default=6)
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="with --compare, exit 1 if p95 or req/s got worse by more than this many percent")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    server = None
+    base_url = args.base_url
+    database_url = os.environ.get("IRMS_DATABASE_URL", "")
+    if base_url is None:
+        database_url = seed_database(args.users, args.recipes_per_user, args.steps, args.ingredients)
+        port = free_port()
+        server = start_server(database_url, port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        results = asyncio.run(run(base_url, args, scenarios, levels))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} ({baseline['config'].get('commit') or 'unknown commit'})")
+    regressions = report(results, (baseline or {}).get("results"), args.max_regression)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": _config(args, database_url), "results": results}, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regressed by more than {args.max_regression:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
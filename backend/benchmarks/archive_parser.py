@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but the shared word lists live next to the models
+
+from backend.RecipeBook import RecipeBook
+from backend.benchmarks.seed import INGREDIENT_NAMES, UNITS, WORDS
+
+# Benchmark for the saved recipes archive reader.
+#
+# Generates a synthetic archive of the requested size, then measures:
+#   * a full streaming pass (throughput and peak memory, which should stay
+#     flat however large the archive is),
+#   * building the sidecar offset index,
+#   * random single-recipe lookups through the index.
+#
+#   python -m backend.benchmarks.archive_parser --size-mb 4096
+
+def generate(path: str, size_mb: int) -> int:
+    rng = random.Random(0)
+    target = size_mb * 1024 * 1024
+    recipe_id = 0
+    with open(path, "w") as f:
+        while f.tell() < target:
+            recipe_id += 1
+            f.write(RecipeBook.format_recipe({
+                "recipe_id": recipe_id,
+                "name": f"Recipe {recipe_id}",
+                "description": " ".join(rng.choices(WORDS, k=15)),
+                "servings": rng.randint(1, 8),
+                "cook_time_min": rng.randint(5, 120),
+                "ingredients": [
+                    {"name": name, "quantity": round(rng.uniform(0.25, 500), 2), "unit": rng.choice(UNITS)}
+                    for name in rng.sample(INGREDIENT_NAMES, k=6)
+                ],
+                "steps": [
+                    {"step_number": n, "instruction": " ".join(rng.choices(WORDS, k=12)), "img_path": None}
+                    for n in range(1, 9)
+                ],
+            }, "bench_user"))
+    return recipe_id
+# Writes recipes until the file reaches size_mb. Returns the number written.
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--path", default=None, help="reuse/keep the archive at this path")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(prefix="irms-archive-"), "saved_recipes.txt")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        generate(path, args.size_mb)
+        print(f"generated {os.path.getsize(path) / 2**20:.0f} MB in {time.perf_counter() - started:.1f}s")
+    size_mb = os.path.getsize(path) / 2**20
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    count = sum(1 for _ in RecipeBook.iter_recipes_from_file(path))
+    elapsed = time.perf_counter() - started
+    print(f"stream: {count} recipes, {size_mb / elapsed:.0f} MB/s, "
+          f"peak RSS {peak_rss_mb():.0f} MB (was {rss_before:.0f} MB before parsing)")
+
+    index_path = path + ".idx"
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    started = time.perf_counter()
+    RecipeBook.update_offset_index(path)
+    print(f"index build: {time.perf_counter() - started:.1f}s, "
+          f"{os.path.getsize(index_path) / 2**20:.1f} MB sidecar")
+
+    rng = random.Random(1)
+    timings = []
+    for _ in range(args.lookups):
+        recipe_id = rng.randint(1, count)
+        started = time.perf_counter()
+        recipe = RecipeBook.load_recipe(recipe_id, path)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert recipe["recipe_id"] == recipe_id
+    timings.sort()
+    print(f"lookups: p50={timings[len(timings) // 2]:.2f}ms "
+          f"p95={timings[int(len(timings) * 0.95)]:.2f}ms")
+
+if __name__ == "__main__":
+    main()
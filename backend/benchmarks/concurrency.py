@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Throughput of the API under concurrent load.
+#
+# Starts the API with uvicorn (one worker) on a freshly seeded scratch
+# database, then for each concurrency level keeps that many requests in flight
+# against a handful of read endpoints for a fixed time and reports requests/sec.
+# The recipe cache is disabled on the spawned server so every request reaches
+# the database.
+#
+#   python -m backend.benchmarks.concurrency --concurrency 1,16,64 --output after.json
+#
+# To compare two versions of the API, start the other version yourself (with
+# the same seeded database) and point --base-url at it, saving its results:
+#
+#   python -m backend.benchmarks.concurrency --base-url http://127.0.0.1:8001 --output before.json
+#   python -m backend.benchmarks.concurrency --compare before.json
+#
+# SQLite serialises writers and runs aiosqlite on a thread per connection, so
+# numbers are most meaningful with IRMS_DATABASE_URL pointing at PostgreSQL.
+
+ENDPOINTS = ["GET /recipes/{id}", "GET /recipes", "GET /users/me", "GET /my_recipes"]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def seed_database(users: int, recipes_per_user: int, steps: int = 8, ingredients: int = 6) -> str:
+    url = os.environ.get("IRMS_DATABASE_URL")
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="irms-load-"), "load.db")
+        url = os.environ["IRMS_DATABASE_URL"] = f"sqlite:///{path}"
+    from backend.database import SessionLocal
+    from backend.benchmarks.seed import seed
+    db = SessionLocal()
+    try:
+        seed(db, users=users, recipes_per_user=recipes_per_user, steps=steps, ingredients=ingredients)
+    finally:
+        db.close()
+    return url
+# Imported late: the models pick up IRMS_DATABASE_URL when they're first imported.
+
+def start_server(database_url: str, port: int, env: dict = None) -> subprocess.Popen:
+    env = {**os.environ, "IRMS_DATABASE_URL": database_url, "IRMS_CACHE_TTL_SECONDS": "0", **(env or {})}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.api:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/help", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("the API server did not start within 30s")
+# Also used by the other load benchmarks; env adds or overrides settings of the server.
+
+async def _login(client: httpx.AsyncClient) -> dict:
+    from backend.benchmarks.seed import SEED_PASSWORD
+    response = await client.post("/token", data={"username": "bench_user_0", "password": SEED_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def _request(endpoint: str, auth: dict, recipe_count: int):
+    if endpoint == "GET /recipes/{id}":
+        return "GET", f"/recipes/{random.randint(1, recipe_count)}", {}
+    if endpoint == "GET /recipes":
+        return "GET", "/recipes", {}
+    if endpoint == "GET /users/me":
+        return "GET", "/users/me", auth
+    return "GET", "/my_recipes", auth
+
+async def _run_level(client, endpoint, auth, recipe_count, concurrency, duration) -> dict:
+    completed, errors = 0, 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal completed, errors
+        while time.perf_counter() < deadline:
+            method, path, headers = _request(endpoint, auth, recipe_count)
+            try:
+                response = await client.request(method, path, headers=headers)
+                if response.status_code < 400:
+                    completed += 1
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests_per_sec": completed / elapsed, "errors": errors}
+
+async def run(base_url: str, levels: list[int], duration: float, recipe_count: int) -> dict:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        auth = await _login(client)
+        results = {}
+        for endpoint in ENDPOINTS:
+            results[endpoint] = {}
+            for concurrency in levels:
+                results[endpoint][str(concurrency)] = await _run_level(
+                    client, endpoint, auth, recipe_count, concurrency, duration
+                )
+        return results
+# Returns {endpoint: {concurrency: {"requests_per_sec", "errors"}}}.
+
+def report(results: dict, baseline: dict = None):
+    for endpoint, levels in results.items():
+        for concurrency, result in levels.items():
+            line = f"{endpoint:<20} c={concurrency:<4} {result['requests_per_sec']:>9.1f} req/s"
+            if result["errors"]:
+                line += f"  ({result['errors']} errors)"
+            before = (baseline or {}).get(endpoint, {}).get(concurrency)
+            if before and before["requests_per_sec"]:
+                line += f"  was {before['requests_per_sec']:.1f} ({result['requests_per_sec'] / before['requests_per_sec']:.2f}x)"
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=None, help="measure an already running server instead of starting one")
+    parser.add_argument("--concurrency", default="1,16,64", help="comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per endpoint and level")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--recipes-per-user", type=int, default=200)
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        database_url = seed_database(args.users, args.recipes_per_user)
+        port = free_port()
+        server = start_server(database_url, port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        results = asyncio.run(run(base_url, levels, args.duration, args.users * args.recipes_per_user))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
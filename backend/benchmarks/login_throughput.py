@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+from backend.benchmarks.concurrency import free_port, seed_database, start_server
+
+# Logins per second for different sizes of the password hashing pool.
+#
+# Seeds users on a scratch database, then for each IRMS_PASSWORD_WORKERS
+# value starts the API, keeps --concurrency logins (POST /token) in flight for
+# --duration seconds and reports:
+#   * logins/sec and login latency (p50/p95),
+#   * how many logins were turned away with 503 by admission control,
+#   * p95 latency of GET /recipes probed during the storm, which shows whether
+#     other requests stay responsive while bcrypt is busy.
+# Workers "0" hashes in the thread pool instead of worker processes.
+#
+#   python -m backend.benchmarks.login_throughput --workers 0,1,2,4,8 --concurrency 64
+#
+# Throughput only scales with workers up to the number of cores on the box.
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+async def _storm(base_url: str, users: int, concurrency: int, duration: float) -> dict:
+    from backend.benchmarks.seed import SEED_PASSWORD
+    logins, rejected, errors, probes = [], 0, 0, []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency + 1)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def login():
+            nonlocal rejected, errors
+            while time.perf_counter() < deadline:
+                username = f"bench_user_{random.randrange(users)}"
+                started = time.perf_counter()
+                response = await client.post("/token", data={"username": username, "password": SEED_PASSWORD})
+                if response.status_code == 200:
+                    logins.append(time.perf_counter() - started)
+                elif response.status_code == 503:
+                    rejected += 1
+                    await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+                    # Well-behaved clients back off as asked
+                else:
+                    errors += 1
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.get("/recipes", params={"limit": 1})
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(login() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "logins_per_sec": len(logins) / elapsed,
+        "login_p50_ms": 1000 * _percentile(logins, 0.5),
+        "login_p95_ms": 1000 * _percentile(logins, 0.95),
+        "rejected": rejected,
+        "errors": errors,
+        "probe_p95_ms": 1000 * _percentile(probes, 0.95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=f"0,1,{os.cpu_count() or 1}", help="comma separated IRMS_PASSWORD_WORKERS values")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the seeded hashes")
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ["IRMS_BCRYPT_ROUNDS"] = str(args.rounds)
+    database_url = seed_database(args.users, recipes_per_user=1)
+
+    print(f"{os.cpu_count()} cores, bcrypt cost {args.rounds}, {args.concurrency} concurrent logins")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        port = free_port()
+        server = start_server(database_url, port, {
+            "IRMS_PASSWORD_WORKERS": str(workers),
+            "IRMS_PASSWORD_MAX_PENDING": str(args.max_pending),
+            "IRMS_BCRYPT_ROUNDS": str(args.rounds),
+        })
+        try:
+            result = asyncio.run(_storm(f"http://127.0.0.1:{port}", args.users, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"workers={workers:<3} {result['logins_per_sec']:>7.1f} logins/s  "
+            f"p50 {result['login_p50_ms']:>7.0f}ms  p95 {result['login_p95_ms']:>7.0f}ms  "
+            f"503s {result['rejected']:<5} errors {result['errors']:<3} "
+            f"GET /recipes p95 {result['probe_p95_ms']:.0f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import random
+import time
+from decimal import Decimal
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but importing the models needs an engine
+
+from backend import meal_plan
+from backend.benchmarks.seed import INGREDIENT_NAMES, UNITS
+
+# Time to merge the shopping list of a large meal plan.
+#
+# Builds the ingredient rows the endpoint would read for --recipes recipes of
+# --ingredients ingredients each (names with varying case and plurals, the
+# seed units plus a few imperial ones) and times meal_plan.shopping_list(),
+# i.e. everything after the query.
+#
+#   python -m backend.benchmarks.meal_plan --recipes 100,500,2000 --ingredients 10
+
+def _rows(rng: random.Random, recipes: int, ingredients: int) -> list[tuple]:
+    names = INGREDIENT_NAMES + [n.upper() for n in INGREDIENT_NAMES] + [n + "s" for n in INGREDIENT_NAMES]
+    units = UNITS + ["kg", "oz", "lb", "cups", "Tbsp", "pinch"]
+    return [
+        (recipe_id, rng.choice(names), Decimal(str(round(rng.uniform(0.25, 500), 2))), rng.choice(units))
+        for recipe_id in range(1, recipes + 1)
+        for _ in range(ingredients)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", default="100,500,2000", help="comma separated plan sizes")
+    parser.add_argument("--ingredients", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for recipes in [int(r) for r in args.recipes.split(",")]:
+        rows = _rows(rng, recipes, args.ingredients)
+        scales = meal_plan.recipe_scales(
+            [(recipe_id, rng.randint(1, 8)) for recipe_id in range(1, recipes + 1)],
+            {recipe_id: rng.randint(1, 8) for recipe_id in range(1, recipes + 1)},
+        )
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            items = meal_plan.shopping_list(rows, scales)
+            best = min(best, time.perf_counter() - started)
+        print(f"{recipes:>6} recipes  {len(rows):>7} rows  {len(items):>4} lines  {best * 1000:>8.2f}ms")
+
+if __name__ == "__main__":
+    main()
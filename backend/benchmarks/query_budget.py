@@ -0,0 +1,244 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# Query budget check for the recipe endpoints.
+#
+# Seeds a scratch database, calls each endpoint through the real FastAPI app
+# and counts the SELECT statements it sends. The run fails (exit code 1) if any
+# endpoint goes over its budget, which catches lazy loads creeping back in:
+# the budgets are fixed, so they're only met if the query count doesn't grow
+# with the number of recipes, steps or ingredients.
+#
+# Edits are also checked against a write budget (INSERT/UPDATE/DELETE), so an
+# edit keeps touching only the rows that changed rather than rewriting the
+# recipe's steps and ingredients.
+#
+# Finally /recipes is paged through by following next_cursor, with every recipe
+# created in the same second, to check that pages don't repeat or never end.
+#
+# Run from the repository root:
+#   python -m backend.benchmarks.query_budget
+#
+# By default a throwaway SQLite file is used. Set IRMS_DATABASE_URL to check
+# against PostgreSQL instead (the database should be empty).
+
+if "IRMS_DATABASE_URL" not in os.environ:
+    _scratch = os.path.join(tempfile.mkdtemp(prefix="irms-budget-"), "budget.db")
+    os.environ["IRMS_DATABASE_URL"] = f"sqlite:///{_scratch}"
+
+from sqlalchemy import event, update
+from fastapi.testclient import TestClient
+from backend.api import app
+from backend.database import async_engine, SessionLocal, Recipe
+from backend.security import create_user_token
+from backend.benchmarks.seed import seed
+
+QUERY_BUDGETS = {
+    "GET /recipes": 1,
+    "GET /recipes/{id}": 4,
+    "GET /recipes/{id} not modified since": 1,
+    "GET /recipes/{id} modified since": 4,
+    "GET /recipes/{id}/render_steps": 2,
+    "GET /recipes/render_steps": 1,
+    "GET /my_recipes": 5,
+    "POST /recipes/shopping_list": 1,
+    "PUT /recipes/{id}": 5,
+    "PUT /recipes/{id} unchanged": 5,
+    "PATCH /recipes/{id} name": 5,
+    "PATCH /recipes/{id} edit a step": 5,
+    "PATCH /recipes/{id} add a step": 5,
+    "PATCH /recipes/{id} move a step": 5,
+    "PATCH /recipes/{id} remove an ingredient": 5,
+    "PUT /recipes/{id}/rating": 4,
+    "PUT /recipes/{id}/rating changed": 4,
+    "GET /recipes/top_rated": 1,
+}
+# Maximum number of SELECT statements per request.
+# Authenticated endpoints include the query that loads the current user,
+# single recipe reads and /my_recipes include the version lookup used for ETags.
+# A conditional read the client is up to date for (304) is only the version lookup.
+# Rendered steps are stored with the recipe, so rendering many recipes is one query.
+# Ratings read the recipe's precomputed aggregates, never the ratings themselves.
+
+WRITE_BUDGETS = {
+    "PUT /recipes/{id} unchanged": 0,
+    "PATCH /recipes/{id} name": 1,
+    "PATCH /recipes/{id} edit a step": 2,
+    "PATCH /recipes/{id} add a step": 2,
+    "PATCH /recipes/{id} move a step": 4,
+    "PATCH /recipes/{id} remove an ingredient": 2,
+    "PUT /recipes/{id}/rating": 3,
+    "PUT /recipes/{id}/rating changed": 2,
+}
+# Maximum number of INSERT/UPDATE/DELETE statements per edit, run in this
+# order on the recipe saved by the PUT above. An edit that changes something
+# also writes the recipe row (version, updated_at). Rows of the same table
+# changed together are sent as one executemany statement. Moving a step
+# renumbers it and the steps in between through temporary numbers (see
+# recipe_updates.py): steps and the recipe row are written before and after
+# the renumbering.
+# A rating writes the rating and updates the recipe's aggregates in place (the
+# first rating of a recipe also inserts its aggregates row).
+
+UPDATED_IN_PLACE = {
+    "PATCH /recipes/{id} edit a step": "steps",
+    "PATCH /recipes/{id} move a step": "steps",
+}
+# Edits that must keep the rows of this table (and their ids): no INSERT or
+# DELETE on it, only UPDATEs.
+
+EXPECTED_STATUS = {
+    "GET /recipes/{id} not modified since": 304,
+    "GET /recipes/{id} modified since": 200,
+}
+# Conditional reads, with dates in the "-0000" zone some clients send
+# (parsed without a timezone): the answer must still be right.
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", _record)
+# Collects every statement the endpoints send to the database while the block runs.
+# Events of an async engine are registered on its sync_engine.
+
+def _recipe_body(steps=8, ingredients=6):
+    return {
+        "name": "Budget check recipe",
+        "img_path": None,
+        "description": "Edited by the query budget check",
+        "servings": 2,
+        "cook_time_min": 15,
+        "steps": [{"img_path": None, "instruction": f"Step {n}"} for n in range(steps)],
+        "ingredients": [
+            {"name": f"ingredient {n}", "quantity": 1, "unit": "g"} for n in range(ingredients)
+        ],
+    }
+
+def api_calls(client: TestClient, token: str, recipe_id: int, recipe_ids: list[int]) -> dict:
+    auth = {"Authorization": f"Bearer {token}"}
+    body = _recipe_body()
+    edited_steps = [dict(step) for step in body["steps"]]
+    edited_steps[3]["instruction"] = "Step 3, edited"
+    added_steps = edited_steps + [{"img_path": None, "instruction": "One more step"}]
+    return {
+        "GET /recipes": lambda: client.get("/recipes", params={"limit": 50}),
+        "GET /recipes/{id}": lambda: client.get(f"/recipes/{recipe_id}"),
+        "GET /recipes/{id} not modified since": lambda: client.get(
+            f"/recipes/{recipe_id}", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 -0000"}),
+        "GET /recipes/{id} modified since": lambda: client.get(
+            f"/recipes/{recipe_id}", headers={"If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 -0000"}),
+        "GET /recipes/{id}/render_steps": lambda: client.get(f"/recipes/{recipe_id}/render_steps"),
+        "GET /recipes/render_steps": lambda: client.get("/recipes/render_steps", params={"ids": recipe_ids}),
+        "GET /my_recipes": lambda: client.get("/my_recipes", headers=auth),
+        "POST /recipes/shopping_list": lambda: client.post(
+            "/recipes/shopping_list", json={"meals": [{"recipe_id": rid, "servings": 4} for rid in recipe_ids]}),
+        "PUT /recipes/{id}": lambda: client.put(f"/recipes/{recipe_id}", json=body, headers=auth),
+        "PUT /recipes/{id} unchanged": lambda: client.put(f"/recipes/{recipe_id}", json=body, headers=auth),
+        "PATCH /recipes/{id} name": lambda: client.patch(
+            f"/recipes/{recipe_id}", json={"name": "Budget check recipe, renamed"}, headers=auth),
+        "PATCH /recipes/{id} edit a step": lambda: client.patch(
+            f"/recipes/{recipe_id}", json={"steps": edited_steps}, headers=auth),
+        "PATCH /recipes/{id} add a step": lambda: client.patch(
+            f"/recipes/{recipe_id}", json={"steps": added_steps}, headers=auth),
+        "PATCH /recipes/{id} move a step": lambda: client.patch(
+            f"/recipes/{recipe_id}", json={"steps": added_steps[1:] + added_steps[:1]}, headers=auth),
+        "PATCH /recipes/{id} remove an ingredient": lambda: client.patch(
+            f"/recipes/{recipe_id}", json={"ingredients": body["ingredients"][1:]}, headers=auth),
+        "PUT /recipes/{id}/rating": lambda: client.put(f"/recipes/{recipe_id}/rating", json={"value": 4}, headers=auth),
+        "PUT /recipes/{id}/rating changed": lambda: client.put(
+            f"/recipes/{recipe_id}/rating", json={"value": 5}, headers=auth),
+        "GET /recipes/top_rated": lambda: client.get("/recipes/top_rated", params={"limit": 50}),
+    }
+# {endpoint: function making the request}, to be called in order: the edits
+# apply to the recipe saved by the PUT. recipe_id and recipe_ids are recipes
+# of the user the token belongs to. Also used by query_plans.py.
+
+def seed_scenario(users: int, recipes_per_user: int) -> tuple[str, int, list[int]]:
+    db = SessionLocal()
+    try:
+        user = seed(db, users=users, recipes_per_user=recipes_per_user)[0]
+        recipe_ids = [r.recipe_id for r in user.recipes]
+        return create_user_token(user), recipe_ids[0], recipe_ids
+    finally:
+        db.close()
+# Seeds the scratch database; returns the token, a recipe and all recipes of the first user.
+
+def run() -> dict:
+    token, recipe_id, recipe_ids = seed_scenario(users=3, recipes_per_user=25)
+    calls = api_calls(TestClient(app), token, recipe_id, recipe_ids)
+
+    results = {}
+    for name, call in calls.items():
+        with count_statements() as statements:
+            response = call()
+        if response.status_code >= 400 or response.status_code != EXPECTED_STATUS.get(name, response.status_code):
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.text}")
+        words = [s.split(None, 3) for s in statements]
+        kinds = [w[0].upper() for w in words]
+        results[name] = {
+            "selects": kinds.count("SELECT"),
+            "writes": sum(kinds.count(k) for k in ("INSERT", "UPDATE", "DELETE")),
+            "replaced": {w[2].strip('"') for w in words if w[0].upper() in ("INSERT", "DELETE")},
+        }
+    return results
+# Returns {endpoint: {"selects", "writes", "replaced"}} with the number of
+# statements issued and the tables rows were inserted into or deleted from.
+
+def walk_pages(client: TestClient, limit: int = 7) -> tuple[list[int], list[int]]:
+    db = SessionLocal()
+    try:
+        db.execute(update(Recipe).values(created_at=db.query(Recipe.created_at).order_by(Recipe.recipe_id).limit(1).scalar_subquery()))
+        db.commit()
+        expected = [rid for (rid,) in db.query(Recipe.recipe_id).order_by(Recipe.recipe_id.desc())]
+    finally:
+        db.close()
+
+    seen = []
+    params = {"limit": limit}
+    while len(seen) <= len(expected):
+        page = client.get("/recipes", params=params).json()
+        seen.extend(r["recipe_id"] for r in page["items"])
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+    return seen, expected
+# Gives every recipe the same created_at, then follows next_cursor to the end.
+# Returns the recipe ids seen and those expected (newest id first); paging that
+# never ends stops once more rows than exist were returned.
+
+def main() -> int:
+    failed = False
+    for name, counts in run().items():
+        budget = QUERY_BUDGETS[name]
+        write_budget = WRITE_BUDGETS.get(name)
+        over = counts["selects"] > budget
+        line = f"{name:<42} {counts['selects']:>3} / {budget:<3}"
+        if write_budget is not None:
+            over = over or counts["writes"] > write_budget
+            line += f" writes {counts['writes']:>2} / {write_budget:<2}"
+        replaced = UPDATED_IN_PLACE.get(name) in counts["replaced"]
+        failed = failed or over or replaced
+        status = "OVER BUDGET" if over else "ok"
+        if replaced:
+            status = f"REPLACES {UPDATED_IN_PLACE[name].upper()}"
+        print(f"{line:<68} {status}")
+
+    seen, expected = walk_pages(TestClient(app))
+    paged = seen == expected
+    failed = failed or not paged
+    print(f"{'GET /recipes pages, same created_at':<42} {len(seen):>3} / {len(expected):<3} recipes".ljust(69)
+          + ("ok" if paged else "PAGES REPEAT OR SKIP"))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+
+# Query plan check for the API.
+#
+# Seeds a scratch database with the benchmark dataset, calls the endpoints
+# through the real FastAPI app while recording every statement they send,
+# then asks the database for the plan of each SELECT, UPDATE and DELETE
+# (EXPLAIN, nothing is executed again). The run fails (exit code 1) if any
+# plan reads a whole table instead of going through an index:
+#
+#   SQLite      "SCAN <table>" without an index in EXPLAIN QUERY PLAN
+#   PostgreSQL  a "Seq Scan" node, planned with enable_seqscan off
+#
+# PostgreSQL prefers a sequential scan on small tables even when an index
+# would do, so with enable_seqscan off a Seq Scan only remains when there is
+# no usable index at all, whatever the size of the dataset.
+#
+# Run from the repository root:
+#   python -m backend.benchmarks.query_plans
+#
+# By default a throwaway SQLite file is used. Set IRMS_DATABASE_URL to check
+# against PostgreSQL instead (the database should be empty).
+
+if "IRMS_DATABASE_URL" not in os.environ:
+    _scratch = os.path.join(tempfile.mkdtemp(prefix="irms-plans-"), "plans.db")
+    os.environ["IRMS_DATABASE_URL"] = f"sqlite:///{_scratch}"
+os.environ.setdefault("IRMS_SIMILAR_INDEX_DIR", tempfile.mkdtemp(prefix="irms-plans-similar-"))
+
+from sqlalchemy import event, make_url, text
+from fastapi.testclient import TestClient
+from backend.api import app
+from backend.database import DATABASE_URL, Base, async_engine, create_async_db_engine, engine
+from backend.benchmarks.query_budget import api_calls, seed_scenario
+from backend.benchmarks.seed import SEED_PASSWORD
+
+FULL_READS = {
+    "GET /users/": "lists every user",
+    "GET /recipes/export": "exports every recipe",
+    "GET /recipes/search": "builds the in-process search index on first use (not on PostgreSQL)",
+    "POST /recipes/what_can_i_cook": "builds the in-process pantry index on first use, then rereads only recipes other workers saved",
+    "GET /recipes/{id}/similar": "builds the similar recipes index when none is saved yet",
+}
+# Endpoints that read whole tables by design. Their scans are listed but
+# don't fail the check.
+
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+def _extra_calls(client: TestClient, token: str, recipe_id: int, recipe_ids: list[int]) -> dict:
+    auth = {"Authorization": f"Bearer {token}"}
+    first_page = {}
+
+    def second_page():
+        first_page.update(client.get("/recipes", params={"limit": 20}).json())
+        return client.get("/recipes", params={"limit": 20, "cursor": first_page["next_cursor"]})
+
+    return {
+        "POST /token": lambda: client.post("/token", data={"username": "bench_user_1", "password": SEED_PASSWORD}),
+        "GET /users/me": lambda: client.get("/users/me", headers=auth),
+        "GET /users/": lambda: client.get("/users/"),
+        "GET /recipes next page": second_page,
+        "GET /recipes by author": lambda: client.get("/recipes", params={"author": "bench_user_1"}),
+        "GET /recipes filtered": lambda: client.get("/recipes", params={"max_cook_time": 30, "min_servings": 2}),
+        "GET /recipes/search": lambda: client.get("/recipes/search", params={"q": "stir", "ingredients": "egg"}),
+        "POST /recipes/what_can_i_cook": lambda: client.post(
+            "/recipes/what_can_i_cook", json={"ingredients": ["egg", "flour", "milk"]}),
+        "GET /recipes/{id}/similar": lambda: client.get(f"/recipes/{recipe_id}/similar"),
+        "GET /recipes/{id}/rating": lambda: client.get(f"/recipes/{recipe_id}/rating", headers=auth),
+        "POST /recipes/{id}/comments": lambda: client.post(
+            f"/recipes/{recipe_id}/comments", json={"body": "Checked by query_plans"}, headers=auth),
+        "GET /recipes/{id}/comments": lambda: client.get(f"/recipes/{recipe_id}/comments"),
+        "POST /recipes/{id}/reports": lambda: client.post(
+            f"/recipes/{recipe_id}/reports", json={"reason": "Checked by query_plans"}, headers=auth),
+        "GET /recipes/{id}/reports": lambda: client.get(f"/recipes/{recipe_id}/reports", headers=auth),
+        "DELETE /recipes/{id}/rating": lambda: client.delete(f"/recipes/{recipe_id}/rating", headers=auth),
+        "GET /recipes/export": lambda: client.get("/recipes/export", headers=auth),
+        "DELETE /recipes/{id}": lambda: client.delete(f"/recipes/{recipe_ids[-1]}", headers=auth),
+    }
+# Endpoints the query budget doesn't cover, called after its scenarios.
+
+def record(calls: dict) -> dict:
+    statements = {}
+    current = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        kind = statement.lstrip().split(None, 1)[0].upper()
+        if kind in ("SELECT", "UPDATE", "DELETE"):
+            current.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _record)
+    try:
+        for name, call in calls.items():
+            current.clear()
+            response = call()
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name} returned {response.status_code}: {response.text}")
+            statements[name] = list(current)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", _record)
+    return statements
+# Returns {endpoint: [(statement, parameters)]}, in the driver's own
+# parameter style so they can be explained as sent.
+
+def _pg_seq_scans(plan: dict) -> list[str]:
+    found = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", ()):
+        found += _pg_seq_scans(child)
+    return found
+
+async def explain(statements: dict) -> dict:
+    tables = set(Base.metadata.tables)
+    db_engine = create_async_db_engine(DATABASE_URL)
+    scans = {}
+    try:
+        async with db_engine.connect() as connection:
+            postgres = connection.dialect.name == "postgresql"
+            if postgres:
+                await connection.exec_driver_sql("SET enable_seqscan = off")
+            for name, recorded in statements.items():
+                scans[name] = []
+                for statement, parameters in recorded:
+                    if postgres:
+                        result = await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                        plan = result.scalar()
+                        plan = json.loads(plan) if isinstance(plan, str) else plan
+                        found = _pg_seq_scans(plan[0]["Plan"])
+                    else:
+                        result = await connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+                        found = [m.group(1) for m in (_SQLITE_SCAN.match(row[-1]) for row in result) if m]
+                    found = [table for table in found if table in tables]
+                    if found:
+                        scans[name].append((sorted(set(found)), statement))
+    finally:
+        await db_engine.dispose()
+    return scans
+# Returns {endpoint: [(tables scanned, statement)]} for the statements whose
+# plan reads a whole table. A separate engine: the app's belongs to the
+# TestClient's event loop.
+
+def _seed_ratings(connection):
+    connection.execute(text(
+        "INSERT INTO recipe_ratings (recipe_id, user_id, value)"
+        " SELECT recipes.recipe_id, users.user_id, 1 + (recipes.recipe_id + users.user_id) % 5"
+        " FROM recipes CROSS JOIN users WHERE recipes.recipe_id % 3 = 0 AND users.user_id <= 3"
+    ))
+    connection.execute(text(
+        "INSERT INTO recipe_stats (recipe_id, rating_count, rating_sum, rating_avg, comment_count, report_count)"
+        " SELECT recipe_id, COUNT(*), SUM(value), AVG(value), 0, 0 FROM recipe_ratings GROUP BY recipe_id"
+    ))
+# Ratings of a third of the recipes, so the planner sees recipe_stats as it
+# would be in use rather than nearly empty.
+
+def run() -> dict:
+    token, recipe_id, recipe_ids = seed_scenario(users=20, recipes_per_user=100)
+    with engine.begin() as connection:
+        _seed_ratings(connection)
+        connection.execute(text("ANALYZE"))
+    # Statistics for the planner, as a database in use would have
+
+    client = TestClient(app)
+    calls = {
+        **api_calls(client, token, recipe_id, recipe_ids),
+        **_extra_calls(client, token, recipe_id, recipe_ids),
+    }
+    return asyncio.run(explain(record(calls)))
+
+def main() -> int:
+    print(f"Query plans on {make_url(DATABASE_URL).get_backend_name()}")
+    failed = False
+    for name, scans in run().items():
+        expected = FULL_READS.get(name)
+        if not scans:
+            print(f"{name:<42} ok")
+            continue
+        tables = ", ".join(sorted({table for found, _ in scans for table in found}))
+        if expected:
+            print(f"{name:<42} scans {tables} (expected: {expected})")
+            continue
+        failed = True
+        print(f"{name:<42} SEQUENTIAL SCAN of {tables}")
+        for _, statement in scans:
+            print("    " + " ".join(statement.split()))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
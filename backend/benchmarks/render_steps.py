@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import random
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but importing the models needs an engine
+
+from backend import rendering
+from backend.DynamicContentLoader import DynamicContentLoader
+from backend.benchmarks.seed import WORDS
+
+# Micro-benchmark of step rendering for recipes with many steps.
+#
+# Times, per recipe, without touching a database:
+#   per request - what render_steps used to do on every cache miss: build a
+#                 step object per step, render them, then encode the response
+#   render once - rendering.render_steps(), run once per recipe version on save
+#   stored      - answering from the stored rendering (the read path now)
+# and building one batch response for --batch recipes from stored renderings.
+#
+#   python -m backend.benchmarks.render_steps --steps 10,100,500 --batch 50
+
+def _recipe(rng: random.Random, steps: int) -> SimpleNamespace:
+    return SimpleNamespace(steps=[
+        SimpleNamespace(
+            step_number=n,
+            instruction=" ".join(rng.choices(WORDS, k=20)) + " & serve <hot>",
+            img_path=f"/static/images/step_{n}.jpg" if n % 4 == 0 else "",
+        )
+        for n in range(1, steps + 1)
+    ])
+# A quarter of the steps have images; the instructions need escaping.
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+# Best of `repeat` runs, in milliseconds.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", default="10,100,500", help="comma separated step counts")
+    parser.add_argument("--batch", type=int, default=50, help="recipes per batch response")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for steps in [int(s) for s in args.steps.split(",")]:
+        recipe = _recipe(rng, steps)
+        stored = rendering.render_steps(recipe.steps)
+        batch = {recipe_id: stored for recipe_id in range(1, args.batch + 1)}
+
+        per_request = _time(
+            lambda: json.dumps({"steps": DynamicContentLoader(recipe).get_rendered_steps()}).encode(),
+            args.repeat,
+        )
+        render_once = _time(lambda: rendering.render_steps(recipe.steps), args.repeat)
+        from_stored = _time(lambda: rendering.steps_body(stored), args.repeat)
+        batch_ms = _time(lambda: rendering.batch_body(batch), args.repeat)
+        print(
+            f"{steps:>5} steps  per request {per_request:>8.3f}ms  render once {render_once:>8.3f}ms  "
+            f"stored {from_stored:>7.4f}ms ({per_request / from_stored:>6.0f}x)  "
+            f"batch of {args.batch} {batch_ms:>7.3f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
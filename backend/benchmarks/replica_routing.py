@@ -0,0 +1,147 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Check of read/write routing with read replicas (see replicas.py).
+#
+# Runs the API in-process against a primary and a replica database and
+# checks, through /db/stats, which database each request used:
+#
+#   * read-only endpoints are answered by the replica;
+#   * a client that just created or updated a recipe reads it back from the
+#     primary (the cookie set by its write), other clients still use the replica;
+#   * once IRMS_REPLICA_STICKY_SECONDS have passed, that client is back on the replica;
+#   * an unreachable replica is skipped, reads still succeed.
+#
+# By default the two databases are SQLite files: the replica is a copy of the
+# seeded primary taken before the checks, so it never sees later writes (a
+# replica lagging forever) and the last check adds a replica whose directory
+# doesn't exist. Exits with status 1 if any check fails.
+#
+#   python -m backend.benchmarks.replica_routing
+#
+# To use two local PostgreSQL instances instead, set up streaming replication
+# from the first to the second, point IRMS_DATABASE_URL at the (empty) primary
+# and IRMS_DATABASE_REPLICA_URLS at the standby. Whether a fresh client sees a
+# new recipe then depends on the actual replication lag, so that line is only
+# reported, not checked.
+
+STICKY_SECONDS = 1.0
+
+_local = "IRMS_DATABASE_URL" not in os.environ
+if _local:
+    _scratch = tempfile.mkdtemp(prefix="irms-replicas-")
+    os.environ["IRMS_DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'primary.db')}"
+    os.environ["IRMS_DATABASE_REPLICA_URLS"] = ",".join([
+        f"sqlite:///{os.path.join(_scratch, 'replica.db')}",
+        f"sqlite:///{os.path.join(_scratch, 'missing', 'replica.db')}",
+    ])
+    # The second replica can't be opened: its directory doesn't exist
+elif not os.environ.get("IRMS_DATABASE_REPLICA_URLS"):
+    sys.exit("Set IRMS_DATABASE_REPLICA_URLS to the replica of IRMS_DATABASE_URL")
+os.environ["IRMS_REPLICA_STICKY_SECONDS"] = str(STICKY_SECONDS)
+os.environ.setdefault("IRMS_REPLICA_RETRY_SECONDS", "60")
+os.environ.setdefault("IRMS_CACHE_TTL_SECONDS", "0")
+os.environ.setdefault("IRMS_PASSWORD_WORKERS", "0")
+# Every read reaches a database, and logins hash in-process
+
+from fastapi.testclient import TestClient
+from backend.api import app
+from backend.database import SessionLocal, engine
+from backend.security import create_user_token
+from backend.benchmarks.seed import seed
+
+def _seed() -> tuple[str, int]:
+    db = SessionLocal()
+    try:
+        user = seed(db, users=2, recipes_per_user=5)[0]
+        return create_user_token(user), user.recipes[0].recipe_id
+    finally:
+        db.close()
+    # Returns a token of the first user and one of their recipes
+
+def _copy_to_replica():
+    engine.dispose()
+    shutil.copyfile(os.path.join(_scratch, "primary.db"), os.path.join(_scratch, "replica.db"))
+# The replica as of now: it won't see anything written after this.
+
+def _reads(client: TestClient) -> dict:
+    stats = client.get("/db/stats").json()
+    return {
+        "primary": stats["primary_reads"],
+        "replica": sum(r["sessions"] for r in stats["replicas"]),
+        "failures": sum(r["failures"] for r in stats["replicas"]),
+    }
+
+def _routed(client: TestClient, request) -> tuple[str, object]:
+    before = _reads(client)
+    response = request()
+    after = _reads(client)
+    used = [name for name in ("replica", "primary") if after[name] > before[name]]
+    return (used[0] if used else "none"), response
+# Makes the request and tells which database its read-only session was opened on.
+
+def run() -> list[tuple[str, bool]]:
+    token, recipe_id = _seed()
+    if _local:
+        _copy_to_replica()
+
+    writer = TestClient(app)
+    writer.headers["Authorization"] = f"Bearer {token}"
+    other = TestClient(app)
+    results = []
+
+    used, response = _routed(other, lambda: other.get(f"/recipes/{recipe_id}"))
+    results.append(("a read is answered by the replica", used == "replica" and response.status_code == 200))
+
+    created = writer.post("/create_recipe", json={
+        "name": "Read your writes",
+        "img_path": None,
+        "description": "Created by the replica routing check",
+        "servings": 2,
+        "cook_time_min": 10,
+        "steps": [{"img_path": None, "instruction": "Check where it is read from"}],
+        "ingredients": [{"name": "egg", "quantity": 1, "unit": ""}],
+    })
+    new_id = created.json()["recipe_id"]
+    results.append(("a write sets the sticky cookie", "irms_primary_until" in created.cookies))
+
+    used, response = _routed(writer, lambda: writer.get(f"/recipes/{new_id}"))
+    results.append(("the writer reads its new recipe from the primary",
+                    used == "primary" and response.status_code == 200))
+
+    updated = writer.patch(f"/recipes/{recipe_id}", json={"name": "Updated on the primary"})
+    used, response = _routed(writer, lambda: writer.get(f"/recipes/{recipe_id}"))
+    results.append(("the writer reads its update from the primary",
+                    updated.status_code == 200 and used == "primary"
+                    and response.json()["name"] == "Updated on the primary"))
+
+    used, response = _routed(other, lambda: other.get(f"/recipes/{new_id}"))
+    results.append(("another client still reads from the replica", used == "replica"))
+    lagging = response.status_code == 404
+    print(f"(the replica {'has not' if lagging else 'has'} received the new recipe yet)")
+    if _local:
+        results.append(("the replica copy lags behind the primary", lagging))
+
+    time.sleep(STICKY_SECONDS + 0.1)
+    used, _ = _routed(writer, lambda: writer.get(f"/recipes/{recipe_id}"))
+    results.append((f"after {STICKY_SECONDS:g}s the writer is back on the replica", used == "replica"))
+
+    if _local:
+        responses = [other.get("/recipes") for _ in range(4)]
+        results.append(("an unreachable replica is skipped",
+                        all(r.status_code == 200 for r in responses) and _reads(other)["failures"] >= 1))
+    return results
+# Returns (check, passed) in order.
+
+def main() -> int:
+    failed = False
+    for name, ok in run():
+        failed = failed or not ok
+        print(f"{name:<55} {'ok' if ok else 'FAILED'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
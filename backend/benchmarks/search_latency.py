@@ -0,0 +1,66 @@
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but importing the models needs an engine
+
+from backend.search import InvertedIndex
+from backend.benchmarks.seed import INGREDIENT_NAMES, WORDS
+
+# Latency benchmark for the in-process search index (the non-PostgreSQL path).
+#
+# Builds an index over synthetic recipes without touching a database, then
+# times a mix of prefix, multi-term and ingredient queries.
+#
+#   python -m backend.benchmarks.search_latency --recipes 100000 --steps 10
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocabulary = WORDS + [f"{w}{n}" for w in WORDS for n in range(50)]
+    index = InvertedIndex()
+
+    started = time.perf_counter()
+    for recipe_id in range(1, args.recipes + 1):
+        ingredients = rng.sample(INGREDIENT_NAMES, k=6)
+        text = [" ".join(rng.choices(vocabulary, k=10)) for _ in range(args.steps)]
+        index.add(recipe_id, "\n".join(text + ingredients), ingredients)
+    index.built = True
+    print(f"indexed {args.recipes} recipes / {args.recipes * args.steps} steps "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    queries = []
+    for _ in range(args.queries):
+        kind = rng.randrange(3)
+        if kind == 0:
+            queries.append(([rng.choice(WORDS)[:3]], []))
+        elif kind == 1:
+            queries.append((rng.sample(vocabulary, k=2), []))
+        else:
+            queries.append(([rng.choice(WORDS)], rng.sample(INGREDIENT_NAMES, k=2)))
+    # A third each of short prefixes, two-term queries and text + ingredients
+
+    for terms, ingredients in queries:
+        index.search(terms, ingredients, limit=20)
+    # Warm-up pass: converts the touched posting lists to arrays once
+
+    timings = []
+    for terms, ingredients in queries:
+        started = time.perf_counter()
+        index.search(terms, ingredients, limit=20)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"queries={len(timings)} p50={quantiles[49]:.2f}ms "
+          f"p95={quantiles[94]:.2f}ms p99={quantiles[98]:.2f}ms")
+
+if __name__ == "__main__":
+    main()
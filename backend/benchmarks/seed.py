@@ -0,0 +1,62 @@
+import random
+from sqlalchemy.orm import Session
+from backend.database import User, Recipe, Step, Ingredient, init_db
+from backend.security import hash_password
+from backend.rendering import store
+
+# Seeds a synthetic dataset for the benchmarks and query budget checks.
+# Point IRMS_DATABASE_URL at a scratch database before importing this,
+# the data is written straight into whatever database it resolves to.
+
+SEED_PASSWORD = "benchmark-password"
+
+INGREDIENT_NAMES = [
+    "egg", "flour", "sugar", "butter", "milk", "salt", "pepper", "onion",
+    "garlic", "tomato", "olive oil", "chicken breast", "rice", "basil",
+    "lemon", "potato", "carrot", "cheese", "cream", "parsley",
+]
+UNITS = ["g", "ml", "tsp", "tbsp", "cup", ""]
+WORDS = [
+    "stir", "bake", "chop", "simmer", "whisk", "fold", "season", "roast",
+    "until", "golden", "gently", "minutes", "heat", "pan", "oven", "bowl",
+]
+
+def seed(db: Session, users=5, recipes_per_user=20, steps=8, ingredients=6, rng_seed=0) -> list[User]:
+    init_db(db.get_bind())
+    rng = random.Random(rng_seed)
+    pwd_hash = hash_password(SEED_PASSWORD)
+    # bcrypt is slow by design, every seeded user shares one hash
+
+    seeded = [User(username=f"bench_user_{i}", password_hash=pwd_hash) for i in range(users)]
+    db.add_all(seeded)
+    db.flush()
+
+    for user in seeded:
+        for r in range(recipes_per_user):
+            recipe = Recipe(
+                user_id=user.user_id,
+                name=f"{user.username} recipe {r}",
+                description=" ".join(rng.choices(WORDS, k=12)),
+                servings=rng.randint(1, 8),
+                img_path="",
+                cook_time_min=rng.randint(5, 120),
+            )
+            for n in range(1, steps + 1):
+                recipe.steps.append(Step(
+                    step_number=n,
+                    instruction=" ".join(rng.choices(WORDS, k=10)),
+                    img_path="",
+                ))
+            for name in rng.sample(INGREDIENT_NAMES, k=min(ingredients, len(INGREDIENT_NAMES))):
+                recipe.ingredients.append(Ingredient(
+                    name=name,
+                    quantity=round(rng.uniform(0.25, 500), 2),
+                    unit=rng.choice(UNITS),
+                ))
+            store(recipe, 1)
+            db.add(recipe)
+        db.flush()
+    db.commit()
+    return seeded
+# Creates the schema if needed, then `users` users, each with `recipes_per_user` recipes of
+# `steps` steps and `ingredients` ingredients. Returns the created users.
@@ -0,0 +1,112 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import List
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but importing the models needs an engine
+
+from fastapi.encoders import jsonable_encoder
+from backend import serialization, settings
+from backend.response_model import RecipeOut
+from backend.benchmarks.seed import INGREDIENT_NAMES, UNITS, WORDS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Serialisation time and bytes on the wire for large recipe listings.
+#
+# Builds synthetic recipes shaped like the ORM objects the endpoints return
+# and, for each listing size, times:
+#   jsonable_encoder - FastAPI's generic path: validate, convert to plain
+#                      Python objects, then json.dumps
+#   orjson           - validate, dump to Python objects, orjson.dumps (if installed)
+#   dump_json        - serialization.model_json: validate, pydantic-core to JSON bytes
+# then the size of the body uncompressed, gzipped at IRMS_GZIP_LEVEL and with
+# Brotli at IRMS_BROTLI_QUALITY (if the brotli package is installed), and how
+# long compressing takes.
+#
+#   python -m backend.benchmarks.serialization --recipes 1000,10000
+
+def _recipes(count: int, steps: int, ingredients: int) -> list:
+    rng = random.Random(0)
+    author = SimpleNamespace(user_id=1, username="bench_user_0")
+    return [
+        SimpleNamespace(
+            recipe_id=n,
+            name=f"Recipe {n}",
+            user=author,
+            description=" ".join(rng.choices(WORDS, k=12)),
+            servings=rng.randint(1, 8),
+            cook_time_min=rng.randint(5, 120),
+            img_path="",
+            created_at=datetime(2024, 1, 1),
+            steps=[
+                SimpleNamespace(step_id=n * steps + s, step_number=s + 1, img_path="",
+                                instruction=" ".join(rng.choices(WORDS, k=10)))
+                for s in range(steps)
+            ],
+            ingredients=[
+                SimpleNamespace(ingredient_id=n * ingredients + i, name=name, unit=rng.choice(UNITS),
+                                quantity=Decimal(str(round(rng.uniform(0.25, 500), 2))))
+                for i, name in enumerate(rng.sample(INGREDIENT_NAMES, k=ingredients))
+            ],
+        )
+        for n in range(1, count + 1)
+    ]
+
+def _time(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+# Best of `repeat` runs in milliseconds, and the result of the last run.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", default="1000,10000", help="comma separated listing sizes")
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--ingredients", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    adapter = serialization.adapter(List[RecipeOut])
+
+    for count in [int(c) for c in args.recipes.split(",")]:
+        recipes = _recipes(count, args.steps, args.ingredients)
+        print(f"-- {count} recipes --")
+
+        timings = {
+            "jsonable_encoder": _time(
+                lambda: json.dumps(jsonable_encoder(adapter.validate_python(recipes))).encode(), args.repeat),
+            "dump_json": _time(lambda: serialization.model_json(List[RecipeOut], recipes), args.repeat),
+        }
+        if serialization.orjson is not None:
+            timings["orjson"] = _time(
+                lambda: serialization.orjson.dumps(adapter.dump_python(adapter.validate_python(recipes), mode="json")),
+                args.repeat,
+            )
+        for name, (ms, _) in timings.items():
+            print(f"  serialise  {name:<17} {ms:>8.1f}ms")
+
+        body = timings["dump_json"][1]
+        print(f"  bytes      {'uncompressed':<17} {len(body):>10,}")
+        ms, compressed = _time(lambda: gzip.compress(body, compresslevel=settings.GZIP_LEVEL), args.repeat)
+        print(f"  bytes      {f'gzip {settings.GZIP_LEVEL}':<17} {len(compressed):>10,}  "
+              f"({len(body) / len(compressed):.1f}x smaller, {ms:.1f}ms)")
+        if brotli is not None:
+            ms, compressed = _time(lambda: brotli.compress(body, quality=settings.BROTLI_QUALITY), args.repeat)
+            print(f"  bytes      {f'brotli {settings.BROTLI_QUALITY}':<17} {len(compressed):>10,}  "
+                  f"({len(body) / len(compressed):.1f}x smaller, {ms:.1f}ms)")
+
+if __name__ == "__main__":
+    main()
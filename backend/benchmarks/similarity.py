@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("IRMS_DATABASE_URL", "sqlite://")
+# Nothing is read from the database, but importing the models needs an engine
+
+import numpy as np
+from backend import settings
+from backend.similarity import SimilarityIndex, compute_idf, raw_features, weigh
+from backend.benchmarks.seed import INGREDIENT_NAMES, WORDS
+
+# Build time, start-up time and query latency of the similar recipes index.
+#
+# For each size, builds the matrix for synthetic recipes (as backend.init_db
+# would, minus the queries), saves it, then times what a worker does:
+#   map     - opening the saved matrix memory-mapped, at start-up
+#   similar - top 10 similar recipes of a random recipe (median and p95)
+#
+#   python -m backend.benchmarks.similarity --recipes 10000,100000
+
+def _recipes(rng: random.Random, count: int) -> list[tuple]:
+    return [
+        (" ".join(rng.choices(WORDS, k=60)), rng.sample(INGREDIENT_NAMES, k=8), rng.randint(5, 180))
+        for _ in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", default="10000,100000", help="comma separated index sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    bits = settings.SIMILAR_FEATURE_BITS
+
+    for count in [int(c) for c in args.recipes.split(",")]:
+        recipes = _recipes(rng, count)
+        started = time.perf_counter()
+        raw_rows = [raw_features(document, names, cook_time, bits) for document, names, cook_time in recipes]
+        idf = compute_idf(raw_rows, bits)
+        indptr, indices, data = weigh(raw_rows, idf)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        directory = tempfile.mkdtemp(prefix="irms-similar-")
+        writer = SimilarityIndex(directory)
+        writer._write(np.arange(1, count + 1, dtype=np.int64), indptr, indices, data, idf)
+
+        index = SimilarityIndex(directory)
+        started = time.perf_counter()
+        index._map()
+        map_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            index.similar(rng.randint(1, count), 10)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        print(
+            f"{count:>8} recipes  {len(data):>10,} non-zeros  build {build_ms:>8.0f}ms  map {map_ms:>6.1f}ms  "
+            f"similar p50 {latencies[len(latencies) // 2]:>6.2f}ms  p95 {latencies[int(len(latencies) * 0.95)]:>6.2f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from backend.database import Recipe, Step, Ingredient, AsyncSessionLocal
+from backend.response_model import RecipeIn
+from backend import search, rendering, serialization
+
+# Bulk import and export of recipes as NDJSON (one JSON object per line).
+#
+# -- Import --
+# Lines are validated as RecipeIn and inserted in batches: one multi-row
+# INSERT ... RETURNING for the recipes of a batch, then one executemany
+# INSERT each for their steps and ingredients, and a single commit. Memory is
+# bounded by the batch size, not the size of the upload.
+#
+# -- Export --
+# Recipes are read through a server-side cursor (yield_per) in partitions,
+# with each partition's steps and ingredients fetched by one IN query each.
+# Every line can be posted back to the import endpoint as-is.
+
+async def iter_ndjson_lines(stream):
+    pending = b""
+    async for chunk in stream:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+# Splits a streamed request body into lines without reading it all into memory.
+
+def parse_line(line: bytes) -> RecipeIn:
+    return RecipeIn.model_validate_json(line)
+
+def insert_batch(db: Session, user_id: int, recipes: list[RecipeIn]) -> list[int]:
+    recipe_rows = [
+        {
+            "user_id": user_id,
+            "name": r.name,
+            "description": r.description,
+            "servings": r.servings,
+            "cook_time_min": r.cook_time_min,
+            "img_path": r.img_path or "",
+            "search_document": search.build_search_document(
+                r.name, r.description,
+                [s.instruction for s in r.steps],
+                [i.name for i in r.ingredients],
+            ),
+            "rendered_steps": rendering.render_step_inputs(r.steps),
+            "rendered_version": 1,
+        }
+        for r in recipes
+    ]
+    recipe_ids = db.scalars(
+        insert(Recipe).returning(Recipe.recipe_id, sort_by_parameter_order=True),
+        recipe_rows,
+    ).all()
+    # sort_by_parameter_order lines the returned ids up with the input rows
+
+    step_rows = [
+        {"recipe_id": rid, "step_number": n, "instruction": s.instruction, "img_path": s.img_path or ""}
+        for rid, r in zip(recipe_ids, recipes)
+        for n, s in enumerate(r.steps, start=1)
+    ]
+    ingredient_rows = [
+        {"recipe_id": rid, "name": i.name, "quantity": i.quantity, "unit": i.unit or ""}
+        for rid, r in zip(recipe_ids, recipes)
+        for i in r.ingredients
+    ]
+    if step_rows:
+        db.execute(insert(Step), step_rows)
+    if ingredient_rows:
+        db.execute(insert(Ingredient), ingredient_rows)
+    db.commit()
+    return list(recipe_ids)
+# Inserts a batch of recipes owned by user_id in one transaction. Returns their ids.
+
+def _export_record(recipe: Recipe) -> dict:
+    return {
+        "recipe_id": recipe.recipe_id,
+        "author": recipe.user.username,
+        "created_at": recipe.created_at.isoformat() if recipe.created_at else None,
+        "name": recipe.name,
+        "description": recipe.description,
+        "servings": recipe.servings,
+        "cook_time_min": recipe.cook_time_min,
+        "img_path": recipe.img_path,
+        "steps": [
+            {"instruction": s.instruction, "img_path": s.img_path}
+            for s in sorted(recipe.steps, key=lambda s: s.step_number or 0)
+        ],
+        "ingredients": [
+            {"name": i.name, "quantity": float(i.quantity), "unit": i.unit}
+            for i in recipe.ingredients
+        ],
+    }
+# Same field names as RecipeIn, plus read-only metadata the importer ignores.
+
+async def export_lines(batch_size: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(Recipe)
+            .options(
+                joinedload(Recipe.user),
+                selectinload(Recipe.steps),
+                selectinload(Recipe.ingredients),
+            )
+            .order_by(Recipe.recipe_id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.scalars().partitions():
+            yield b"".join(serialization.dumps(_export_record(r)) + b"\n" for r in partition)
+            # The identity map only holds weak references, so each partition is
+            # freed once the next one replaces it and the session stays small
+# Yields one chunk of NDJSON per partition of batch_size recipes.
+# Uses its own session, as the response is streamed after the endpoint returns.
@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+from backend import settings
+
+# Read-through cache for serialised recipe payloads.
+#
+# Endpoints look a key up first and only hit the database on a miss, storing
+# the JSON they produce for the next caller. Keys carry the recipe version,
+# which the endpoints read before consulting the cache, so an updated or
+# deleted recipe is never served from the cache. Writes also delete the keys
+# of the replaced version right away instead of waiting for eviction.
+#
+# Two interchangeable backends:
+# LRUCache   - in-process, size bounded (least recently used entries are
+#              evicted first) with a per-entry TTL. Each worker has its own.
+# RedisCache - a store shared by every worker. Takes any client with redis-py's
+#              get/set/delete methods; LocalRedis is an in-process stand-in
+#              for running without a Redis server.
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def incr(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "sets": self.sets,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+# Hit/miss counters, exposed at GET /cache/stats for monitoring.
+
+
+class LRUCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.incr("hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                # Expired
+        self.stats.incr("misses")
+        return None
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self.stats.incr("sets")
+        if evicted:
+            self.stats.incr("evictions", evicted)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        self.stats.incr("invalidations", len(keys))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalRedis:
+    def __init__(self):
+        self._data = {}  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[name]
+                return None
+            return entry[1]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(n, None) is not None for n in names)
+# Minimal in-process stand-in for a Redis client (get/set with expiry/delete).
+
+
+class RedisCache:
+    def __init__(self, client, ttl_seconds: float, prefix: str = "irms:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        self.stats.incr("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: bytes):
+        self.client.set(self.prefix + key, value, ex=max(1, int(self.ttl_seconds)))
+        self.stats.incr("sets")
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*(self.prefix + k for k in keys))
+        self.stats.incr("invalidations", len(keys))
+# Expiry and eviction are left to the Redis server (TTL plus its maxmemory policy).
+
+
+def _redis_client():
+    if settings.REDIS_URL:
+        try:
+            import redis
+        except ImportError:
+            return LocalRedis()
+        return redis.Redis.from_url(settings.REDIS_URL)
+    return LocalRedis()
+# The redis package is optional; without it (or without a URL) LocalRedis is used.
+
+def create_cache():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(_redis_client(), settings.CACHE_TTL_SECONDS)
+    return LRUCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+
+recipe_cache = create_cache()
+
+
+def recipe_key(recipe_id: int, version: int) -> str:
+    return f"recipe:{recipe_id}:v{version}"
+# Serialised RecipeOut for GET /recipes/{id}
+
+def steps_key(recipe_id: int, version: int) -> str:
+    return f"recipe:{recipe_id}:v{version}:steps"
+# Rendered steps for GET /recipes/{id}/render_steps
+# Keys include the recipe version, so whatever was cached for an old
+# version is never served once the version has moved on.
+
+def invalidate_recipe(recipe_id: int, version: int):
+    recipe_cache.delete(recipe_key(recipe_id, version), steps_key(recipe_id, version))
+# Called after a recipe is updated or deleted, with the version it had before.
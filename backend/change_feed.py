@@ -0,0 +1,368 @@
+import asyncio
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Optional
+from backend import images, settings
+
+# Change feed of recipes, streamed to clients at GET /recipes/changes.
+#
+# Creating, updating, deleting and bulk importing recipes publish a compact
+# event (what happened, the recipe id and version, and for a saved recipe
+# the fields a recipe card shows) to a broadcast bus. Every event gets a
+# sequence number, and the last IRMS_CHANGES_BUFFER events are kept in each
+# worker, so a client that lost its connection resumes from the last number
+# it saw instead of downloading its list again. A client further behind
+# than that is told to reload ("reset").
+#
+# Two interchangeable buses:
+# LocalBus   - numbers and delivers events within the worker. With several
+#              workers each has its own numbering and only sees its own writes.
+# PubSubBus  - numbers events with a shared counter (INCR) and broadcasts them
+#              over a pub/sub channel that every worker listens to, so any
+#              worker can resume any client. Takes any client with redis-py's
+#              incr/get/publish/pubsub methods; LocalPubSub is an in-process
+#              stand-in for running without a Redis server.
+#
+# In-process indexes that other workers' writes would leave stale (see
+# pantry.py) register with change_bus.watch(): with PubSubBus they are called
+# with each event published by another worker.
+
+class Subscriber:
+    def __init__(self, max_pending: int):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.max_pending = max_pending
+        self.overflowed = False
+
+    def deliver(self, item):
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.max_pending:
+            self.overflowed = True
+            item = None
+        self.queue.put_nowait(item)
+    # Runs on the subscriber's event loop. A client that reads slower than
+    # changes arrive is cut off (None) and resumes from the buffer when it reconnects.
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int):
+        self._events = deque(maxlen=buffer_size)  # (seq, frame), oldest first
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.floor = 0
+        self.last_seq = 0
+        self.published = 0
+        self.cut_off = 0
+
+    def skip_to(self, seq: int):
+        with self._lock:
+            self.floor = max(self.floor, seq)
+            self.last_seq = max(self.last_seq, seq)
+    # Continues the numbering from seq, a shared counter's current value.
+    # Clients that resume from before it are reset: its events weren't received.
+
+    def append(self, seq: int, frame: bytes):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.floor = max(self.floor, self._events[0][0])
+            self._events.append((seq, frame))
+            self.last_seq = max(self.last_seq, seq)
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, (seq, frame))
+            except RuntimeError:
+                pass
+            # Its event loop was closed without the stream ending
+    # Safe from any thread: delivery is handed to each subscriber's own loop.
+
+    def since(self, seq: int) -> Optional[list[tuple[int, bytes]]]:
+        with self._lock:
+            if seq < self.floor or seq > self.last_seq:
+                return None
+            return [(s, frame) for s, frame in self._events if s > seq]
+    # Events after seq, or None when they can't all be replayed: older ones
+    # were dropped from the buffer, or seq comes from another numbering
+    # (a restarted worker, or another worker of the memory bus).
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self._events.maxlen)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.cut_off += subscriber.overflowed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "last_seq": self.last_seq,
+                "buffered": len(self._events),
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "cut_off": self.cut_off,
+            }
+# Recent events of this worker and the clients streaming them.
+
+
+def _frame(seq: int, event: dict) -> bytes:
+    data = json.dumps({"seq": seq, **event}, separators=(",", ":"))
+    return f"id: {seq}\nevent: change\ndata: {data}\n\n".encode()
+# One server-sent event; the id is what the browser sends back as Last-Event-ID.
+
+
+class LocalBus:
+    def __init__(self, feed: ChangeFeed):
+        self.feed = feed
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def publish(self, event: dict):
+        with self._lock:
+            seq = next(self._seq)
+            self.feed.append(seq, _frame(seq, event))
+
+    def watch(self, callback):
+        pass
+    # No other worker publishes here, so watchers are never called.
+
+    def close(self):
+        pass
+
+
+class LocalPubSub:
+    def __init__(self):
+        self._data = {}
+        self._channels = {}  # channel -> set of subscribed queues
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            return self._data.get(name)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._data.get(name, 0)) + amount
+            self._data[name] = str(value).encode()
+            return value
+
+    def publish(self, channel, message):
+        with self._lock:
+            receivers = list(self._channels.get(channel, ()))
+        for receiver in receivers:
+            receiver.put(message if isinstance(message, bytes) else str(message).encode())
+        return len(receivers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _LocalSubscription(self)
+
+
+class _LocalSubscription:
+    def __init__(self, client: LocalPubSub):
+        self._client = client
+        self._queue = queue.SimpleQueue()
+        self._channels = []
+
+    def subscribe(self, *channels):
+        with self._client._lock:
+            for channel in channels:
+                self._client._channels.setdefault(channel, set()).add(self._queue)
+                self._channels.append(channel)
+
+    def listen(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            yield {"type": "message", "data": data}
+
+    def close(self):
+        with self._client._lock:
+            for channel in self._channels:
+                self._client._channels.get(channel, set()).discard(self._queue)
+        self._queue.put(None)
+# Minimal in-process stand-in for a Redis client's counters and pub/sub
+# (incr/get/publish, pubsub() with subscribe/listen/close).
+
+
+class PubSubBus:
+    def __init__(self, feed: ChangeFeed, client, prefix: str = "irms:changes"):
+        self.feed = feed
+        self.client = client
+        self.channel = prefix
+        self.seq_key = prefix + ":seq"
+        self.origin = os.urandom(8).hex().encode()
+        self._watchers = []
+        self._subscription = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _subscribe(self):
+        self._subscription = self.client.pubsub(ignore_subscribe_messages=True)
+        self._subscription.subscribe(self.channel)
+        self.feed.skip_to(int(self.client.get(self.seq_key) or 0))
+    # Subscribed before reading the counter, so no event falls in between.
+
+    def watch(self, callback):
+        self._watchers.append(callback)
+    # callback(event) runs on the listener thread for every event published by
+    # another worker, and callback(None) when events may have been missed.
+
+    def _notify(self, event):
+        for callback in self._watchers:
+            callback(event)
+
+    def start(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._subscribe()
+                    self._thread = threading.Thread(target=self._listen, name="irms-changes", daemon=True)
+                    self._thread.start()
+    # Started with the API, or at the latest by the first publish or subscriber.
+
+    def _listen(self):
+        while self._thread is not None:
+            try:
+                for message in self._subscription.listen():
+                    if message["type"] != "message":
+                        continue
+                    header, _, frame = message["data"].partition(b"\n")
+                    seq, _, origin = header.partition(b" ")
+                    self.feed.append(int(seq), frame)
+                    if origin != self.origin and self._watchers:
+                        self._notify(json.loads(frame.split(b"\ndata: ", 1)[1]))
+                return
+            except Exception:
+                if self._thread is None:
+                    return
+                # Closing the subscription at shutdown ends listen() with an error on redis-py
+                time.sleep(1.0)
+                try:
+                    self._subscribe()
+                except Exception:
+                    continue
+                self._notify(None)
+        # Lost connection to the server: subscribes again, skipping the events missed meanwhile
+
+    def publish(self, event: dict):
+        self.start()
+        seq = self.client.incr(self.seq_key)
+        self.client.publish(self.channel, b"%d %s\n%s" % (seq, self.origin, _frame(seq, event)))
+    # Every worker, this one included, adds the event to its feed when it
+    # arrives on the channel. The origin tells a worker's own events apart.
+
+    def close(self):
+        if self._thread is not None:
+            thread, self._thread = self._thread, None
+            self._subscription.close()
+            thread.join(1.0)
+
+
+def _pubsub_client():
+    if settings.REDIS_URL:
+        try:
+            import redis
+        except ImportError:
+            return LocalPubSub()
+        return redis.Redis.from_url(settings.REDIS_URL)
+    return LocalPubSub()
+# The redis package is optional; without it (or without a URL) LocalPubSub is used.
+
+def create_bus():
+    feed = ChangeFeed(settings.CHANGES_BUFFER)
+    if settings.CHANGES_BACKEND == "redis":
+        return PubSubBus(feed, _pubsub_client())
+    return LocalBus(feed)
+
+change_bus = create_bus()
+
+
+def card(recipe, username: str) -> dict:
+    return {
+        "name": recipe.name,
+        "description": recipe.description,
+        "servings": recipe.servings,
+        "cook_time_min": recipe.cook_time_min,
+        "img_path": recipe.img_path,
+        "thumbnail_path": images.thumbnail_url(recipe.img_path),
+        "user": {"user_id": recipe.user_id, "username": username},
+    }
+# The fields of RecipeSummaryOut a recipe card shows, from a saved Recipe.
+
+def recipe_saved(op: str, recipe, username: str):
+    change_bus.publish({
+        "op": op,
+        "recipe_id": recipe.recipe_id,
+        "user_id": recipe.user_id,
+        "version": recipe.version,
+        "recipe": card(recipe, username),
+    })
+# op is "created" or "updated". Called after the commit.
+
+def recipe_deleted(recipe_id: int, user_id: int):
+    change_bus.publish({"op": "deleted", "recipe_id": recipe_id, "user_id": user_id})
+
+def recipes_imported(user_id: int, count: int):
+    change_bus.publish({"op": "imported", "user_id": user_id, "count": count})
+# A bulk import is a single event: clients showing the importer's recipes reload their list.
+
+
+def _control(name: str, seq: int) -> bytes:
+    return f"id: {seq}\nevent: {name}\ndata: {json.dumps({'seq': seq})}\n\n".encode()
+
+async def stream(since: Optional[int]):
+    change_bus.start()
+    feed = change_bus.feed
+    subscriber = feed.subscribe()
+    try:
+        sent = set()
+        if since is None:
+            start = feed.last_seq
+            yield b"retry: 3000\n" + _control("ready", start)
+        else:
+            backlog = feed.since(since)
+            if backlog is None:
+                start = feed.last_seq
+                yield _control("reset", start)
+            else:
+                start = since
+                for seq, frame in backlog:
+                    sent.add(seq)
+                    yield frame
+        # Subscribed before reading the backlog, so events arriving meanwhile
+        # are queued; those already sent are skipped below
+
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.get(), settings.CHANGES_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if item is None:
+                return
+            seq, frame = item
+            if seq > start and seq not in sent:
+                yield frame
+    finally:
+        feed.unsubscribe(subscriber)
+# Body of GET /recipes/changes. A new client first gets "ready" with the
+# current sequence number, a resuming one the events it missed, or "reset"
+# when they are no longer buffered. Then changes as they happen, and a
+# comment line when idle so proxies keep the connection open.
@@ -0,0 +1,56 @@
+from starlette.middleware.gzip import GZipMiddleware
+from backend import settings
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Response compression.
+#
+# Recipe listings are mostly repeated step and ingredient text and shrink by
+# 5-10x with gzip. Responses smaller than IRMS_COMPRESSION_MIN_BYTES are sent
+# as they are, where compressing costs more time than the bytes it saves.
+#
+# Clients that accept Brotli ("br") get it when the optional brotli-asgi
+# package is installed, everyone else gets gzip. Already compressed files
+# (images under /media and /static/images) are never recompressed, nor is the
+# change feed: compressed events would be held back until a block fills up.
+
+_UNCOMPRESSED_PATHS = [r"^/media/", r"^/static/images/", r"^/recipes/changes$"]
+
+def _accepts(scope, coding: str) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"accept-encoding":
+            codings = [c.split(b";")[0].strip() for c in value.split(b",")]
+            return coding.encode() in codings
+    return False
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int, gzip_level: int, brotli_quality: int):
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=gzip_level)
+        # Starlette already skips image/audio/video and event-stream content types and compresses large bodies off the event loop
+        self.brotli = None
+        if BrotliMiddleware is not None:
+            self.brotli = BrotliMiddleware(
+                app,
+                quality=brotli_quality,
+                minimum_size=minimum_size,
+                gzip_fallback=False,
+                excluded_handlers=_UNCOMPRESSED_PATHS,
+            )
+
+    async def __call__(self, scope, receive, send):
+        if self.brotli is not None and scope["type"] == "http" and _accepts(scope, "br"):
+            await self.brotli(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+def add_compression(app):
+    if settings.COMPRESSION:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MIN_BYTES,
+            gzip_level=settings.GZIP_LEVEL,
+            brotli_quality=settings.BROTLI_QUALITY,
+        )
@@ -0,0 +1,66 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+# Conditional GET support (ETag / If-None-Match, Last-Modified / If-Modified-Since).
+#
+# Every recipe has a version that update_recipe bumps, so an ETag can be
+# built from (recipe_id, version) alone. The endpoints read just those columns
+# first (one indexed lookup) and answer 304 Not Modified when the client
+# already holds the current version, skipping the full load and serialisation.
+
+def recipe_etag(recipe_id: int, version: int, variant: str = "") -> str:
+    return f'"r{recipe_id}-v{version}{variant}"'
+# Strong ETag for a single recipe. variant tells apart different
+# representations of the same version (e.g. "-steps" for rendered steps).
+
+def list_etag(scope: str, rows) -> str:
+    digest = hashlib.sha1(scope.encode())
+    for recipe_id, version in rows:
+        digest.update(f"{recipe_id}:{version};".encode())
+    return f'"l-{digest.hexdigest()}"'
+# ETag for a list of recipes: changes whenever a recipe in the list is
+# added, removed, reordered or updated. scope keeps different lists apart.
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+# Timestamps are stored without a timezone and treated as UTC.
+
+def latest(values):
+    present = [v for v in values if v is not None]
+    return max(present) if present else None
+
+def cache_headers(etag: str, last_modified: datetime = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # no-cache: clients may store the response but must revalidate before reuse
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    # If-None-Match takes precedence over If-Modified-Since when both are sent
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # A "-0000" zone parses to a naive datetime; it still means UTC
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+        # HTTP dates only have second precision
+    return False
+
+def not_modified_response(etag: str, last_modified: datetime = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
@@ -0,0 +1,123 @@
+from typing import Optional
+from sqlalchemy import Float, case, cast, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import RecipeRating, RecipeComment, RecipeReport, RecipeStats
+
+# Ratings, comments and abuse reports of recipes, with their aggregates.
+#
+# Each write also adjusts the recipe's row in recipe_stats in the same
+# transaction: a rating adds to rating_count / rating_sum and recomputes
+# rating_avg, a comment or report adds to its count. The adjustment is a
+# single "SET rating_sum = rating_sum + :delta" UPDATE, so concurrent writes
+# to the same recipe never overwrite each other's counts, and reading a
+# recipe's average or listing the best rated recipes never scans the ratings.
+#
+# None of these functions commit; the endpoint commits once at the end.
+
+class AlreadyReported(ValueError):
+    pass
+# The user has reported this recipe before.
+
+_AGGREGATES = ("rating_count", "rating_sum", "comment_count", "report_count")
+
+def _average(count, total):
+    return case((count > 0, cast(total, Float) / count), else_=0.0)
+
+async def _adjust(db: AsyncSession, recipe_id: int, **deltas):
+    values = {name: getattr(RecipeStats, name) + delta for name, delta in deltas.items()}
+    if "rating_count" in deltas or "rating_sum" in deltas:
+        values["rating_avg"] = _average(
+            RecipeStats.rating_count + deltas.get("rating_count", 0),
+            RecipeStats.rating_sum + deltas.get("rating_sum", 0),
+        )
+    # In an UPDATE every column on the right-hand side is its old value
+    statement = update(RecipeStats).where(RecipeStats.recipe_id == recipe_id).values(**values)
+    if (await db.execute(statement)).rowcount:
+        return
+
+    initial = {name: deltas.get(name, 0) for name in _AGGREGATES}
+    count, total = initial["rating_count"], initial["rating_sum"]
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(RecipeStats).values(
+                recipe_id=recipe_id, rating_avg=total / count if count else 0.0, **initial,
+            ))
+    except IntegrityError:
+        await db.execute(statement)
+    # First interaction with the recipe: creates its row. If a concurrent
+    # request created it first, the insert fails and the update is applied.
+
+async def stats(db: AsyncSession, recipe_id: int) -> Optional[RecipeStats]:
+    return await db.scalar(
+        select(RecipeStats).where(RecipeStats.recipe_id == recipe_id).execution_options(populate_existing=True)
+    )
+# None for a recipe nobody has rated, commented on or reported yet.
+# populate_existing: the counts were changed by UPDATE statements in this session.
+
+def _own_rating(recipe_id: int, user_id: int):
+    return (
+        select(RecipeRating)
+        .where(RecipeRating.recipe_id == recipe_id, RecipeRating.user_id == user_id)
+        .with_for_update()
+    )
+# Locks the user's rating (on PostgreSQL) so two requests can't both change it.
+
+async def rate(db: AsyncSession, recipe_id: int, user_id: int, value: int):
+    rating = await db.scalar(_own_rating(recipe_id, user_id))
+    if rating is None:
+        try:
+            async with db.begin_nested():
+                db.add(RecipeRating(recipe_id=recipe_id, user_id=user_id, value=value))
+        except IntegrityError:
+            rating = await db.scalar(_own_rating(recipe_id, user_id))
+            # The same user's concurrent request inserted first: change that rating instead
+        else:
+            await _adjust(db, recipe_id, rating_count=1, rating_sum=value)
+            return
+
+    delta = value - rating.value
+    if delta:
+        rating.value = value
+        await _adjust(db, recipe_id, rating_sum=delta)
+# Adds the user's rating of the recipe, or changes it if they rated it before.
+
+async def unrate(db: AsyncSession, recipe_id: int, user_id: int) -> bool:
+    value = await db.scalar(
+        delete(RecipeRating)
+        .where(RecipeRating.recipe_id == recipe_id, RecipeRating.user_id == user_id)
+        .returning(RecipeRating.value)
+    )
+    if value is None:
+        return False
+    await _adjust(db, recipe_id, rating_count=-1, rating_sum=-value)
+    return True
+# Removes the user's rating. False if they hadn't rated the recipe.
+
+async def add_comment(db: AsyncSession, recipe_id: int, user_id: int, body: str) -> RecipeComment:
+    comment = RecipeComment(recipe_id=recipe_id, user_id=user_id, body=body)
+    db.add(comment)
+    await db.flush()
+    await _adjust(db, recipe_id, comment_count=1)
+    return comment
+
+async def delete_comment(db: AsyncSession, comment: RecipeComment):
+    await db.delete(comment)
+    await db.flush()
+    await _adjust(db, comment.recipe_id, comment_count=-1)
+
+async def report(db: AsyncSession, recipe_id: int, user_id: int, reason: str) -> RecipeReport:
+    abuse_report = RecipeReport(recipe_id=recipe_id, user_id=user_id, reason=reason)
+    try:
+        async with db.begin_nested():
+            db.add(abuse_report)
+    except IntegrityError:
+        raise AlreadyReported("You have already reported this recipe")
+    await _adjust(db, recipe_id, report_count=1)
+    return abuse_report
+
+async def recipe_deleted(db: AsyncSession, recipe_id: int):
+    for model in (RecipeRating, RecipeComment, RecipeReport, RecipeStats):
+        await db.execute(delete(model).where(model.recipe_id == recipe_id))
+# Removes everything attached to a recipe that is being deleted. The foreign
+# keys cascade on PostgreSQL as well, but SQLite doesn't enforce them by default.
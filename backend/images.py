@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Optional
+from starlette.staticfiles import StaticFiles
+from backend import settings
+from backend.worker_pool import WorkerPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Image uploads, stored content-addressed.
+#
+# An upload is named after the SHA-256 of its bytes:
+#
+#   <IRMS_IMAGE_DIR>/ab/ab12...ef/original.jpg   - the uploaded file, as sent
+#   <IRMS_IMAGE_DIR>/ab/ab12...ef/w320.webp      - one WebP variant per IRMS_IMAGE_WIDTHS
+#
+# Uploading the same image twice stores it once. Since a file's name is its
+# content, a URL never changes meaning, so everything under /media is served
+# with a one year "immutable" Cache-Control: browsers and proxies keep it
+# without ever revalidating. Recipe cards use the smallest variant (see
+# RecipeSummaryOut.thumbnail_path) rather than the full-size image.
+#
+# Resizing is CPU-bound and runs in image_pool, a WorkerPool (see worker_pool.py).
+# Pillow is optional: without it uploads are still stored, but no variants are made.
+
+class InvalidImage(ValueError):
+    pass
+# The upload isn't a JPEG, PNG, GIF or WebP image (or can't be decoded).
+
+_SIGNATURES = {
+    b"\xff\xd8\xff": "jpg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+}
+
+def sniff(data: bytes) -> Optional[str]:
+    for signature, extension in _SIGNATURES.items():
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+# File extension for the image type, read from the first bytes rather than
+# trusting the uploaded file name or Content-Type.
+
+def variant_name(width: int) -> str:
+    return f"w{width}.webp"
+
+def variants_enabled() -> bool:
+    return Image is not None and bool(settings.IMAGE_WIDTHS)
+
+@dataclass
+class StoredImage:
+    digest: str
+    original: str
+    variants: dict[int, str] = field(default_factory=dict)
+
+    def path(self, name: str) -> str:
+        return f"{self.digest[:2]}/{self.digest}/{name}"
+# Paths are relative to IRMS_IMAGE_DIR, i.e. to the /media mount.
+
+def _directory(digest: str) -> str:
+    return os.path.join(settings.IMAGE_DIR, digest[:2], digest)
+
+def _write_atomic(path: str, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+# Readers never see a half written file: it only appears under its final name once complete.
+
+def save_original(data: bytes) -> tuple[StoredImage, bool]:
+    extension = sniff(data)
+    if extension is None:
+        raise InvalidImage("Only JPEG, PNG, GIF and WebP images can be uploaded")
+    digest = hashlib.sha256(data).hexdigest()
+    image = StoredImage(digest, f"original.{extension}")
+
+    path = os.path.join(_directory(digest), image.original)
+    if os.path.exists(path):
+        return image, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, lambda f: f.write(data))
+    return image, True
+# Returns the stored image and whether it is new (False when the same bytes were uploaded before).
+
+def make_variants(original_path: str, widths: list[int]) -> list[int]:
+    directory = os.path.dirname(original_path)
+    todo = [w for w in sorted(set(widths), reverse=True)
+            if not os.path.exists(os.path.join(directory, variant_name(w)))]
+    if not todo:
+        return sorted(widths)
+    try:
+        with Image.open(original_path) as source:
+            source.draft("RGB", (todo[0], todo[0]))
+            # JPEGs are decoded straight at a reduced scale, when still larger than needed
+            image = ImageOps.exif_transpose(source)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info else "RGB")
+            for width in todo:
+                if image.width > width:
+                    image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                # Never upscaled. Each size is made from the previous, larger one.
+                _write_atomic(
+                    os.path.join(directory, variant_name(width)),
+                    lambda f: image.save(f, "WEBP", quality=80, method=4),
+                )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise InvalidImage("The image could not be read")
+    return sorted(widths)
+# Runs in a worker process. Variants that already exist are left alone.
+
+async def store(data: bytes) -> StoredImage:
+    image, created = await asyncio.to_thread(save_original, data)
+    if variants_enabled():
+        try:
+            widths = await image_pool.make_variants(
+                os.path.join(_directory(image.digest), image.original), settings.IMAGE_WIDTHS,
+            )
+        except InvalidImage:
+            if created:
+                await asyncio.to_thread(shutil.rmtree, _directory(image.digest), True)
+            raise
+        image.variants = {w: variant_name(w) for w in widths}
+    return image
+# Stores an upload and makes its variants. Raises InvalidImage or PoolBusy.
+
+_ORIGINAL_URL = re.compile(r"^(?P<base>[^?#]*/media/[0-9a-f]{2}/[0-9a-f]{64}/)original\.[a-z]+$")
+
+def thumbnail_url(img_path: Optional[str]) -> Optional[str]:
+    if not img_path or img_path.startswith("data:") or not variants_enabled():
+        return None
+    match = _ORIGINAL_URL.match(img_path)
+    if match is None:
+        return None
+    return match["base"] + variant_name(min(settings.IMAGE_WIDTHS))
+# The card thumbnail of an uploaded image's URL, None for any other img_path
+# (the default image, external URLs, inline data: URLs).
+
+class ImmutableStaticFiles(StaticFiles):
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+# StaticFiles for content-addressed files: cacheable for a year, never revalidated.
+
+class ImageResizer(WorkerPool):
+    busy_detail = "Too many image uploads in progress, please try again shortly"
+
+    async def make_variants(self, original_path: str, widths: list[int]) -> list[int]:
+        return await self.run(make_variants, original_path, widths)
+
+image_pool = ImageResizer(settings.IMAGE_WORKERS, settings.IMAGE_MAX_PENDING)
@@ -0,0 +1,25 @@
+from backend.database import DATABASE_URL, SessionLocal, init_db
+from backend.rendering import render_stale
+from backend.search import backfill_search_documents
+from backend.similarity import similarity_index
+from sqlalchemy import make_url
+
+# Brings the database schema up to date (applies the pending migrations, see
+# migrations/__init__.py), fills in the search documents and rendered steps
+# of recipes that don't have them stored yet and rebuilds the similar
+# recipes index.
+# Run once per deployment, before starting the API workers:
+#
+#   python -m backend.init_db
+
+if __name__ == "__main__":
+    applied = init_db()
+    print(f"Migrated {make_url(DATABASE_URL).render_as_string(hide_password=True)}")
+    for version, name in applied:
+        print(f"  applied {version} {name}")
+    if not applied:
+        print("  already up to date")
+    with SessionLocal() as db:
+        print(f"Built the search documents of {backfill_search_documents(db)} recipes")
+        print(f"Rendered the steps of {render_stale(db)} recipes")
+        print(f"Indexed {similarity_index.build(db)} recipes for similar recipes")
@@ -0,0 +1,104 @@
+from functools import lru_cache
+import numpy as np
+from backend.pantry import normalize_ingredient
+
+# Shopping lists for meal plans: many recipes, each scaled to a number of servings.
+#
+# Every ingredient row of the planned recipes is turned into three numbers:
+#   * its quantity in the base unit of its dimension (g, ml or pieces), from
+#     the conversion table below ("2 tbsp" -> 30 ml, "1 lb" -> 453.59 g),
+#   * the scale of its recipe (planned servings / recipe servings, summed when a
+#     recipe is planned more than once),
+#   * a line number: rows with the same normalised name and dimension share a
+#     line ("Tomatoes" and "tomato" in g are one line, tomato in pieces another).
+# The list is then a single np.bincount over the line numbers, weighted by
+# quantity x factor x scale. Units that aren't in the table are kept apart,
+# summed only with the same unit.
+#
+# Mass and volume aren't converted into each other: "100 g flour" and "1 cup
+# flour" stay two lines, since that needs the ingredient's density.
+
+MASS, VOLUME, COUNT = "g", "ml", ""
+
+UNITS = {
+    "g": (MASS, 1.0), "gram": (MASS, 1.0), "kg": (MASS, 1000.0), "kilogram": (MASS, 1000.0),
+    "mg": (MASS, 0.001), "oz": (MASS, 28.3495), "ounce": (MASS, 28.3495),
+    "lb": (MASS, 453.592), "lbs": (MASS, 453.592), "pound": (MASS, 453.592),
+    "ml": (VOLUME, 1.0), "millilitre": (VOLUME, 1.0), "milliliter": (VOLUME, 1.0),
+    "cl": (VOLUME, 10.0), "dl": (VOLUME, 100.0),
+    "l": (VOLUME, 1000.0), "litre": (VOLUME, 1000.0), "liter": (VOLUME, 1000.0),
+    "tsp": (VOLUME, 5.0), "teaspoon": (VOLUME, 5.0),
+    "tbsp": (VOLUME, 15.0), "tablespoon": (VOLUME, 15.0),
+    "cup": (VOLUME, 250.0), "fl oz": (VOLUME, 29.5735), "pint": (VOLUME, 473.176),
+    "": (COUNT, 1.0), "pc": (COUNT, 1.0), "pcs": (COUNT, 1.0), "piece": (COUNT, 1.0),
+    "each": (COUNT, 1.0), "whole": (COUNT, 1.0),
+}
+# unit -> (dimension, size in the dimension's base unit). Metric cups and spoons.
+
+DISPLAY = {MASS: [(1000.0, "kg")], VOLUME: [(1000.0, "l")]}
+# Totals at or over the threshold are shown in the larger unit (1500 g -> 1.5 kg).
+
+@lru_cache(maxsize=1024)
+def parse_unit(unit: str) -> tuple[str, float]:
+    key = normalize_ingredient(unit)
+    # Same case and plural folding as ingredient names: "Cups" -> "cup", "pinches" -> "pinch"
+    return UNITS.get(key, (key, 1.0))
+# Unknown units are their own dimension ("pinch", "can"), summed with the same unit only.
+
+_normalize = lru_cache(maxsize=8192)(normalize_ingredient)
+# Ingredient names repeat across recipes, each distinct one is normalised once.
+
+def _display(total: float, dimension: str) -> tuple[float, str]:
+    for threshold, unit in DISPLAY.get(dimension, ()):
+        if total >= threshold:
+            return total / threshold, unit
+    return total, dimension
+
+def recipe_scales(entries, recipe_servings: dict[int, int]) -> dict[int, float]:
+    scales = {}
+    for recipe_id, servings in entries:
+        if recipe_id not in recipe_servings:
+            continue
+        base = recipe_servings[recipe_id]
+        scale = servings / base if servings and base else 1.0
+        scales[recipe_id] = scales.get(recipe_id, 0.0) + scale
+    return scales
+# entries: (recipe_id, servings or None) per planned meal; a recipe planned twice
+# adds up. No servings (or a recipe without a serving count) means as written.
+# Recipes that don't exist are left out.
+
+def shopping_list(rows, scales: dict[int, float]) -> list[dict]:
+    if not rows:
+        return []
+    lines, line_of, line_recipes = [], {}, []
+    codes = np.empty(len(rows), dtype=np.int64)
+    factors = np.empty(len(rows), dtype=np.float64)
+    for i, (recipe_id, name, _, unit) in enumerate(rows):
+        dimension, factors[i] = parse_unit(unit)
+        key = (_normalize(name), dimension)
+        code = line_of.get(key)
+        if code is None:
+            code = line_of[key] = len(lines)
+            lines.append(key)
+            line_recipes.append(set())
+        codes[i] = code
+        line_recipes[code].add(recipe_id)
+    # The only per-row Python work: mapping names and units to integer codes
+
+    quantities = np.fromiter((float(r[2]) for r in rows), dtype=np.float64, count=len(rows))
+    scale = np.fromiter((scales[r[0]] for r in rows), dtype=np.float64, count=len(rows))
+    totals = np.bincount(codes, weights=quantities * factors * scale, minlength=len(lines))
+
+    items = []
+    for code in sorted(range(len(lines)), key=lines.__getitem__):
+        name, dimension = lines[code]
+        quantity, unit = _display(float(totals[code]), dimension)
+        items.append({
+            "name": name,
+            "quantity": round(quantity, 2),
+            "unit": unit,
+            "recipe_ids": sorted(line_recipes[code]),
+        })
+    return items
+# rows: (recipe_id, name, quantity, unit) of every ingredient of the planned
+# recipes, scales from recipe_scales(). Returns the merged list sorted by name.
@@ -0,0 +1,199 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import event
+
+# Per-request instrumentation, exposed in the Prometheus text format on /metrics.
+#
+# MetricsMiddleware wraps every HTTP request in a RequestStats, held in a
+# context variable so that code deep inside the request can add to it without
+# it being passed around:
+#
+#   sql_queries / sql_seconds - statements sent to the database and the time spent
+#                               executing them (engine events, see instrument_engine)
+#   serialize_seconds         - building JSON bodies (serialization.model_json)
+#   log_seconds               - handing audit records to the log writer
+#
+# When the response is finished these go into histograms labelled with the
+# method, the route template ("/recipes/{recipe_id}", not the actual path, so
+# the number of series stays bounded) and the status code. Everything is per
+# worker process; Prometheus sums the workers when each one is scraped.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+# Upper bounds of the histogram buckets, in seconds / queries
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        bucket = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+# Buckets are stored individually and made cumulative when rendered.
+
+class Registry:
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        histogram = Histogram(*args, **kwargs)
+        self._histograms.append(histogram)
+        return histogram
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+    # fn() returns [(name, type, documentation, value)], read at scrape time.
+    # Used for numbers other modules already keep (pool, cache, writer stats).
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collect in self._collectors:
+            for name, kind, documentation, value in collect():
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_LABELS = ("method", "route", "status")
+request_seconds = registry.histogram(
+    "irms_http_request_duration_seconds", "Time to answer a request, until the last byte is sent.",
+    LATENCY_BUCKETS, REQUEST_LABELS)
+request_queries = registry.histogram(
+    "irms_http_request_sql_queries", "SQL statements executed per request.",
+    QUERY_BUCKETS, REQUEST_LABELS)
+request_sql_seconds = registry.histogram(
+    "irms_http_request_sql_seconds", "Time spent executing SQL statements per request.",
+    LATENCY_BUCKETS, REQUEST_LABELS)
+request_serialize_seconds = registry.histogram(
+    "irms_http_request_serialize_seconds", "Time spent serialising JSON bodies per request.",
+    LATENCY_BUCKETS, REQUEST_LABELS)
+request_log_seconds = registry.histogram(
+    "irms_http_request_log_seconds", "Time spent queueing audit log records per request.",
+    LATENCY_BUCKETS, REQUEST_LABELS)
+log_batch_seconds = registry.histogram(
+    "irms_log_batch_write_seconds", "Time the background log writer takes to write one batch.",
+    LATENCY_BUCKETS, ("file",))
+
+
+@dataclass
+class RequestStats:
+    sql_queries: int = 0
+    sql_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+    log_seconds: float = 0.0
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("irms_request_stats", default=None)
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+# None outside a request (scripts, benchmarks, background threads).
+
+@contextmanager
+def timed(field: str):
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(stats, field, getattr(stats, field) + time.perf_counter() - started)
+# Adds the time spent in the block to a field of the current request's stats.
+
+def instrument_engine(engine):
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._irms_started = time.perf_counter()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is not None:
+            stats.sql_queries += 1
+            stats.sql_seconds += time.perf_counter() - context._irms_started
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+# For an async engine, pass engine.sync_engine. Events run inside the request's
+# context even with the async engine, so they find its RequestStats.
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+# Set by the router once a route matched; 404s for unknown paths share one label.
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        # Reported if the app fails before sending a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            labels = (scope["method"], _route(scope), str(status))
+            request_seconds.observe(elapsed, *labels)
+            request_queries.observe(stats.sql_queries, *labels)
+            request_sql_seconds.observe(stats.sql_seconds, *labels)
+            request_serialize_seconds.observe(stats.serialize_seconds, *labels)
+            request_log_seconds.observe(stats.log_seconds, *labels)
+# A plain ASGI middleware rather than BaseHTTPMiddleware: streamed responses
+# pass straight through, and the latency includes sending the whole body.
@@ -0,0 +1,10 @@
+from backend.database import Base
+
+# Creates the tables of the models that don't exist yet, with their indexes.
+# On a new database this is the whole current schema. On one created before
+# migrations existed (setup.sql, or create_all by an older version) it only
+# adds the missing tables; existing tables are brought up to date by the
+# migrations that follow.
+
+def upgrade(connection):
+    Base.metadata.create_all(connection)
@@ -0,0 +1,27 @@
+from sqlalchemy import inspect, text
+
+# Adds the recipe columns introduced after the original schema (setup.sql):
+# updated_at and version (ETags), search_document (full-text search) and
+# rendered_steps / rendered_version (stored step rendering). python -m
+# backend.init_db fills search_document and the rendered steps afterwards.
+
+COLUMNS = {
+    "updated_at": "TIMESTAMP",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+    "search_document": "TEXT",
+    "rendered_steps": "TEXT",
+    "rendered_version": "INTEGER",
+}
+
+def upgrade(connection):
+    existing = {column["name"] for column in inspect(connection).get_columns("recipes")}
+    for name, definition in COLUMNS.items():
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE recipes ADD COLUMN {name} {definition}"))
+
+    if "updated_at" not in existing:
+        connection.execute(text("UPDATE recipes SET updated_at = created_at"))
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("ALTER TABLE recipes ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP"))
+    # SQLite can't add a column with a non-constant default; the model's
+    # onupdate still sets it on every update there
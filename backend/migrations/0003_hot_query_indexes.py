@@ -0,0 +1,90 @@
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+from backend.database import Base
+
+# Indexes for the queries every request runs, on databases created before
+# the models declared them (create_all only indexes the tables it creates):
+#
+#   ix_recipes_user_id_recipe_id     /my_recipes and the author filter
+#   ix_steps_recipe_id_step_number   loading a recipe's steps in order, and
+#                                    deleting them; also makes step numbers
+#                                    unique within a recipe
+#   ix_ingredients_recipe_id         loading and deleting a recipe's ingredients
+#
+# together with the indexes added earlier without a migration (unique
+# usernames, the listing's keyset index, ingredient name and full-text search).
+#
+# Steps with duplicate or missing numbers are renumbered 1..n in their
+# current order first, or the unique index couldn't be built. Duplicate
+# usernames can't be resolved automatically: the migration stops and lists them.
+#
+# Each CREATE INDEX blocks writes to its table while it runs. On a large
+# PostgreSQL database, create them beforehand with CREATE INDEX CONCURRENTLY
+# under the same names; they are then skipped here.
+
+INDEXES = [
+    ("ix_users_username", None),
+    ("ix_recipes_created_at_recipe_id", None),
+    ("ix_recipes_user_id_recipe_id", None),
+    ("ix_recipes_search_document", "postgresql"),
+    ("ix_steps_recipe_id_step_number", None),
+    ("ix_ingredients_recipe_id", None),
+    ("ix_ingredients_name_lower", None),
+]
+# (name, the only dialect it is created on)
+
+def _index(name: str):
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise LookupError(name)
+
+def _check_usernames(connection):
+    users = Base.metadata.tables["users"]
+    duplicates = connection.scalars(
+        select(users.c.username).group_by(users.c.username).having(func.count() > 1)
+    ).all()
+    if duplicates:
+        raise RuntimeError(
+            "Usernames must be unique, rename or remove the duplicate users first: " + ", ".join(duplicates)
+        )
+
+def _renumber_steps(connection):
+    steps = Base.metadata.tables["steps"]
+    recipe_ids = connection.scalars(
+        select(steps.c.recipe_id)
+        .group_by(steps.c.recipe_id)
+        .having(
+            (func.count(steps.c.step_number) < func.count())
+            | (func.count(steps.c.step_number.distinct()) < func.count(steps.c.step_number))
+        )
+    ).all()
+    for recipe_id in recipe_ids:
+        step_ids = connection.scalars(
+            select(steps.c.step_id)
+            .where(steps.c.recipe_id == recipe_id)
+            .order_by(steps.c.step_number.is_(None), steps.c.step_number, steps.c.step_id)
+        ).all()
+        connection.execute(
+            text("UPDATE steps SET step_number = :n WHERE step_id = :id"),
+            [{"id": step_id, "n": n} for n, step_id in enumerate(step_ids, start=1)],
+        )
+    # Runs before the unique index exists, so rows may share a number midway
+
+def upgrade(connection):
+    existing = {
+        index["name"]
+        for table in ("users", "steps")
+        for index in inspect(connection).get_indexes(table)
+    }
+    if "ix_users_username" not in existing:
+        _check_usernames(connection)
+    if "ix_steps_recipe_id_step_number" not in existing:
+        _renumber_steps(connection)
+
+    for name, dialect in INDEXES:
+        if dialect in (None, connection.dialect.name):
+            connection.execute(CreateIndex(_index(name), if_not_exists=True))
+    # IF NOT EXISTS rather than checkfirst: SQLite doesn't report expression
+    # indexes such as lower(name) to the inspector
@@ -0,0 +1,82 @@
+import importlib
+import pkgutil
+import re
+from sqlalchemy import Column, MetaData, String, TIMESTAMP, Table, func, select, text
+from sqlalchemy.engine import Connection, Engine
+
+# Versioned schema migrations.
+#
+# Each change to the schema of an existing database is a module in this
+# package named <version>_<name>.py, e.g. 0003_hot_query_indexes.py, with an
+# upgrade(connection) function. Migrations are applied in version order, each
+# in its own transaction together with the row recording it in
+# schema_migrations, so a failed migration leaves nothing half applied and is
+# simply retried on the next run:
+#
+#   python -m backend.init_db          applies the pending migrations
+#   python -m backend.migrations       lists them, applied or pending
+#
+# 0001 creates the tables of the current models that don't exist yet, so a
+# new database gets the whole schema from it and later migrations find their
+# tables, columns and indexes already there. Later migrations must therefore
+# only add what is missing (IF NOT EXISTS, checkfirst, an inspector check):
+# they bring databases created by an older version up to date.
+#
+# Applied migrations are never edited, a change to the schema is a new module.
+
+MIGRATIONS_TABLE = Table(
+    "schema_migrations", MetaData(),
+    Column("version", String(32), primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", TIMESTAMP, server_default=func.current_timestamp()),
+)
+
+_MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+ADVISORY_LOCK_ID = 7210
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+
+def available() -> list[tuple[str, str]]:
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(module.name)
+        if match:
+            found.append(match.groups())
+    return sorted(found)
+# (version, name) of every migration in the package, oldest first.
+
+def applied(connection: Connection) -> set[str]:
+    if not connection.dialect.has_table(connection, MIGRATIONS_TABLE.name):
+        return set()
+    return set(connection.scalars(select(MIGRATIONS_TABLE.c.version)))
+
+def pending(bind: Engine) -> list[tuple[str, str]]:
+    with bind.connect() as connection:
+        done = applied(connection)
+    return [(version, name) for version, name in available() if version not in done]
+
+def _lock(connection: Connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+# Serialises deployments migrating the same PostgreSQL database at once; the
+# lock is released when the transaction ends. SQLite locks the whole file for
+# the first write anyway.
+
+def migrate(bind: Engine) -> list[tuple[str, str]]:
+    with bind.begin() as connection:
+        _lock(connection)
+        MIGRATIONS_TABLE.create(connection, checkfirst=True)
+
+    ran = []
+    for version, name in available():
+        with bind.begin() as connection:
+            _lock(connection)
+            if version in applied(connection):
+                continue
+            # Checked under the lock: another process may have applied it meanwhile
+            module = importlib.import_module(f"{__name__}.{version}_{name}")
+            module.upgrade(connection)
+            connection.execute(MIGRATIONS_TABLE.insert().values(version=version, name=name))
+        ran.append((version, name))
+    return ran
+# Applies the pending migrations. Returns the (version, name) of those applied.
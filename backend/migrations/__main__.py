@@ -0,0 +1,15 @@
+from sqlalchemy import make_url
+from backend.database import DATABASE_URL, engine
+from backend.migrations import available, pending
+
+# Lists the migrations of the database IRMS_DATABASE_URL points at:
+#
+#   python -m backend.migrations
+#
+# Apply the pending ones with python -m backend.init_db.
+
+if __name__ == "__main__":
+    waiting = set(pending(engine))
+    print(f"Migrations of {make_url(DATABASE_URL).render_as_string(hide_password=True)}")
+    for version, name in available():
+        print(f"  {version} {name:<40} {'pending' if (version, name) in waiting else 'applied'}")
@@ -0,0 +1,32 @@
+import base64
+import json
+from datetime import datetime
+
+# Keyset (cursor) pagination helpers.
+#
+# Rather than using OFFSET, which makes the database walk past every
+# skipped row, a cursor records the sort key of the last row on a page.
+# The next page then starts with "WHERE (created_at, recipe_id) < cursor",
+# which is answered straight from the (created_at, recipe_id) index, so
+# every page costs the same no matter how deep into the list it is.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+class InvalidCursor(ValueError):
+    pass
+# Raised when a client sends a cursor that wasn't produced by encode_cursor()
+
+def encode_cursor(created_at: datetime, recipe_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), recipe_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+# Packs the sort key of the last row on a page into an opaque, URL safe string.
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, recipe_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(recipe_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("Malformed pagination cursor") from exc
+# Reverses encode_cursor(). Any tampered or truncated cursor raises InvalidCursor.
@@ -0,0 +1,267 @@
+import asyncio
+import re
+import threading
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from backend.database import Ingredient, Recipe
+from backend import change_feed
+
+# "What can I cook?" - ranks recipes by how much of a pantry list they cover.
+#
+# Ingredient names are folded into a normalised vocabulary ("Tomatoes",
+# " tomato " and "TOMATO" are all "tomato"), and an inverted index maps each
+# vocabulary entry to the recipes that use it (a posting list).
+#
+# Scoring a pantry then only touches the posting lists of the pantry items:
+# each list adds 1 to a per-recipe counter held in a NumPy array indexed by
+# recipe_id, and coverage (matched / total ingredients) is computed for every
+# recipe in one vectorised pass. No recipes are loaded through the ORM.
+#
+# The index is built from the ingredients table on first use and then kept up
+# to date by recipe_saved() / recipe_deleted(), called from the write endpoints
+# of this worker. Writes made through other workers arrive from the change
+# feed (with IRMS_CHANGES_BACKEND=redis, see change_feed.py): deletes are
+# applied straight away, saved recipes are marked stale and their ingredients
+# read again before the next ranking.
+#
+# what_can_i_cook() only reads rows through the session; building the index
+# and ranking run on a thread, off the event loop.
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+_SPACES_RE = re.compile(r"\s+")
+_KEEP_S = ("ss", "us", "is")
+# Words ending in these usually aren't plurals: "glass", "asparagus", "hummus"
+
+def _singular(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    # berries -> berry
+    if word.endswith("oes") or word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    # tomatoes -> tomato, peaches -> peach, boxes -> box
+    if word.endswith("s") and not word.endswith(_KEEP_S):
+        return word[:-1]
+    # eggs -> egg
+    return word
+
+def normalize_ingredient(name: str) -> str:
+    words = _SPACES_RE.sub(" ", _NON_WORD_RE.sub(" ", (name or "").lower())).strip().split(" ")
+    if words and words[-1]:
+        words[-1] = _singular(words[-1])
+    return " ".join(words)
+# Case and plural folding, only the last word is singularised
+# ("cherry tomatoes" -> "cherry tomato").
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = False
+        self.needs_rebuild = False
+        self._stale = {}          # recipe_id -> version saved by another worker
+        self._recordings = []     # writes made while the database is being read
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}       # ingredient -> set of recipe_ids
+        self._arrays = {}         # ingredient -> recipe_ids as an array, built on demand
+        self._recipe_terms = {}   # recipe_id -> set of ingredients
+        self._totals = np.zeros(1024, dtype=np.int32)  # indexed by recipe_id
+
+    def _record(self):
+        recorded = {}
+        with self._lock:
+            self._recordings.append(recorded)
+        return recorded
+
+    def _stop_recording(self, recorded):
+        with self._lock:
+            self._recordings.remove(recorded)
+    # While the database is read (run_sync gives the event loop back between
+    # statements), writes committed meanwhile are noted, recipe_id -> ingredient
+    # names or None for a delete, so the older rows read don't overwrite them.
+
+    def read(self, db: Session) -> tuple:
+        with self._lock:
+            self.needs_rebuild = False
+        recorded = self._record()
+        try:
+            rows = db.query(Ingredient.recipe_id, Ingredient.name).all()
+        finally:
+            self._stop_recording(recorded)
+        return rows, recorded
+    # The database part of build(): a single column query.
+
+    def load(self, rows: list, recorded: dict):
+        ingredients = {}
+        for recipe_id, name in rows:
+            ingredients.setdefault(recipe_id, []).append(name)
+        with self._lock:
+            self._reset()
+            for recipe_id, names in ingredients.items():
+                self._add(recipe_id, names)
+            for recipe_id, names in recorded.items():
+                self._remove(recipe_id)
+                if names is not None:
+                    self._add(recipe_id, names)
+            self.built = True
+    # Indexes the rows read(), then replays the writes made during the query;
+    # only then is the index used.
+
+    def build(self, db: Session):
+        self.load(*self.read(db))
+    # (Re)builds the whole index from the database.
+
+    def read_stale(self, db: Session) -> tuple:
+        with self._lock:
+            wanted = dict(self._stale)
+        if not wanted:
+            return [], {}, wanted
+        recorded = self._record()
+        try:
+            rows = db.execute(
+                select(Recipe.recipe_id, Recipe.version, Ingredient.name)
+                .outerjoin(Ingredient, Ingredient.recipe_id == Recipe.recipe_id)
+                .where(Recipe.recipe_id.in_(wanted))
+            ).all()
+        finally:
+            self._stop_recording(recorded)
+        return rows, recorded, wanted
+    # The ingredients of the recipes other workers saved, read again in one query.
+
+    def load_stale(self, rows: list, recorded: dict, wanted: dict):
+        found = {}
+        for recipe_id, version, name in rows:
+            entry = found.setdefault(recipe_id, (version, []))
+            if name is not None:
+                entry[1].append(name)
+        with self._lock:
+            for recipe_id, (version, names) in found.items():
+                if version < wanted[recipe_id]:
+                    continue
+                # The database (a lagging replica) doesn't have that version yet
+                if recipe_id not in recorded:
+                    self._remove(recipe_id)
+                    self._add(recipe_id, names)
+                # Saved again by this worker meanwhile: that's newer, keep it
+                if self._stale.get(recipe_id) == wanted[recipe_id]:
+                    del self._stale[recipe_id]
+
+    @property
+    def stale(self) -> bool:
+        return bool(self._stale)
+
+    def add(self, recipe_id: int, ingredient_names: list[str]):
+        with self._lock:
+            for recorded in self._recordings:
+                recorded[recipe_id] = ingredient_names
+            if self.built:
+                self._remove(recipe_id)
+                self._add(recipe_id, ingredient_names)
+
+    def remove(self, recipe_id: int):
+        with self._lock:
+            self._stale.pop(recipe_id, None)
+            for recorded in self._recordings:
+                recorded[recipe_id] = None
+            if self.built:
+                self._remove(recipe_id)
+    # Until the index is first built changes are only noted for a build in progress;
+    # a later build reads them from the database.
+
+    def changed_elsewhere(self, event):
+        if event is None or event["op"] == "imported":
+            with self._lock:
+                self.needs_rebuild = True
+        elif event["op"] == "deleted":
+            self.remove(event["recipe_id"])
+        else:
+            with self._lock:
+                recipe_id = event["recipe_id"]
+                self._stale[recipe_id] = max(self._stale.get(recipe_id, 0), event["version"])
+    # Change feed watcher, for writes made through other workers. A bulk import
+    # or missed events rebuild the index on the next query.
+
+    def _add(self, recipe_id, ingredient_names):
+        terms = {normalize_ingredient(n) for n in ingredient_names} - {""}
+        for term in terms:
+            self._postings.setdefault(term, set()).add(recipe_id)
+            self._arrays.pop(term, None)
+        self._recipe_terms[recipe_id] = terms
+
+        if recipe_id >= len(self._totals):
+            grown = np.zeros(max(recipe_id + 1, 2 * len(self._totals)), dtype=np.int32)
+            grown[:len(self._totals)] = self._totals
+            self._totals = grown
+        self._totals[recipe_id] = len(terms)
+
+    def _remove(self, recipe_id):
+        for term in self._recipe_terms.pop(recipe_id, set()):
+            self._postings[term].discard(recipe_id)
+            self._arrays.pop(term, None)
+            if not self._postings[term]:
+                del self._postings[term]
+        if recipe_id < len(self._totals):
+            self._totals[recipe_id] = 0
+
+    def _term_array(self, term):
+        array = self._arrays.get(term)
+        if array is None:
+            postings = self._postings[term]
+            array = self._arrays[term] = np.fromiter(postings, dtype=np.int64, count=len(postings))
+        return array
+
+    def rank(self, pantry: list[str], limit: int, min_coverage: float = 0.0) -> list[dict]:
+        terms = {normalize_ingredient(n) for n in pantry} - {""}
+        with self._lock:
+            matched = np.zeros(len(self._totals), dtype=np.int32)
+            for term in terms & self._postings.keys():
+                matched[self._term_array(term)] += 1
+            # A recipe lists each ingredient once, so the fancy-index += is safe
+
+            coverage = np.divide(
+                matched, self._totals,
+                out=np.zeros(len(matched), dtype=np.float64),
+                where=self._totals > 0,
+            )
+            hits = np.flatnonzero((matched > 0) & (coverage >= min_coverage))
+            if len(hits) > limit:
+                key = coverage[hits] + matched[hits] * 1e-6
+                hits = hits[np.argpartition(-key, limit)[:limit]]
+            hits = hits[np.lexsort((-hits, -matched[hits], -coverage[hits]))]
+            # Best coverage first, then most ingredients matched, then newest
+
+            return [
+                {
+                    "recipe_id": int(rid),
+                    "matched": int(matched[rid]),
+                    "total": int(self._totals[rid]),
+                    "coverage": float(coverage[rid]),
+                    "missing": sorted(self._recipe_terms[rid] - terms),
+                }
+                for rid in hits
+            ]
+    # Returns the best `limit` recipes for the pantry, with what's still missing.
+
+ingredient_index = IngredientIndex()
+change_feed.change_bus.watch(ingredient_index.changed_elsewhere)
+
+
+async def what_can_i_cook(db: AsyncSession, pantry: list[str], limit: int, min_coverage: float = 0.0) -> list[dict]:
+    if not ingredient_index.built or ingredient_index.needs_rebuild:
+        await asyncio.to_thread(ingredient_index.load, *await db.run_sync(ingredient_index.read))
+    elif ingredient_index.stale:
+        await asyncio.to_thread(ingredient_index.load_stale, *await db.run_sync(ingredient_index.read_stale))
+    return await asyncio.to_thread(ingredient_index.rank, pantry, limit, min_coverage)
+# The index is built and ranked on a thread, so the first query doesn't hold
+# up other requests.
+
+def recipe_saved(recipe_id: int, ingredient_names: list[str]):
+    ingredient_index.add(recipe_id, ingredient_names)
+
+def recipe_deleted(recipe_id: int):
+    ingredient_index.remove(recipe_id)
@@ -0,0 +1,23 @@
+from typing import Optional
+from backend import settings, security
+from backend.worker_pool import PoolBusy, WorkerPool
+
+# Password hashing off the request path.
+#
+# bcrypt is deliberately slow (~250ms at cost 12), so hashes are computed in
+# a WorkerPool (see worker_pool.py): a burst of logins is bounded by the
+# number of workers, and beyond max_pending jobs sign-ins are turned away
+# with PoolBusy (503) rather than queueing without bound.
+
+class PasswordHasher(WorkerPool):
+    busy_detail = "Too many sign-ins in progress, please try again shortly"
+
+    async def hash(self, password: str) -> str:
+        return await self.run(security.hash_password, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+        return await self.run(security.verify_and_update_password, password, password_hash)
+    # Returns (valid, new_hash). new_hash is only set when the password is
+    # valid and the stored hash uses outdated settings (e.g. a lower cost).
+
+password_hasher = PasswordHasher(settings.PASSWORD_WORKERS, settings.PASSWORD_MAX_PENDING)
@@ -0,0 +1,99 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Connection pool metrics, used to size the pool for a given number of workers.
+#
+# Every checkout is timed from the moment a connection is requested until the
+# pool hands one over. With enough idle connections this is microseconds; when
+# all of them are checked out the request waits for one to be returned (up to
+# pool_timeout, after which it fails with a timeout). Each worker process has
+# its own pool, so the database sees up to workers x (pool_size + max_overflow)
+# connections.
+#
+# Reading the numbers:
+# * waits in the slower buckets, or any timeouts: the pool is too small for
+#   the load on this worker, raise IRMS_DB_POOL_SIZE / IRMS_DB_MAX_OVERFLOW
+#   (or add workers if the database has connections to spare);
+# * overflow often above 0: pool_size is below the steady state, connections
+#   are being opened and closed per burst;
+# * many connects compared to checkouts: connections are being recycled or
+#   invalidated (see IRMS_DB_POOL_RECYCLE_SECONDS and pre-ping).
+
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+# Upper bounds (seconds) of the wait histogram; slower waits go in a final bucket
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def incr(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def observe_wait(self, seconds: float):
+        bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds < bound), len(WAIT_BUCKETS))
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.wait_buckets[bucket] += 1
+
+    def as_dict(self, pool=None) -> dict:
+        with self._lock:
+            waits = sum(self.wait_buckets)
+            stats = {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": 1000 * self.wait_seconds_total / waits if waits else 0.0,
+                "wait_ms_max": 1000 * self.wait_seconds_max,
+                "wait_histogram": {
+                    **{f"<{int(bound * 1000)}ms": n for bound, n in zip(WAIT_BUCKETS, self.wait_buckets)},
+                    f">={int(WAIT_BUCKETS[-1] * 1000)}ms": self.wait_buckets[-1],
+                },
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        # Current state of the pool (QueuePool and its asyncio variant only)
+        return stats
+# Counters are cumulative since the process started.
+
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except PoolTimeout:
+                metrics.incr("timeouts")
+                raise
+            finally:
+                metrics.observe_wait(time.perf_counter() - started)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = f"Timed{base.__name__}"
+    return TimedPool
+# Subclass of a pool class that records how long each checkout waited.
+# Used as the engine's poolclass; engine.dispose() recreates the pool from the
+# same class, so the metrics carry over.
+
+def instrument(engine, metrics: PoolMetrics):
+    event.listen(engine, "connect", lambda *_: metrics.incr("connects"))
+    event.listen(engine, "checkout", lambda *_: metrics.incr("checkouts"))
+    event.listen(engine, "invalidate", lambda *_: metrics.incr("invalidations"))
+# Counts pool events. For an async engine, pass engine.sync_engine.
@@ -0,0 +1,88 @@
+import asyncio
+import cProfile
+import io
+import pstats
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Opt-in profiling of single requests, for debugging slow paths.
+#
+# With IRMS_PROFILING=1, a request sent with the header "X-Profile: 1" is run
+# under a profiler and answered with the profile as plain text instead of its
+# normal body; the endpoint's own status code is in X-Profile-Status:
+#
+#   curl -H "X-Profile: 1" "http://localhost:8000/recipes?limit=100"
+#
+# pyinstrument is used when installed (a call tree, follows awaits across the
+# event loop), otherwise cProfile (functions by cumulative time). cProfile
+# records everything the event loop thread does meanwhile, including other
+# requests, so profile on an otherwise idle server. Only one profiler can be
+# active at a time, so profiled requests run one after another. Never enable
+# in production: anyone could ask for a profile.
+
+PROFILE_LINES = 40
+# Functions listed in a cProfile report
+
+def _wants_profile(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            return value.strip().lower() in (b"1", b"true", b"yes")
+    return False
+
+async def _run_profiled(app, scope, receive):
+    status = None
+
+    async def discard(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+    # The endpoint's response is dropped, only its status is kept
+
+    if Profiler is not None:
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await app(scope, receive, discard)
+        finally:
+            profiler.stop()
+        return status, profiler.output_text(unicode=True)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await app(scope, receive, discard)
+    finally:
+        profiler.disable()
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return status, report.getvalue()
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._profiling = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        async with self._profiling:
+            status, report = await _run_profiled(self.app, scope, receive)
+        # A second profiler can't start while one runs; the request waits its turn
+        body = report.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-status", str(status).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+# Only added to the app when IRMS_PROFILING is set (see api.py).
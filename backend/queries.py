@@ -0,0 +1,35 @@
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from backend.database import Recipe
+
+# Shared query layer for reading recipes.
+#
+# The relationships on Recipe are lazy by default, so serialising N recipes
+# into RecipeOut would issue one query for the recipes plus one query per
+# recipe for each of user, steps and ingredients (1 + 3N).
+# Each helper below returns a select() with an eager loading plan that fits how
+# the endpoint uses the result, keeping the number of queries fixed regardless of N.
+# The async endpoints depend on this too: an AsyncSession can't lazy load a
+# relationship the first time it is accessed.
+#
+# joinedload   - many-to-one (Recipe.user). Adds a JOIN to the main query,
+#                as each recipe has exactly one author the rows don't multiply.
+# selectinload - one-to-many (Recipe.steps, Recipe.ingredients). Issues one
+#                extra "WHERE recipe_id IN (...)" query per collection.
+#                Joining both collections would return steps x ingredients rows.
+
+def recipe_details():
+    return select(Recipe).options(
+        joinedload(Recipe.user),
+        selectinload(Recipe.steps),
+        selectinload(Recipe.ingredients),
+    )
+# Everything needed by RecipeOut: 3 queries for any number of recipes.
+
+def recipe_summaries():
+    return select(Recipe).options(joinedload(Recipe.user))
+# Everything needed by RecipeSummaryOut: a single query.
+
+def recipe_steps():
+    return select(Recipe).options(selectinload(Recipe.steps))
+# Used when only the steps are rendered: 2 queries.
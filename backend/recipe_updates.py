@@ -0,0 +1,159 @@
+from collections import defaultdict, deque
+from decimal import Decimal
+from difflib import SequenceMatcher
+from backend.database import Recipe, Step, Ingredient
+from backend.response_model import StepIn, IngredientIn
+from backend import search
+
+# Applies an edit to a loaded recipe by changing only what differs.
+#
+# Instead of deleting every step and ingredient and inserting them again,
+# the incoming lists are matched against the existing rows:
+#
+# Steps       - aligned with difflib's SequenceMatcher on (instruction, img_path),
+#               so a step inserted or removed in the middle doesn't disturb the
+#               others. Matched rows keep their step_id and are only renumbered
+#               if their position changed; where a run of steps was rewritten,
+#               old and new are paired up by position and updated in place.
+#               The alignment sees a moved step as removed in one place and
+#               added in another; such a pair with the same key is kept as
+#               one row, which is only renumbered.
+# Ingredients - matched by name (case-insensitive, in order for repeated names).
+#               Matched rows keep their ingredient_id and only the changed
+#               quantity/unit is written.
+#
+# Unmatched existing rows are deleted and unmatched incoming ones inserted.
+# Attributes are assigned unconditionally: SQLAlchemy compares each value with
+# the loaded one and leaves unchanged rows out of the UPDATE entirely.
+#
+# Step numbers are unique within a recipe (ix_steps_recipe_id_step_number),
+# and a flush updates rows one at a time, inserting before it deletes. A step
+# moving to a number another step holds, or a new step taking the number of
+# a deleted one, would break the index midway. Such steps are first given
+# the negative of their number (never a real one), and the caller sets the
+# final numbers once that has been flushed (finish_renumbering). Steps edited
+# in place or added at the end take their number directly.
+
+def pair_sequences(old_keys: list, new_keys: list) -> list[tuple]:
+    pairs = []
+    runs = []
+    matcher = SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs.extend(zip(range(i1, i2), range(j1, j2)))
+        else:
+            runs.append((list(range(i1, i2)), list(range(j1, j2))))
+
+    removed = defaultdict(deque)
+    for old, _ in runs:
+        for i in old:
+            removed[old_keys[i]].append(i)
+    moved_old, moved_new = set(), set()
+    for _, new in runs:
+        for j in new:
+            if removed[new_keys[j]]:
+                i = removed[new_keys[j]].popleft()
+                pairs.append((i, j))
+                moved_old.add(i)
+                moved_new.add(j)
+
+    for old, new in runs:
+        old = [i for i in old if i not in moved_old]
+        new = [j for j in new if j not in moved_new]
+        n = min(len(old), len(new))
+        pairs.extend(zip(old[:n], new[:n]))
+        pairs.extend((i, None) for i in old[n:])
+        pairs.extend((None, j) for j in new[n:])
+    return pairs
+# Returns (old_index, new_index) pairs: both set for a row that is kept
+# (updated if needed), (i, None) for a deletion, (None, j) for an insertion.
+# Outside the matched blocks, equal keys are paired first (in order, for
+# repeated keys) as moves; what remains of each rewritten run is paired by
+# position. Keys must be hashable.
+
+def _quantity(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+# Same scale as the DECIMAL(5,2) column, so an unchanged quantity compares
+# equal to the stored one (0.1 as a float doesn't).
+
+def apply_steps(recipe: Recipe, steps_in: list[StepIn]) -> dict[Step, int]:
+    existing = sorted(recipe.steps, key=lambda s: s.step_number or 0)
+    incoming = [(s.instruction, s.img_path or "") for s in steps_in]
+    pairs = pair_sequences([(s.instruction, s.img_path or "") for s in existing], incoming)
+    taken = {s.step_number for s in existing}
+    renumbered = {}
+
+    def number(step: Step, n: int):
+        if step.step_number != n and n in taken:
+            renumbered[step] = n
+            n = -n
+        step.step_number = n
+
+    for old, new in pairs:
+        if new is None:
+            recipe.steps.remove(existing[old])
+            # delete-orphan turns the removal into a DELETE
+        elif old is None:
+            step = Step(instruction=incoming[new][0], img_path=incoming[new][1])
+            number(step, new + 1)
+            recipe.steps.append(step)
+        else:
+            step = existing[old]
+            number(step, new + 1)
+            step.instruction, step.img_path = incoming[new]
+    return renumbered
+# Returns {step: final number} of the steps given a temporary number.
+
+def finish_renumbering(renumbered: dict[Step, int]):
+    for step, n in renumbered.items():
+        step.step_number = n
+# Call after the temporary numbers have been flushed.
+
+def apply_ingredients(recipe: Recipe, ingredients_in: list[IngredientIn]):
+    unmatched = defaultdict(deque)
+    for ingredient in recipe.ingredients:
+        unmatched[ingredient.name.strip().lower()].append(ingredient)
+
+    for ing_in in ingredients_in:
+        candidates = unmatched[ing_in.name.strip().lower()]
+        if candidates:
+            ingredient = candidates.popleft()
+            ingredient.name = ing_in.name
+            ingredient.quantity = _quantity(ing_in.quantity)
+            ingredient.unit = ing_in.unit or ""
+        else:
+            recipe.ingredients.append(Ingredient(
+                name=ing_in.name,
+                quantity=_quantity(ing_in.quantity),
+                unit=ing_in.unit or "",
+            ))
+
+    for leftovers in unmatched.values():
+        for ingredient in leftovers:
+            recipe.ingredients.remove(ingredient)
+
+def apply_changes(recipe: Recipe, changes: dict, steps_in=None, ingredients_in=None) -> dict[Step, int]:
+    for field in ("name", "description", "servings", "cook_time_min"):
+        if field in changes:
+            setattr(recipe, field, changes[field])
+    if changes.get("img_path"):
+        recipe.img_path = changes["img_path"]
+    # A missing image keeps the current one, as before
+
+    renumbered = {}
+    if steps_in is not None:
+        renumbered = apply_steps(recipe, steps_in)
+    if ingredients_in is not None:
+        apply_ingredients(recipe, ingredients_in)
+
+    recipe.search_document = search.build_search_document(
+        recipe.name,
+        recipe.description,
+        [s.instruction or "" for s in sorted(recipe.steps, key=lambda s: renumbered.get(s, s.step_number or 0))],
+        [i.name for i in recipe.ingredients],
+    )
+    return renumbered
+# changes holds the scalar fields to set (all of them for PUT, only those
+# sent for PATCH); steps_in / ingredients_in replace the lists when given.
+# The recipe must be loaded with its steps and ingredients (recipe_details()).
+# Returns the steps to finish_renumbering() after a flush, see above.
@@ -0,0 +1,79 @@
+import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from backend.database import Recipe
+from backend.queries import recipe_steps
+from backend.steps import step_for
+
+# Rendered steps, produced once per recipe version.
+#
+# Every write that changes a recipe renders its steps (escaped HTML, see
+# steps.py) and stores them on the recipe row as a JSON array, together with
+# the version they belong to. Reads then just fetch that text and drop it into
+# the response without building step objects or re-encoding anything:
+#
+#   GET /recipes/{id}/render_steps   - one recipe (also cached in recipe_cache)
+#   GET /recipes/render_steps?ids=   - many recipes with a single query
+#
+# Rows whose stored version doesn't match (written before this existed, or by
+# a tool that bypasses the API) are rendered on the fly from their steps.
+# render_stale() stores them once, python -m backend.init_db runs it.
+
+def render_steps(steps) -> str:
+    return json.dumps([step_for(s.step_number, s.instruction, s.img_path).render() for s in steps])
+# Builds and renders each step in one pass. steps are Step rows in step order.
+
+def render_step_inputs(steps_in) -> str:
+    return json.dumps([
+        step_for(n, s.instruction, s.img_path).render() for n, s in enumerate(steps_in, start=1)
+    ])
+# The same for the StepIn list of a request body, numbered from 1.
+
+def store(recipe: Recipe, version):
+    recipe.rendered_steps = render_steps(sorted(recipe.steps, key=lambda s: s.step_number or 0))
+    recipe.rendered_version = version
+# version is the version the recipe will have once saved: 1 for a new recipe,
+# "Recipe.version + 1" when it is bumped in the same UPDATE.
+# Sorted: after an edit, steps inserted in the middle are still at the end of recipe.steps.
+
+def steps_body(rendered: str) -> bytes:
+    return b'{"steps": ' + rendered.encode() + b'}'
+
+def batch_body(rendered: dict[int, str]) -> bytes:
+    items = ", ".join(f'"{recipe_id}": {steps}' for recipe_id, steps in rendered.items())
+    return ('{"recipes": {' + items + '}}').encode()
+# {"recipes": {"<recipe_id>": [rendered steps], ...}}, built from the stored text.
+
+async def load_rendered(db: AsyncSession, recipe_ids: list[int]) -> dict[int, str]:
+    rows = (await db.execute(
+        select(Recipe.recipe_id, Recipe.version, Recipe.rendered_version, Recipe.rendered_steps)
+        .where(Recipe.recipe_id.in_(recipe_ids))
+    )).all()
+    rendered = {
+        r.recipe_id: r.rendered_steps for r in rows
+        if r.rendered_steps is not None and r.rendered_version == r.version
+    }
+
+    stale = [r.recipe_id for r in rows if r.recipe_id not in rendered]
+    if stale:
+        for recipe in await db.scalars(recipe_steps().where(Recipe.recipe_id.in_(stale))):
+            rendered[recipe.recipe_id] = render_steps(recipe.steps)
+    # Not written back, reads never write to the database
+
+    return {recipe_id: rendered[recipe_id] for recipe_id in recipe_ids if recipe_id in rendered}
+# Returns {recipe_id: rendered steps as a JSON array} in the order asked for,
+# leaving out ids that don't exist. One query when everything is up to date.
+
+def render_stale(db: Session, batch_size: int = 500) -> int:
+    stale = Recipe.rendered_version.is_(None) | (Recipe.rendered_version != Recipe.version)
+    count = 0
+    while True:
+        recipes = db.scalars(recipe_steps().where(stale).limit(batch_size)).all()
+        if not recipes:
+            return count
+        for recipe in recipes:
+            store(recipe, recipe.version)
+        db.commit()
+        count += len(recipes)
+# Stores the rendered steps of every recipe that's missing them. Returns how many were rendered.
@@ -0,0 +1,169 @@
+import itertools
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import event, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from backend import settings
+from backend.database import AsyncSessionLocal, async_engine, create_async_db_engine
+from backend.pool_metrics import PoolMetrics
+
+# Read replicas.
+#
+# With IRMS_DATABASE_REPLICA_URLS set, endpoints that only read take their
+# session from get_read_db instead of get_db: it is opened on one of the
+# replicas, taken in turn, so listings and recipe views don't compete with
+# writes on the primary. Everything that writes keeps using get_db, on the
+# primary. Without replicas get_read_db is the primary as well.
+#
+# Replicas lag behind the primary, so a user who just saved a recipe could
+# read the old one back. To avoid that (read-your-writes), a response to a
+# request that wrote to the primary sets a short-lived cookie, and reads
+# from a client holding it go to the primary until it expires
+# (IRMS_REPLICA_STICKY_SECONDS, longer than the usual replication lag). The
+# cookie carries its own expiry, so any worker honours it.
+#
+# A replica that can't be connected to is skipped for
+# IRMS_REPLICA_RETRY_SECONDS; when none is available reads use the primary.
+
+STICKY_COOKIE = "irms_primary_until"
+
+class Replica:
+    def __init__(self, url: str, metrics: PoolMetrics):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_db_engine(url, metrics)
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.down_until = 0.0
+        self.sessions = 0
+        self.failures = 0
+# One replica database, with its own engine and connection pool.
+
+class ReplicaSet:
+    def __init__(self, urls: list[str], retry_seconds: float):
+        self.metrics = PoolMetrics()
+        self.replicas = [Replica(url, self.metrics) for url in urls]
+        self.retry_seconds = retry_seconds
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def candidates(self) -> list[Replica]:
+        if not self.replicas:
+            return []
+        start = next(self._turn) % len(self.replicas)
+        now = time.monotonic()
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in ordered if replica.down_until <= now]
+    # The replicas to try, starting with the next one in turn; those that
+    # failed recently are left out.
+
+    def count(self, replica: Optional[Replica] = None, sticky: bool = False, failed: bool = False):
+        with self._lock:
+            if replica is None:
+                self.primary_reads += 1
+                self.sticky_reads += sticky
+            elif failed:
+                replica.failures += 1
+                replica.down_until = time.monotonic() + self.retry_seconds
+            else:
+                replica.sessions += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "primary_reads": self.primary_reads,
+                "sticky_reads": self.sticky_reads,
+                "replicas": [
+                    {
+                        "url": replica.name,
+                        "sessions": replica.sessions,
+                        "failures": replica.failures,
+                        "available": replica.down_until <= now,
+                        **self.metrics.as_dict(replica.engine.pool),
+                    }
+                    for replica in self.replicas
+                ],
+            }
+    # Reads per database, for /db/stats. primary_reads counts reads sent to the
+    # primary, sticky_reads those sent there because of the cookie.
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+replica_set = ReplicaSet(settings.DB_REPLICA_URLS, settings.REPLICA_RETRY_SECONDS)
+
+def _sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+async def get_read_db(request: Request):
+    sticky = _sticky(request)
+    if not sticky:
+        for replica in replica_set.candidates():
+            db = replica.sessionmaker()
+            try:
+                await db.connection()
+            except (DBAPIError, OSError):
+                await db.close()
+                replica_set.count(replica, failed=True)
+                continue
+            # Connected up front, so an unreachable replica is skipped before the endpoint runs
+            replica_set.count(replica)
+            async with db:
+                yield db
+            return
+
+    replica_set.count(sticky=sticky)
+    async with AsyncSessionLocal() as db:
+        yield db
+# FastAPI dependency for endpoints that only read; use get_db for anything that writes.
+
+_wrote: ContextVar[Optional[list]] = ContextVar("irms_wrote", default=None)
+
+def _record_write(conn, cursor, statement, parameters, context, executemany):
+    wrote = _wrote.get()
+    if wrote is not None and statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+        wrote[0] = True
+# Engine event of the primary: flags the current request as having written.
+
+class StickyPrimaryMiddleware:
+    def __init__(self, app, sticky_seconds: float):
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        wrote = [False]
+        token = _wrote.set(wrote)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and wrote[0] and message["status"] < 400:
+                cookie = (f"{STICKY_COOKIE}={time.time() + self.sticky_seconds:.3f}; "
+                          f"Max-Age={math.ceil(self.sticky_seconds)}; Path=/; SameSite=Lax; HttpOnly")
+                message = {**message, "headers": [*message.get("headers", ()), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _wrote.reset(token)
+# The flag is a list so that writes made in a copied context (the endpoint's
+# task, the greenlet running the statements) still reach this request.
+
+def add_replica_routing(app):
+    if replica_set.replicas:
+        event.listen(async_engine.sync_engine, "after_cursor_execute", _record_write)
+        app.add_middleware(StickyPrimaryMiddleware, sticky_seconds=settings.REPLICA_STICKY_SECONDS)
+# Only needed with replicas: without them every read is on the primary anyway.
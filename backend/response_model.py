@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, computed_field
 from typing import Annotated, Optional, List
 from datetime import datetime
+from backend import images
 
 # This file defines the response models for our API.
 #
@@ -73,6 +74,124 @@ class RecipeOut(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+    @computed_field
+    @property
+    def thumbnail_path(self) -> Optional[str]:
+        return images.thumbnail_url(self.img_path)
+# thumbnail_path: see RecipeSummaryOut.
+
+class RecipeSummaryOut(BaseModel):
+    recipe_id: int
+    name: str
+    user: AuthorOut
+    description: Optional[str]
+    servings: int
+    cook_time_min: int
+    img_path: Optional[str]
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @computed_field
+    @property
+    def thumbnail_path(self) -> Optional[str]:
+        return images.thumbnail_url(self.img_path)
+# Slim version of RecipeOut used by listings; steps and ingredients are
+# left out so a page of results stays small.
+# thumbnail_path is a small WebP variant of an uploaded cover image (see
+# images.py), for cards to show instead of img_path. None otherwise.
+
+class RecipeSearchResultOut(RecipeSummaryOut):
+    score: float
+# A search hit; results are returned best match (highest score) first.
+
+class SimilarRecipeOut(RecipeSummaryOut):
+    similarity: float
+# A /recipes/{id}/similar entry; similarity is between 0 and 1.
+
+class RatedRecipeOut(RecipeSummaryOut):
+    rating_avg: float
+    rating_count: int
+    comment_count: int
+# A /recipes/top_rated entry: the card plus its aggregates from recipe_stats.
+
+class RatingIn(BaseModel):
+    value: Annotated[int, Field(ge=1, le=5)]
+
+class RatingSummaryOut(BaseModel):
+    recipe_id: int
+    rating_avg: float
+    rating_count: int
+    comment_count: int
+# Read from the recipe's precomputed aggregates, all 0 before its first rating.
+
+class CommentIn(BaseModel):
+    body: Annotated[str, Field(min_length=1, max_length=2000)]
+
+class CommentOut(BaseModel):
+    comment_id: int
+    recipe_id: int
+    user: AuthorOut
+    body: str
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ReportIn(BaseModel):
+    reason: Annotated[str, Field(min_length=3, max_length=500)]
+
+class ReportOut(BaseModel):
+    report_id: int
+    recipe_id: int
+    reason: str
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+# The reporter isn't included: reports are shown to the recipe's author.
+
+class PantryIn(BaseModel):
+    ingredients: Annotated[List[str], Field(min_length=1)]
+    limit: Annotated[int, Field(ge=1, le=100)] = 20
+    min_coverage: Annotated[float, Field(ge=0, le=1)] = 0.0
+# min_coverage: only return recipes where at least this fraction
+# of the ingredients is already in the pantry.
+
+class PantryMatchOut(BaseModel):
+    recipe_id: int
+    name: str
+    matched: int
+    total: int
+    coverage: float
+    missing: List[str]
+# coverage = matched / total; missing lists what still needs to be bought.
+
+class PlannedMealIn(BaseModel):
+    recipe_id: int
+    servings: Optional[Annotated[int, Field(ge=1, le=1000)]] = None
+
+class MealPlanIn(BaseModel):
+    meals: Annotated[List[PlannedMealIn], Field(min_length=1, max_length=1000)]
+# servings defaults to the recipe's own; a recipe can be planned more than once.
+
+class ShoppingItemOut(BaseModel):
+    name: str
+    quantity: float
+    unit: str
+    recipe_ids: List[int]
+
+class ShoppingListOut(BaseModel):
+    items: List[ShoppingItemOut]
+    missing_recipe_ids: List[int]
+# items: one line per ingredient and kind of unit (mass, volume, count, other),
+# quantities summed over the plan. missing_recipe_ids: planned recipes that don't exist.
+
+class RecipePage(BaseModel):
+    items: List[RecipeSummaryOut]
+    next_cursor: Optional[str] = None
+# One page of a keyset-paginated listing.
+# next_cursor is passed back as ?cursor= to fetch the following page,
+# and is None once the last page has been reached.
+
 class RecipeIn(BaseModel):
     name: Annotated[str, Field(min_length=3)]
     img_path: Optional[str]
@@ -82,9 +201,35 @@ class RecipeIn(BaseModel):
     steps: List[StepIn]
     ingredients: List[IngredientIn]
 
+class RecipePatch(BaseModel):
+    name: Optional[Annotated[str, Field(min_length=3)]] = None
+    img_path: Optional[str] = None
+    description: Optional[str] = None
+    servings: Optional[int] = None
+    cook_time_min: Optional[int] = None
+    steps: Optional[List[StepIn]] = None
+    ingredients: Optional[List[IngredientIn]] = None
+# Body of PATCH /recipes/{id}: every field is optional and only those sent are changed.
+# steps / ingredients replace the whole list when present.
+
+class BulkImportOut(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[dict]
+# errors holds the line number and validation message of the first
+# failed lines (capped), the rest of the upload is still imported.
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+
+class ImageOut(BaseModel):
+    hash: str
+    url: str
+    variants: dict[int, str]
+    thumbnail_url: Optional[str]
+# Returned by POST /images. url is the original, to be used as an img_path;
+# variants maps each width to its WebP URL (empty without Pillow installed).
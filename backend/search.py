@@ -0,0 +1,312 @@
+import asyncio
+import bisect
+import math
+import re
+import threading
+import numpy as np
+from sqlalchemy import func, literal_column, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from backend.database import Recipe, Step, Ingredient
+from backend.queries import recipe_details
+
+# Full-text and ingredient search over recipes.
+#
+# Every recipe carries a search_document: its name, description, step
+# instructions and ingredient names joined into one block of text, rebuilt
+# whenever the recipe is created or updated.
+#
+# -- PostgreSQL --
+# search_document is matched with a tsvector/tsquery, backed by the GIN index
+# declared on Recipe, and ranked with ts_rank.
+#
+# -- Anything else (SQLite test runs) --
+# An in-process inverted index is built from the tables on the first search
+# and kept current by recipe_saved() / recipe_deleted(), including for writes
+# made while it is being built. Results are ranked with BM25.
+#
+# In both cases every search term is treated as a prefix ("tom" matches
+# "tomato"), and all terms must match.
+#
+# search_recipes() only reads rows through the session; building and
+# searching the fallback index run on a thread, off the event loop.
+
+TEXT_SEARCH_CONFIG = literal_column("'english'")
+# Inlined rather than bound so the expression matches the GIN index exactly.
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+def build_search_document(name, description, instructions, ingredient_names) -> str:
+    parts = [name, description or ""]
+    parts.extend(instructions)
+    parts.extend(ingredient_names)
+    return "\n".join(p for p in parts if p)
+# Concatenates every searchable field of a recipe into one string.
+
+def search_vector():
+    return func.to_tsvector(TEXT_SEARCH_CONFIG, Recipe.search_document)
+# Must stay identical to the expression of ix_recipes_search_document in
+# database.py, otherwise PostgreSQL can't use the index.
+
+
+class InvertedIndex:
+    K1 = 1.2
+    B = 0.75
+    # Standard BM25 tuning constants
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = False
+        self._recordings = []     # writes made while the database is being read
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}       # term -> {recipe_id: term frequency}
+        self._arrays = {}         # term -> (recipe_ids, term frequencies) as arrays, built on demand
+        self._vocabulary = []     # sorted list of terms, for prefix lookups
+        self._doc_terms = {}      # recipe_id -> list of distinct terms
+        self._doc_length = np.zeros(1024, dtype=np.float64)  # indexed by recipe_id
+        self._ingredients = {}    # ingredient name -> set of recipe_ids
+        self._doc_ingredients = {}  # recipe_id -> set of ingredient names
+        self._total_length = 0
+
+    def _record(self):
+        recorded = {}
+        with self._lock:
+            self._recordings.append(recorded)
+        return recorded
+
+    def _stop_recording(self, recorded):
+        with self._lock:
+            self._recordings.remove(recorded)
+    # While the database is read (run_sync gives the event loop back between
+    # statements), writes committed meanwhile are noted, recipe_id ->
+    # (document, ingredient names) or None for a delete, and replayed after.
+
+    def read(self, db: Session) -> tuple:
+        recorded = self._record()
+        try:
+            rows = (
+                db.query(Recipe.recipe_id, Recipe.name, Recipe.description).all(),
+                db.query(Step.recipe_id, Step.instruction).all(),
+                db.query(Ingredient.recipe_id, Ingredient.name).all(),
+            )
+        finally:
+            self._stop_recording(recorded)
+        return rows, recorded
+    # The database part of build(): three flat column queries, no ORM objects.
+
+    def load(self, rows: tuple, recorded: dict):
+        recipes, steps, ingredient_rows = rows
+        documents = {recipe_id: [name, description or ""] for recipe_id, name, description in recipes}
+        for recipe_id, instruction in steps:
+            if recipe_id in documents:
+                documents[recipe_id].append(instruction or "")
+        ingredients = {}
+        for recipe_id, name in ingredient_rows:
+            if recipe_id in documents:
+                documents[recipe_id].append(name)
+                ingredients.setdefault(recipe_id, []).append(name)
+        # Recipes created after the first query are skipped here; they are
+        # among the recorded writes
+
+        with self._lock:
+            self._reset()
+            for recipe_id, parts in documents.items():
+                self._add(recipe_id, "\n".join(parts), ingredients.get(recipe_id, []))
+            for recipe_id, saved in recorded.items():
+                self._remove(recipe_id)
+                if saved is not None:
+                    self._add(recipe_id, *saved)
+            self.built = True
+    # Indexes the rows read(), then replays the writes made during the
+    # queries; only then is the index used.
+
+    def build(self, db: Session):
+        self.load(*self.read(db))
+    # (Re)builds the whole index from the database.
+
+    def add(self, recipe_id: int, document: str, ingredient_names: list[str]):
+        with self._lock:
+            for recorded in self._recordings:
+                recorded[recipe_id] = (document, ingredient_names)
+            if self.built:
+                self._remove(recipe_id)
+                self._add(recipe_id, document, ingredient_names)
+
+    def remove(self, recipe_id: int):
+        with self._lock:
+            for recorded in self._recordings:
+                recorded[recipe_id] = None
+            if self.built:
+                self._remove(recipe_id)
+    # Until the index is first built changes are only noted for a build in progress;
+    # a later build reads them from the database.
+
+    def _add(self, recipe_id, document, ingredient_names):
+        tokens = tokenize(document)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[recipe_id] = tf
+            self._arrays.pop(term, None)
+        self._doc_terms[recipe_id] = list(counts)
+
+        if recipe_id >= len(self._doc_length):
+            grown = np.zeros(max(recipe_id + 1, 2 * len(self._doc_length)), dtype=np.float64)
+            grown[:len(self._doc_length)] = self._doc_length
+            self._doc_length = grown
+        self._doc_length[recipe_id] = len(tokens)
+        self._total_length += len(tokens)
+
+        names = {n.strip().lower() for n in ingredient_names}
+        for name in names:
+            self._ingredients.setdefault(name, set()).add(recipe_id)
+        self._doc_ingredients[recipe_id] = names
+
+    def _remove(self, recipe_id):
+        for term in self._doc_terms.pop(recipe_id, []):
+            postings = self._postings[term]
+            del postings[recipe_id]
+            self._arrays.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+        if recipe_id < len(self._doc_length):
+            self._total_length -= int(self._doc_length[recipe_id])
+            self._doc_length[recipe_id] = 0
+        for name in self._doc_ingredients.pop(recipe_id, set()):
+            self._ingredients[name].discard(recipe_id)
+            if not self._ingredients[name]:
+                del self._ingredients[name]
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        return self._vocabulary[start:end]
+    # All indexed terms starting with prefix, found by binary search.
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float64, count=len(postings)),
+            )
+        return arrays
+    # Posting list of a term as NumPy arrays. Cached until the term's postings change.
+
+    def search(self, terms: list[str], ingredient_names: list[str], limit: int) -> list[tuple[int, float]]:
+        with self._lock:
+            size = len(self._doc_length)
+            mask = None
+            for name in {n.strip().lower() for n in ingredient_names}:
+                matches = self._ingredients.get(name)
+                if not matches:
+                    return []
+                has_name = np.zeros(size, dtype=bool)
+                has_name[np.fromiter(matches, dtype=np.int64, count=len(matches))] = True
+                mask = has_name if mask is None else mask & has_name
+            # "Has all of these ingredients": intersect the posting sets
+
+            n_docs = len(self._doc_terms) or 1
+            avg_length = self._total_length / n_docs or 1
+            scores = np.zeros(size, dtype=np.float64)
+            for term in terms:
+                term_hit = np.zeros(size, dtype=bool)
+                for expanded in self._expand(term):
+                    ids, tfs = self._term_arrays(expanded)
+                    idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+                    norm = self.K1 * (1 - self.B + self.B * self._doc_length[ids] / avg_length)
+                    scores[ids] += idf * tfs * (self.K1 + 1) / (tfs + norm)
+                    term_hit[ids] = True
+                mask = term_hit if mask is None else mask & term_hit
+            # Every term has to match (AND); the BM25 scores of its expansions are summed.
+            # Each posting list is scored in one vectorised step over all its recipes.
+
+            if mask is None:
+                return []
+            hits = np.flatnonzero(mask)
+            if len(hits) > limit:
+                hits = hits[np.argpartition(-scores[hits], limit)[:limit]]
+            hits = hits[np.lexsort((-hits, -scores[hits]))]
+            return [(int(rid), float(scores[rid])) for rid in hits]
+    # Returns up to `limit` (recipe_id, score) pairs, best match first.
+
+search_index = InvertedIndex()
+# Fallback index used when the database isn't PostgreSQL.
+
+
+def _is_postgres(db) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _search_postgres(db, terms, ingredient_names, limit):
+    if terms:
+        ts_query = func.to_tsquery(TEXT_SEARCH_CONFIG, " & ".join(f"{t}:*" for t in terms))
+        score = func.ts_rank(search_vector(), ts_query)
+        query = db.query(Recipe.recipe_id, score).filter(search_vector().op("@@")(ts_query))
+    else:
+        score = literal_column("0.0")
+        query = db.query(Recipe.recipe_id, score)
+    # Each term becomes a prefix match ("tom:*"), joined with AND
+
+    names = sorted({n.strip().lower() for n in ingredient_names})
+    if names:
+        having_all = (
+            db.query(Ingredient.recipe_id)
+            .filter(func.lower(Ingredient.name).in_(names))
+            .group_by(Ingredient.recipe_id)
+            .having(func.count(distinct(func.lower(Ingredient.name))) == len(names))
+        )
+        query = query.filter(Recipe.recipe_id.in_(having_all))
+
+    rows = query.order_by(score.desc(), Recipe.recipe_id.desc()).limit(limit)
+    return [(recipe_id, float(rank)) for recipe_id, rank in rows]
+
+async def search_recipes(db: AsyncSession, text: str, ingredient_names: list[str], limit: int) -> list[tuple[int, float]]:
+    terms = tokenize(text)
+    if _is_postgres(db):
+        return await db.run_sync(_search_postgres, terms, ingredient_names, limit)
+    if not search_index.built:
+        await asyncio.to_thread(search_index.load, *await db.run_sync(search_index.read))
+    return await asyncio.to_thread(search_index.search, terms, ingredient_names, limit)
+# Returns up to `limit` (recipe_id, score) pairs, best match first.
+# The fallback index is built and searched on a thread, so the first search
+# (and BM25 scoring) doesn't hold up other requests.
+
+def recipe_saved(recipe_id: int, document: str, ingredient_names: list[str]):
+    search_index.add(recipe_id, document, ingredient_names)
+
+def recipe_deleted(recipe_id: int):
+    search_index.remove(recipe_id)
+# Keeps the fallback index current.
+
+def backfill_search_documents(db: Session, batch_size: int = 500) -> int:
+    updated = 0
+    while True:
+        recipes = db.scalars(
+            recipe_details()
+            .where(Recipe.search_document.is_(None))
+            .limit(batch_size)
+        ).all()
+        if not recipes:
+            return updated
+        for recipe in recipes:
+            recipe.search_document = build_search_document(
+                recipe.name,
+                recipe.description,
+                [s.instruction or "" for s in recipe.steps],
+                [i.name for i in recipe.ingredients],
+            )
+        db.commit()
+        updated += len(recipes)
+# Fills search_document for recipes created before the column existed.
@@ -2,8 +2,10 @@ from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from backend.keys import SECRET_KEY
+from backend import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+# Hashes made with a different cost are reported by needs_update, see verify_and_update_password
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 90
@@ -16,12 +18,23 @@ def verify_password(plain_password: str, hashed_password: str) -> str:
     return (pwd_context.verify(plain_password, hashed_password))
 # Checks if the plain text password matches the stored hash
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+# Like verify_password, but also returns a fresh hash (else None) when the
+# stored one was made with outdated settings, for the caller to save.
+# The API runs these in password_pool rather than calling them directly.
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_user_token(user) -> str:
+    return create_access_token(data={"sub": str(user.user_id), "name": user.username})
+# "sub" identifies the user by id, which never changes; "name" is informational.
+# Tokens issued before this carried the username in "sub" and no "name" claim.
+
 def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
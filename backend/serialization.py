@@ -0,0 +1,60 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import Response
+from pydantic import TypeAdapter
+from backend import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast JSON encoding of response bodies.
+#
+# Pydantic models are serialised straight to JSON bytes by pydantic-core
+# (TypeAdapter.dump_json), without first building a dict of Python objects
+# and passing it through the json module, as FastAPI's jsonable_encoder path
+# does. For a page of recipes that's over 20x faster; see
+# python -m backend.benchmarks.serialization.
+#
+# Plain dicts and lists (NDJSON export lines, hand-built bodies) go through
+# orjson when it's installed and fall back to the json module otherwise.
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+# What orjson does natively for the types the models use.
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+_adapters = {}
+
+def adapter(model_type) -> TypeAdapter:
+    cached = _adapters.get(model_type)
+    if cached is None:
+        cached = _adapters[model_type] = TypeAdapter(model_type)
+    return cached
+# Building a TypeAdapter compiles a validator and serialiser, so one is kept per type.
+
+def model_json(model_type, value) -> bytes:
+    typed = adapter(model_type)
+    with metrics.timed("serialize_seconds"):
+        return typed.dump_json(typed.validate_python(value))
+# Validates value (ORM objects, dicts, ...) as model_type and returns its JSON.
+
+def model_response(model_type, value, headers: dict = None, status_code: int = 200) -> Response:
+    return Response(
+        content=model_json(model_type, value),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+# Used by the endpoints returning large bodies (recipe lists). The endpoint
+# still declares response_model, which documents the schema in OpenAPI.
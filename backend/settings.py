@@ -0,0 +1,112 @@
+import os
+
+# Runtime settings, read from environment variables with sensible defaults.
+# Secrets (database password, JWT key) stay in keys.py.
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+def _bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+# -- Database engine -- (see database.py)
+DB_POOL_SIZE = _int("IRMS_DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _int("IRMS_DB_MAX_OVERFLOW", 10)
+# Connections kept open per worker, and extra ones allowed during bursts
+DB_POOL_TIMEOUT_SECONDS = _float("IRMS_DB_POOL_TIMEOUT_SECONDS", 30)
+# How long a request waits for a free connection before failing
+DB_POOL_RECYCLE_SECONDS = _int("IRMS_DB_POOL_RECYCLE_SECONDS", 1800)
+# Connections older than this are replaced, before a server or proxy drops them
+DB_POOL_PRE_PING = _bool("IRMS_DB_POOL_PRE_PING", True)
+# Tests each connection on checkout and transparently replaces dead ones
+DB_STATEMENT_TIMEOUT_MS = _int("IRMS_DB_STATEMENT_TIMEOUT_MS", 0)
+# PostgreSQL statement_timeout for every connection, 0 leaves it unset
+DB_INIT_ON_STARTUP = _bool("IRMS_DB_INIT_ON_STARTUP", False)
+# Apply pending schema migrations when the API starts, instead of running python -m backend.init_db
+
+# -- Read replicas -- (see replicas.py)
+DB_REPLICA_URLS = [u.strip() for u in os.getenv("IRMS_DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# Comma separated URLs of read replicas of the database; read-only endpoints use them in turn
+REPLICA_STICKY_SECONDS = _float("IRMS_REPLICA_STICKY_SECONDS", 5)
+# After a client writes, its reads go to the primary for this long, so it sees its own changes
+REPLICA_RETRY_SECONDS = _float("IRMS_REPLICA_RETRY_SECONDS", 30)
+# A replica that couldn't be connected to is skipped for this long
+
+# -- Recipe cache -- (see cache.py)
+CACHE_BACKEND = os.getenv("IRMS_CACHE_BACKEND", "memory")
+# "memory" for an in-process LRU, "redis" for a shared Redis-compatible store
+CACHE_MAX_ENTRIES = _int("IRMS_CACHE_MAX_ENTRIES", 10_000)
+CACHE_TTL_SECONDS = _float("IRMS_CACHE_TTL_SECONDS", 300)
+REDIS_URL = os.getenv("IRMS_REDIS_URL", "")
+# Left empty (or without the redis package installed) the "redis" backend
+# uses LocalRedis, an in-process stand-in with the same interface.
+
+# -- Change feed -- (see change_feed.py)
+CHANGES_BACKEND = os.getenv("IRMS_CHANGES_BACKEND", "memory")
+# "memory" numbers changes per worker, "redis" shares them between workers over pub/sub (IRMS_REDIS_URL)
+CHANGES_BUFFER = _int("IRMS_CHANGES_BUFFER", 1000)
+# Recent changes kept for clients resuming the feed; clients further behind reload their list
+CHANGES_KEEPALIVE_SECONDS = _float("IRMS_CHANGES_KEEPALIVE_SECONDS", 15)
+# An idle feed gets a comment line this often, so proxies don't close the connection
+
+# -- Authentication -- (see auth_cache.py, password_pool.py)
+TOKEN_CACHE_MAX_ENTRIES = _int("IRMS_TOKEN_CACHE_MAX_ENTRIES", 10_000)
+# Verified tokens kept per worker, 0 disables the cache
+TOKEN_CACHE_TTL_SECONDS = _int("IRMS_TOKEN_CACHE_TTL_SECONDS", 60)
+# How long a cached token is trusted before its user is loaded from the database again
+BCRYPT_ROUNDS = _int("IRMS_BCRYPT_ROUNDS", 12)
+# bcrypt cost factor for new hashes; stored hashes with another cost are rehashed on login
+API_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+# API worker processes on this machine; uvicorn and gunicorn read the same variable for --workers
+PASSWORD_WORKERS = _int("IRMS_PASSWORD_WORKERS", max(1, (os.cpu_count() or 1) // API_WORKERS))
+# Processes hashing passwords per API worker, 0 hashes in the thread pool instead.
+# The default shares the cores between the API workers rather than giving each all of them
+PASSWORD_MAX_PENDING = _int("IRMS_PASSWORD_MAX_PENDING", 64)
+# Hash/verify jobs allowed in flight or queued before sign-ins are turned away with 503
+
+# -- Audit log writer -- (see audit_log.py)
+LOG_QUEUE_SIZE = _int("IRMS_LOG_QUEUE_SIZE", 10_000)
+LOG_BATCH_SIZE = _int("IRMS_LOG_BATCH_SIZE", 500)
+LOG_FLUSH_INTERVAL_SECONDS = _float("IRMS_LOG_FLUSH_INTERVAL_SECONDS", 0.5)
+LOG_FSYNC_INTERVAL_SECONDS = _float("IRMS_LOG_FSYNC_INTERVAL_SECONDS", 2.0)
+LOG_MAX_BYTES = _int("IRMS_LOG_MAX_BYTES", 50 * 1024 * 1024)
+LOG_BACKUP_COUNT = _int("IRMS_LOG_BACKUP_COUNT", 5)
+# Rotation of the audit log; the saved recipes archive is never rotated (see RecipeBook.py)
+
+# -- Bulk import/export -- (see bulk.py)
+BULK_BATCH_SIZE = _int("IRMS_BULK_BATCH_SIZE", 1000)
+# Recipes per transaction on import, and per partition on export
+
+# -- Image uploads -- (see images.py)
+IMAGE_DIR = os.getenv("IRMS_IMAGE_DIR", "backend/media")
+# Uploaded images and their variants, served under /media
+IMAGE_MAX_BYTES = _int("IRMS_IMAGE_MAX_BYTES", 10 * 1024 * 1024)
+IMAGE_WIDTHS = [int(w) for w in os.getenv("IRMS_IMAGE_WIDTHS", "320,960").split(",") if w.strip()]
+# Widths of the WebP variants made for every upload; the smallest is the card thumbnail
+IMAGE_WORKERS = _int("IRMS_IMAGE_WORKERS", 1)
+IMAGE_MAX_PENDING = _int("IRMS_IMAGE_MAX_PENDING", 16)
+# Processes resizing images per API worker (0 uses the thread pool), and the uploads
+# allowed in flight before new ones are turned away with 503
+
+# -- Responses -- (see compression.py)
+COMPRESSION = _bool("IRMS_COMPRESSION", True)
+COMPRESSION_MIN_BYTES = _int("IRMS_COMPRESSION_MIN_BYTES", 1024)
+# Smaller responses are sent uncompressed
+GZIP_LEVEL = _int("IRMS_GZIP_LEVEL", 6)
+BROTLI_QUALITY = _int("IRMS_BROTLI_QUALITY", 4)
+# Lower is faster, higher is smaller; Brotli is only used with brotli-asgi installed
+
+# -- Instrumentation -- (see metrics.py, profiling.py)
+PROFILING = _bool("IRMS_PROFILING", False)
+# Answer requests sent with "X-Profile: 1" with a profile of the request. Debugging only.
+
+# -- Similar recipes -- (see similarity.py)
+SIMILAR_INDEX_DIR = os.getenv("IRMS_SIMILAR_INDEX_DIR", "backend/similarity_index")
+# Where the feature matrix is saved; workers memory-map it from there
+SIMILAR_FEATURE_BITS = _int("IRMS_SIMILAR_FEATURE_BITS", 18)
+# Features are hashed into 2**bits columns
+SIMILAR_COMPACT_AFTER = _int("IRMS_SIMILAR_COMPACT_AFTER", 200)
+# Recipes changed by a worker before it folds its changes into a new saved matrix
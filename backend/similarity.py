@@ -0,0 +1,340 @@
+import asyncio
+import math
+import os
+import shutil
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from backend import settings
+from backend.database import Recipe, Ingredient
+from backend.pantry import normalize_ingredient
+from backend.search import tokenize
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# "More like this": recipes most similar to a given one.
+#
+# Every recipe is a sparse vector in three blocks of hashed features:
+#   text        - TF-IDF of the words of its search document (name,
+#                 description, steps, ingredients), sublinear term frequency
+#   ingredients - IDF of each distinct (normalised) ingredient
+#   cook time   - a half-octave bucket of cook_time_min, and its neighbours at half weight
+# Feature names are hashed (crc32) into 2**IRMS_SIMILAR_FEATURE_BITS columns,
+# so there is no vocabulary to store or keep in sync between processes. Each
+# block is L2-normalised and scaled by the square root of its weight in
+# BLOCK_WEIGHTS, making a dot product of two vectors the weighted sum of the
+# three cosine similarities.
+#
+# The vectors form a CSR matrix (indptr / indices / data, plus the recipe_id of
+# every row and the IDF table) saved as .npy files under IRMS_SIMILAR_INDEX_DIR
+# and opened memory-mapped: every worker shares the same pages of the OS file
+# cache and starts answering without rebuilding anything. Scoring one recipe
+# against all of them is one pass over the matrix (multiply by the query
+# vector, sum each row with np.add.reduceat) and an np.argpartition.
+#
+# Recipes a worker creates, updates or deletes are kept in an in-memory
+# overlay on top of the saved matrix, vectorised with the saved IDF table.
+# Once the overlay is large enough it is folded into a new saved matrix,
+# under a file lock so workers don't overwrite each other; other workers
+# notice the new generation and map it. IDF values only change on a full
+# rebuild (python -m backend.init_db, or python -m backend.similarity).
+#
+# similar_recipes() only reads rows through the session; building the
+# matrix, mapping it and scoring run on a thread, off the event loop.
+
+TEXT, INGREDIENTS, COOK_TIME = 0, 1, 2
+BLOCK_WEIGHTS = np.sqrt(np.array([0.5, 0.4, 0.1], dtype=np.float32))
+# Share of the similarity given to text, ingredients and cook time
+
+_ARRAYS = ("recipe_ids", "indptr", "indices", "data", "idf")
+
+def _hash(feature: str, bits: int) -> int:
+    return zlib.crc32(feature.encode()) & ((1 << bits) - 1)
+# crc32 rather than hash(): the same in every process and across restarts.
+
+def raw_features(document: str, ingredient_names, cook_time_min: Optional[int], bits: int) -> list[tuple]:
+    counts = {}
+    for token in tokenize(document):
+        counts[token] = counts.get(token, 0) + 1
+    features = [(TEXT, _hash("w:" + term, bits), 1.0 + math.log(tf)) for term, tf in counts.items()]
+    names = {normalize_ingredient(n) for n in ingredient_names} - {""}
+    features += [(INGREDIENTS, _hash("i:" + name, bits), 1.0) for name in names]
+    if cook_time_min:
+        bucket = round(2 * math.log2(cook_time_min + 1))
+        features += [(COOK_TIME, _hash(f"t:{bucket + d}", bits), 1.0 if d == 0 else 0.5) for d in (-1, 0, 1)]
+    return features
+# (block, column, weight before IDF and normalisation) of one recipe.
+
+def weigh(raw_rows: list[list[tuple]], idf: np.ndarray):
+    counts = np.fromiter((len(r) for r in raw_rows), dtype=np.int64, count=len(raw_rows))
+    indptr = np.zeros(len(raw_rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    flat = [feature for row in raw_rows for feature in row]
+    blocks = np.fromiter((f[0] for f in flat), dtype=np.int64, count=len(flat))
+    indices = np.fromiter((f[1] for f in flat), dtype=np.int32, count=len(flat))
+    values = np.fromiter((f[2] for f in flat), dtype=np.float32, count=len(flat))
+
+    weighted = values * np.where(blocks == COOK_TIME, np.float32(1.0), idf[indices])
+    key = np.repeat(np.arange(len(raw_rows)), counts) * 3 + blocks
+    norms = np.sqrt(np.bincount(key, weights=weighted ** 2, minlength=3 * len(raw_rows)))
+    data = (weighted / norms[key] * BLOCK_WEIGHTS[blocks]).astype(np.float32)
+    return indptr, indices, data
+# Turns raw features into CSR rows, all recipes at once: IDF, the norm of
+# every (recipe, block) from one bincount, normalisation and block weights.
+
+def compute_idf(raw_rows: list[list[tuple]], bits: int) -> np.ndarray:
+    columns = [np.unique(np.fromiter((f[1] for f in row), dtype=np.int64, count=len(row))) for row in raw_rows]
+    df = np.bincount(np.concatenate(columns) if columns else np.zeros(0, np.int64), minlength=1 << bits)
+    return (np.log((1 + len(raw_rows)) / (1 + df)) + 1).astype(np.float32)
+# Smoothed IDF of every column. Columns no recipe has get the highest value.
+
+@contextmanager
+def _file_lock(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "lock"), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+# Serialises writers of the saved matrix across worker processes (not on Windows).
+
+
+class SimilarityIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._base = None         # name -> array, memory-mapped
+        self._generation = None   # (generation directory, CURRENT mtime) of the mapped matrix
+        self._overlay = {}        # recipe_id -> (indices, data), None once deleted
+
+    @property
+    def loaded(self) -> bool:
+        return self._base is not None
+
+    def _map(self) -> bool:
+        path = os.path.join(self.directory, "CURRENT")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if self._generation is not None and self._generation[1] == mtime:
+                return True
+            with open(path) as f:
+                current = (f.read().strip(), mtime)
+        except FileNotFoundError:
+            return False
+        folder = os.path.join(self.directory, current[0])
+        base = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        order = np.argsort(base["recipe_ids"], kind="stable")
+        base["order"], base["sorted_ids"] = order, base["recipe_ids"][order]
+        base["lengths"] = np.diff(base["indptr"])
+        base["bits"] = len(base["idf"]).bit_length() - 1
+        self._base, self._generation = base, current
+        return True
+    # Maps the latest saved matrix if it changed since the last call. Cheap when
+    # it hasn't: one stat. The overlay is kept, it applies to any generation.
+
+    def _write(self, recipe_ids, indptr, indices, data, idf):
+        generation = f"gen-{time.time_ns()}"
+        folder = os.path.join(self.directory, generation)
+        os.makedirs(folder)
+        arrays = dict(zip(_ARRAYS, (recipe_ids, indptr, indices, data, idf)))
+        for name, array in arrays.items():
+            np.save(os.path.join(folder, f"{name}.npy"), array)
+        tmp = os.path.join(self.directory, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(generation)
+        os.replace(tmp, os.path.join(self.directory, "CURRENT"))
+        # Readers switch to the new matrix only once it is complete
+
+        keep = {generation, self._generation[0] if self._generation else None}
+        for name in os.listdir(self.directory):
+            if name.startswith("gen-") and name not in keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        # The previous generation stays for workers that are about to map it;
+        # files already mapped remain readable after they are deleted.
+    # Call with the file lock held.
+
+    @staticmethod
+    def read(db: Session) -> tuple:
+        return (
+            db.query(Recipe.recipe_id, Recipe.search_document, Recipe.name, Recipe.description, Recipe.cook_time_min).all(),
+            db.query(Ingredient.recipe_id, Ingredient.name).all(),
+        )
+    # The database part of build(): two flat column queries, no ORM objects.
+
+    def load(self, rows: tuple) -> int:
+        recipe_rows, ingredient_rows = rows
+        recipes = {
+            recipe_id: [document or f"{name}\n{description or ''}", [], cook_time]
+            for recipe_id, document, name, description, cook_time in recipe_rows
+        }
+        for recipe_id, name in ingredient_rows:
+            if recipe_id in recipes:
+                recipes[recipe_id][1].append(name)
+
+        bits = settings.SIMILAR_FEATURE_BITS
+        recipe_ids = np.fromiter(recipes.keys(), dtype=np.int64, count=len(recipes))
+        raw_rows = [raw_features(document, names, cook_time, bits) for document, names, cook_time in recipes.values()]
+        idf = compute_idf(raw_rows, bits)
+        indptr, indices, data = weigh(raw_rows, idf)
+        with self._lock, _file_lock(self.directory):
+            self._write(recipe_ids, indptr, indices, data, idf)
+            self._overlay.clear()
+            self._map()
+        return len(recipe_ids)
+    # Builds and saves the matrix from the rows read(). Returns the number of recipes.
+
+    def build(self, db: Session) -> int:
+        return self.load(self.read(db))
+    # Rebuilds the matrix, with fresh IDF values, from the database. Returns the number of recipes.
+
+    def mapped(self) -> bool:
+        with self._lock:
+            return self._map()
+    # Maps the latest saved matrix; False if there is none yet.
+
+    def _compact(self):
+        with _file_lock(self.directory):
+            self._map()
+            base = self._base
+            changed = np.fromiter(self._overlay.keys(), dtype=np.int64, count=len(self._overlay))
+            keep = ~np.isin(base["recipe_ids"], changed)
+            kept_nnz = np.repeat(keep, base["lengths"])
+            added = [(rid, row) for rid, row in self._overlay.items() if row is not None]
+
+            lengths = np.concatenate([base["lengths"][keep], [len(row[0]) for _, row in added]]).astype(np.int64)
+            indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            self._write(
+                np.concatenate([base["recipe_ids"][keep], [rid for rid, _ in added]]).astype(np.int64),
+                indptr,
+                np.concatenate([base["indices"][kept_nnz]] + [row[0] for _, row in added]).astype(np.int32),
+                np.concatenate([base["data"][kept_nnz]] + [row[1] for _, row in added]).astype(np.float32),
+                base["idf"],
+            )
+            self._overlay.clear()
+            self._map()
+    # Folds the overlay into a new saved matrix: the rows of changed recipes
+    # are dropped and their new vectors appended. Based on the latest saved
+    # matrix, so changes folded in by other workers are kept.
+
+    def _changed(self, recipe_id: int, row):
+        self._overlay[recipe_id] = row
+        if len(self._overlay) >= max(settings.SIMILAR_COMPACT_AFTER, len(self._base["recipe_ids"]) // 10):
+            self._compact()
+    # Compacting once the overlay reaches 10% of the matrix keeps bulk imports linear.
+
+    def add(self, recipe_id: int, document: str, ingredient_names, cook_time_min: Optional[int]):
+        with self._lock:
+            if not self._map():
+                return
+            idf = self._base["idf"]
+            _, indices, data = weigh([raw_features(document, ingredient_names, cook_time_min, self._base["bits"])], idf)
+            self._changed(recipe_id, (indices, data))
+
+    def remove(self, recipe_id: int):
+        with self._lock:
+            if self._map():
+                self._changed(recipe_id, None)
+    # Without a saved matrix there is nothing to update; it is built from the
+    # database, changes included, on the first query.
+
+    def flush(self):
+        with self._lock:
+            if self._overlay and self._map():
+                self._compact()
+    # Saves this worker's pending changes, at shutdown.
+
+    def _row(self, recipe_id: int):
+        if recipe_id in self._overlay:
+            return self._overlay[recipe_id]
+        base = self._base
+        position = np.searchsorted(base["sorted_ids"], recipe_id)
+        if position == len(base["sorted_ids"]) or base["sorted_ids"][position] != recipe_id:
+            return None
+        row = base["order"][position]
+        start, end = base["indptr"][row], base["indptr"][row + 1]
+        return base["indices"][start:end], base["data"][start:end]
+
+    def similar(self, recipe_id: int, limit: int) -> Optional[list[tuple[int, float]]]:
+        with self._lock:
+            self._map()
+            query = self._row(recipe_id)
+            if query is None:
+                return None
+            base = self._base
+            dense = np.zeros(len(base["idf"]), dtype=np.float32)
+            np.add.at(dense, query[0], query[1])
+
+            scores = np.zeros(len(base["recipe_ids"]), dtype=np.float32)
+            if len(base["data"]):
+                products = base["data"] * dense[base["indices"]]
+                nonempty = base["lengths"] > 0
+                scores[nonempty] = np.add.reduceat(products, base["indptr"][:-1][nonempty])
+            # Every saved recipe scored in one pass over the matrix
+            ids = base["recipe_ids"]
+
+            if self._overlay:
+                scores[np.isin(ids, np.fromiter(self._overlay.keys(), dtype=np.int64))] = 0
+                added = [(rid, row) for rid, row in self._overlay.items() if row is not None]
+                if added:
+                    lengths = [len(row[0]) for _, row in added]
+                    products = np.concatenate([row[1] for _, row in added]) * dense[np.concatenate([row[0] for _, row in added])]
+                    overlay_scores = np.bincount(np.repeat(np.arange(len(added)), lengths), weights=products, minlength=len(added))
+                    ids = np.concatenate([ids, [rid for rid, _ in added]])
+                    scores = np.concatenate([scores, overlay_scores.astype(np.float32)])
+            # Changed recipes are scored from their overlay vectors instead
+
+            scores[ids == recipe_id] = 0
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > limit:
+                hits = hits[np.argpartition(-scores[hits], limit)[:limit]]
+            hits = hits[np.lexsort((-ids[hits], -scores[hits]))]
+            return [(int(ids[i]), float(scores[i])) for i in hits]
+    # Up to `limit` (recipe_id, similarity) pairs, most similar first; None if
+    # the recipe isn't in the index.
+
+similarity_index = SimilarityIndex(settings.SIMILAR_INDEX_DIR)
+
+
+def _read_recipe(db: Session, recipe_id: int) -> Optional[tuple]:
+    row = db.query(Recipe.search_document, Recipe.name, Recipe.description, Recipe.cook_time_min) \
+        .filter(Recipe.recipe_id == recipe_id).first()
+    if row is None:
+        return None
+    names = [name for (name,) in db.query(Ingredient.name).filter(Ingredient.recipe_id == recipe_id)]
+    return recipe_id, row.search_document or f"{row.name}\n{row.description or ''}", names, row.cook_time_min
+# Arguments of similarity_index.add() for one recipe, None if it doesn't exist.
+
+async def similar_recipes(db: AsyncSession, recipe_id: int, limit: int) -> Optional[list[tuple[int, float]]]:
+    if not await asyncio.to_thread(similarity_index.mapped):
+        await asyncio.to_thread(similarity_index.load, await db.run_sync(similarity_index.read))
+    hits = await asyncio.to_thread(similarity_index.similar, recipe_id, limit)
+    if hits is None:
+        recipe = await db.run_sync(_read_recipe, recipe_id)
+        if recipe is None:
+            return None
+        await asyncio.to_thread(similarity_index.add, *recipe)
+        hits = await asyncio.to_thread(similarity_index.similar, recipe_id, limit)
+    return hits
+# A recipe saved by another worker since the matrix was written isn't in this
+# worker's index yet: it is read from the database and added. Building the
+# matrix, mapping it and scoring run on a thread, so they don't hold up other requests.
+
+def recipe_saved(recipe_id: int, document: str, ingredient_names: list[str], cook_time_min: Optional[int]):
+    similarity_index.add(recipe_id, document, ingredient_names, cook_time_min)
+
+def recipe_deleted(recipe_id: int):
+    similarity_index.remove(recipe_id)
+
+
+if __name__ == "__main__":
+    from backend.database import SessionLocal
+    with SessionLocal() as db:
+        print(f"Indexed {similarity_index.build(db)} recipes in {settings.SIMILAR_INDEX_DIR}")
@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
+from html import escape
 
 class StepBase(ABC):
+    __slots__ = ("step_number", "instruction", "img_path")
+
     def __init__(self, step_number, instruction, img_path=None):
         self.step_number = step_number
         self.instruction = instruction
@@ -12,20 +15,33 @@ class StepBase(ABC):
 # Base class for steps.
 # Each class must implement a render() method which will return a HTML string.
 # This is the polymorphic parent class of the other step classes below.
+# __slots__ (here and in the subclasses) leaves out the per-object __dict__,
+# so the objects for a recipe with hundreds of steps are small and quick to build.
+# Instructions and image paths are user input: they're HTML escaped when rendered.
 
 class TextStep(StepBase):
+    __slots__ = ()
+
     def render(self) -> str:
-        return f"<p>{self.step_number}. {self.instruction}</p>"
+        return f"<p>{self.step_number}. {escape(self.instruction or '')}</p>"
 # For steps that only include text instructions and no images.
 
 class ImageStep(StepBase):
+    __slots__ = ()
+
     def render(self) -> str:
         return (
             f"<div>"
-            f"<p>{self.step_number}. {self.instruction}</p>"
-            f"<img src='{self.img_path}' alt='Step image' style='width:100%; border-radius:6px;' />"
+            f"<p>{self.step_number}. {escape(self.instruction or '')}</p>"
+            f"<img src='{escape(self.img_path)}' alt='Step image' style='width:100%; border-radius:6px;' />"
             f"</div>"
         )
 # For steps that include images.
 # Renders the instruction followed by an embedded image.
-# The image will stretch to fit the container's width.
\ No newline at end of file
+# The image will stretch to fit the container's width.
+
+def step_for(step_number, instruction, img_path=None) -> StepBase:
+    if img_path:
+        return ImageStep(step_number, instruction, img_path)
+    return TextStep(step_number, instruction)
+# Picks the step class: steps with an img_path are rendered with their image.
@@ -0,0 +1,75 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# CPU-bound work off the request path.
+#
+# Jobs run in a dedicated pool of worker processes: requests await the result
+# without holding the event loop or a threadpool thread, and a burst of
+# requests can only ever use as many cores as there are workers.
+#
+# Admission control: at most max_pending jobs may be running or queued at
+# once. Beyond that new jobs are rejected with PoolBusy straight away (the API
+# answers 503 with Retry-After) instead of queueing without bound and timing
+# out every caller.
+
+class PoolBusy(Exception):
+    pass
+# Raised when max_pending jobs are already in flight, with the message for the client.
+
+class WorkerPool:
+    busy_detail = "Too many requests in progress, please try again shortly"
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+            # run_in_executor(None, ...): the event loop's default thread pool
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+    # Worker processes are spawned rather than forked, so they don't inherit
+    # the API's threads and locks. Started on first use.
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy(self.busy_detail)
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+    # fn must be a module-level function, it's pickled to reach the worker.
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -12,6 +12,10 @@ const state = reactive({
 axios.defaults.baseURL = 'http://localhost:8000'
 // Sets FastAPI as the default URL endpoint for axios requests
 
+axios.defaults.withCredentials = true
+// Sends the API's cookies back to it, so reads right after saving a recipe
+// see the change when the API reads from replicas
+
 axios.interceptors.request.use(config => {
   if (state.token) config.headers.Authorization = `Bearer ${state.token}`
   return config
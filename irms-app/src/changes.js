@@ -0,0 +1,14 @@
+import axios from 'axios'
+
+export function watchRecipeChanges({ onChange, onReset }) {
+  const source = new EventSource(`${axios.defaults.baseURL}/recipes/changes`)
+  source.addEventListener('change', event => onChange(JSON.parse(event.data)))
+  source.addEventListener('reset', () => onReset())
+  return () => source.close()
+}
+// Streams recipe changes from the API ("created", "updated", "deleted" or
+// "imported", see GET /recipes/changes) so a list can be kept up to date
+// without fetching it again. The browser reconnects by itself and the API
+// resumes after the last change received; onReset is called when changes
+// were missed and the list has to be reloaded.
+// Returns a function that stops watching.
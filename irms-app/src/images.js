@@ -0,0 +1,13 @@
+import axios from 'axios'
+
+export async function uploadImage(file) {
+  const form = new FormData()
+  form.append('file', file)
+  const { data } = await axios.post('/images', form, {
+    headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+  })
+  return data.url
+}
+// Uploads an image file to the API and returns its URL, which is stored as the img_path.
+// Images are stored once on the server (named after their contents) instead of
+// being sent inline as base64 with every recipe.